@@ -1,19 +1,171 @@
-from flask import Flask, jsonify, request
+from flask import Flask, g, jsonify, request, send_file
 from flask_cors import CORS
 import sqlite3
 import requests
 import logging
 import os
+import time
+import hmac
 from dotenv import load_dotenv
+from json_provider import FastJSONProvider, RowList
+from compression import Compressor, if_none_match
+from logging_setup import configure_logging
+from profiler import RequestProfiler
+from scheduler import PeriodicTask
+from leaderboard import DIMENSIONS, Leaderboard
+from player_values import (LINEUP_AGGREGATE_COLUMNS, LINEUP_AGGREGATE_VALUES, LINEUP_METRICS, TYPED_COLUMNS,
+                           today_day, typed_values)
+import solver
+from recommender import SimilarityIndex
+from catalogue import CATEGORICAL, NUMERIC, Catalogue, Equals, NameContains, Range
+from images import ImageError, ImageProxy, allowed as image_allowed, image_key
+from pool import ConnectionPool
+from player_cache import PlayerCache
+from export import EXPORTS, FORMATS, stream as stream_export
+import backup
+import replica
+import maintenance
+from sqltrace import TRACER, TracedConnection
+from metrics import (REGISTRY, REQUEST_DURATION, REQUESTS, SQL_DURATION, UPSTREAM_DURATION,
+                     UPSTREAM_ERRORS, CACHE_REQUESTS, ORPHAN_PLAYERS_SWEPT, REPLICA_STALENESS,
+                     DATABASE_SIZE, DATABASE_FREELIST)
 
-# Set up logging configuration
-logging.basicConfig(level=logging.DEBUG)
+load_dotenv()
+
+# Set up logging configuration (queue-based, see logging_setup.py)
+configure_logging()
+logger = logging.getLogger('app')
+
+# Path of the SQLite database file
+DATABASE = os.getenv('DATABASE_PATH', 'database.db')
+
+# Upstream services
+SPARQL_ENDPOINT = os.getenv('SPARQL_ENDPOINT', 'http://127.0.0.1:7200/repositories/kd_repo_project')
+NEWS_API_URL = os.getenv('NEWS_API_URL', 'https://footballnewsapi.netlify.app/.netlify/functions/api/news/espn')
+
+# Players nobody favorites any more are deleted by a background sweeper after a grace period
+ORPHAN_SWEEP_INTERVAL = float(os.getenv('ORPHAN_SWEEP_INTERVAL', 300))
+ORPHAN_GRACE_PERIOD = int(os.getenv('ORPHAN_GRACE_PERIOD', 3600))
+ORPHAN_SWEEP_BATCH = int(os.getenv('ORPHAN_SWEEP_BATCH', 500))
+
+# Scheduled online backups into rotated snapshots (see backup.py); an interval of 0 disables them
+BACKUP_INTERVAL = float(os.getenv('BACKUP_INTERVAL', 24 * 3600))
+BACKUP_DIR = os.getenv('BACKUP_DIR', os.path.join(os.path.dirname(os.path.abspath(DATABASE)), 'backups'))
+BACKUP_KEEP = int(os.getenv('BACKUP_KEEP', 7))
+BACKUP_STEP_PAGES = int(os.getenv('BACKUP_STEP_PAGES', 4096))
+BACKUP_STEP_SLEEP = float(os.getenv('BACKUP_STEP_SLEEP', 0.01))
+
+# Read-only replica for heavy reads (see replica.py): leaderboards and exports read a copy of the
+# database at most REPLICA_MAX_STALENESS seconds old, refreshed every REPLICA_REFRESH_INTERVAL; 0 disables it
+REPLICA_PATH = os.getenv('REPLICA_PATH', replica.default_path(DATABASE))
+REPLICA_MAX_STALENESS = float(os.getenv('REPLICA_MAX_STALENESS', 0))
+REPLICA_REFRESH_INTERVAL = float(os.getenv('REPLICA_REFRESH_INTERVAL', REPLICA_MAX_STALENESS / 2))
+
+# Routine database maintenance (see maintenance.py), at most every MAINTENANCE_INTERVAL seconds (0 disables it).
+# Every MAINTENANCE_CHECK_INTERVAL a worker runs it if it served at most MAINTENANCE_MAX_RATE requests per second
+# since the last check; a run takes at most MAINTENANCE_BUDGET seconds, one statement MAINTENANCE_STATEMENT_BUDGET
+MAINTENANCE_INTERVAL = float(os.getenv('MAINTENANCE_INTERVAL', 3600))
+MAINTENANCE_CHECK_INTERVAL = float(os.getenv('MAINTENANCE_CHECK_INTERVAL', 60))
+MAINTENANCE_MAX_RATE = float(os.getenv('MAINTENANCE_MAX_RATE', 1))
+MAINTENANCE_BUDGET = float(os.getenv('MAINTENANCE_BUDGET', 5))
+MAINTENANCE_STATEMENT_BUDGET = float(os.getenv('MAINTENANCE_STATEMENT_BUDGET', 0.1))
+
+# Players kept per leaderboard, and seconds a leaderboard snapshot is served before it is rebuilt
+LEADERBOARD_SIZE = int(os.getenv('LEADERBOARD_SIZE', 100))
+LEADERBOARD_TTL = float(os.getenv('LEADERBOARD_TTL', 10))
+
+# Memory-mapped feature matrix of the similar-player recommendations, and seconds between catalogue checks
+FEATURES_DIR = os.getenv('FEATURES_DIR', os.path.join(os.path.dirname(os.path.abspath(DATABASE)), 'features'))
+FEATURES_SYNC_TTL = float(os.getenv('FEATURES_SYNC_TTL', 5))
+# Seconds between prunings of the player change log (0 disables)
+CATALOGUE_PRUNE_INTERVAL = float(os.getenv('CATALOGUE_PRUNE_INTERVAL', 300))
+RECOMMENDATIONS_MAX = 100
+
+# Seconds before the in-memory search catalogue checks for player changes
+CATALOGUE_TTL = float(os.getenv('CATALOGUE_TTL', 30))
+SEARCH_MAX_LIMIT = 100
+# Parameters that switch /search from SPARQL to the local catalogue
+STRUCTURED_SEARCH_PARAMS = (*CATEGORICAL, *(f'{bound}_{attribute}' for attribute, _ in NUMERIC for bound in ('min', 'max')),
+                            'sort', 'order', 'offset', 'facets')
+
+# Content-addressed cache of the proxied player images (see images.py); hosts are comma-separated, empty proxies none
+IMAGES_DIR = os.getenv('IMAGES_DIR', os.path.join(os.path.dirname(os.path.abspath(DATABASE)), 'images'))
+IMAGE_HOSTS = [host.strip().lower() for host in os.getenv('IMAGE_HOSTS', '').split(',') if host.strip()]
+IMAGE_THUMBNAIL_SIZE = int(os.getenv('IMAGE_THUMBNAIL_SIZE', 128))
+IMAGE_MAX_BYTES = int(os.getenv('IMAGE_MAX_BYTES', 5_000_000))
+IMAGE_MAX_AGE = 365 * 24 * 3600
+# Also proxy hosts on loopback, private or link-local addresses, e.g. an image server on the local network
+IMAGE_ALLOW_PRIVATE = os.getenv('IMAGE_ALLOW_PRIVATE', '0') == '1'
+
+# Pooled connections for hot reads, and players kept in the read-through cache of lookups by ID
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 8))
+PLAYER_CACHE_SIZE = int(os.getenv('PLAYER_CACHE_SIZE', 10000))
+PLAYERS_MAX_IDS = 100
+
+# Columns of Players returned by the API (favorite_count and orphaned_at are internal)
+PLAYER_COLUMNS = ('player_id', 'name', 'position', 'team', 'market_value', 'nationality', 'height', 'img',
+                  'birthDate', 'wage', 'potential', 'rating', 'description', 'foot', 'source_uri')
+PLAYER_SELECT = ', '.join(f'Players.{column}' for column in PLAYER_COLUMNS)
+
+# Format of the serialized user documents (UserProfile, starting eleven responses); 2 added thumbnail links,
+# 3 the players' source_uri.
+# A new format moves every user to a new version and drops the stored documents (invalidate_user_documents()),
+# so they are rebuilt and cached ETags miss
+USER_DOCUMENT_FORMAT = 3
+
+# Statements slower than this are logged with their query plan
+TRACER.slow_threshold_ms = float(os.getenv('SLOW_QUERY_MS', 100))
 
 # Initialize Flask application
 app = Flask(__name__)
-CORS(app)
+app.json = FastJSONProvider(app)
+# max_age lets the browser cache CORS preflights instead of sending an OPTIONS before every JSON POST/DELETE
+CORS(app, max_age=int(os.getenv('CORS_MAX_AGE', 86400)))
 
-load_dotenv()
+@app.before_request
+def start_request_timer():
+    """
+    Record the start time of the request for the latency metrics.
+    """
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    """
+    Record the latency and status code of the request, including the time
+    spent in the other after_request hooks (e.g. compression).
+    """
+    start = g.pop('request_start', None)
+    if start is not None:
+        endpoint = request.endpoint or 'unmatched'
+        REQUEST_DURATION.observe(time.perf_counter() - start, endpoint, request.method)
+        REQUESTS.inc(endpoint, request.method, response.status_code)
+    return response
+
+# Opt-in cProfile of single requests; registers no hooks unless configured
+RequestProfiler(
+    app,
+    secret=os.getenv('PROFILE_SECRET'),
+    sample_rate=float(os.getenv('PROFILE_SAMPLE_RATE', 0)),
+    directory=os.getenv('PROFILE_DIR', 'profiles'),
+    keep=int(os.getenv('PROFILE_KEEP', 50)),
+)
+
+compressor = Compressor(
+    app,
+    min_size=int(os.getenv('COMPRESS_MIN_SIZE', 1024)),
+    cacheable_endpoints={'get_latest_news', 'get_players', 'get_user_profile'},
+)
+
+@app.route('/metrics')
+def get_metrics():
+    """
+    Expose the metrics of this process in the Prometheus text format.
+    
+    Returns:
+        text/plain: Histograms and counters for endpoints, SQL statements, upstream calls and caches.
+    """
+    return app.response_class(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/')
 def hello_world():
@@ -24,23 +176,134 @@ def hello_world():
     return 'Hello, World!'
 
 
-def get_db_connection():
+def get_db_connection(check_same_thread=True):
     """
     Establish a connection to the SQLite database.
     Set the row factory to sqlite3.Row to access columns by name.
+    Every statement run on the connection is timed by sqltrace.
+    Args:
+        check_same_thread (bool): False for connections shared across threads, e.g. pooled ones.
     Returns:
         sqlite3.Connection: A connection object to interact with the database.
     """
-    conn = sqlite3.connect('database.db', timeout=30)
+    with SQL_DURATION.time('connect'):
+        conn = sqlite3.connect(DATABASE, timeout=30, factory=TracedConnection, check_same_thread=check_same_thread)
     conn.row_factory = sqlite3.Row
     return conn
 
+def ensure_column(cursor, table, column, definition):
+    """
+    Add a column to an existing table if it is missing.
+    
+    Args:
+        cursor (sqlite3.Cursor): The cursor to run the migration on.
+        table (str): The table name.
+        column (str): The column name.
+        definition (str): The column type and constraints.
+    
+    Returns:
+        bool: True if the column was added.
+    """
+    cursor.execute(f'PRAGMA table_info({table})')
+    if any(row[1] == column for row in cursor.fetchall()):
+        return False
+    cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+    return True
+
+def recount_favorites(cursor):
+    """
+    Recompute favorite_count and orphaned_at of every player from UserPlayers,
+    e.g. after adding the columns or after a bulk load with the triggers dropped.
+    
+    Args:
+        cursor (sqlite3.Cursor): The cursor to run the update on.
+    """
+    cursor.execute('''
+        UPDATE Players SET favorite_count = (
+            SELECT COUNT(*) FROM UserPlayers WHERE UserPlayers.player_id = Players.player_id
+        )
+    ''')
+    cursor.execute('''
+        UPDATE Players SET orphaned_at = CASE
+            WHEN favorite_count = 0 THEN COALESCE(orphaned_at, CAST(strftime('%s', 'now') AS INTEGER))
+        END
+    ''')
+    cursor.execute('DELETE FROM FavoriteCounts')
+    for dimension in DIMENSIONS:
+        cursor.execute(f'''
+            INSERT INTO FavoriteCounts (dimension, value, favorites)
+            SELECT '{dimension}', COALESCE({dimension}, 'Unknown'), SUM(favorite_count)
+            FROM Players GROUP BY COALESCE({dimension}, 'Unknown') HAVING SUM(favorite_count) > 0
+        ''')
+
+def backfill_player_values(conn):
+    """
+    Compute the typed value columns of every player from the text columns,
+    e.g. after adding the columns or after a bulk load.
+    
+    Args:
+        conn (sqlite3.Connection): The connection to run the update on.
+    """
+    for _, _, parser in TYPED_COLUMNS:
+        conn.create_function(parser.__name__, 1, parser, deterministic=True)
+    assignments = ', '.join(f'{column} = {parser.__name__}({source})' for column, source, parser in TYPED_COLUMNS)
+    conn.execute(f'UPDATE Players SET {assignments}')
+
+def register_player_images(conn):
+    """
+    Register the image of every player on an allowed host (IMAGE_HOSTS)
+    with the image proxy, e.g. after creating Images or after a bulk load.
+    
+    Args:
+        conn (sqlite3.Connection): The connection to run the insert on.
+    """
+    conn.create_function('image_key', 1, image_key, deterministic=True)
+    conn.create_function('image_allowed', 1, lambda url: image_allowed(url, IMAGE_HOSTS), deterministic=True)
+    conn.execute('''
+        INSERT OR IGNORE INTO Images (image_key, url)
+        SELECT image_key(img), img FROM Players WHERE image_allowed(img)
+    ''')
+
+def invalidate_user_documents(cursor):
+    """
+    Move every user to a new version and drop the stored UserProfile
+    documents, e.g. after a change of what they contain. Cached ETags miss
+    and the documents are rebuilt from the joins on their next read.
+    
+    Args:
+        cursor (sqlite3.Cursor): The cursor to run the update on.
+    """
+    cursor.execute('''
+        INSERT INTO UserVersions (user_id, version) SELECT user_id, 1 FROM Users WHERE true
+        ON CONFLICT(user_id) DO UPDATE SET version = version + 1
+    ''')
+    cursor.execute('DELETE FROM UserProfile')
+
+def recompute_lineup_aggregates(cursor):
+    """
+    Rebuild LineupAggregates from StartingEleven, e.g. after creating the
+    table or after a bulk load.
+    
+    Args:
+        cursor (sqlite3.Cursor): The cursor to run the rebuild on.
+    """
+    cursor.execute('DELETE FROM LineupAggregates')
+    cursor.execute(f'''
+        INSERT INTO LineupAggregates (user_id, players, {LINEUP_AGGREGATE_COLUMNS})
+        SELECT StartingEleven.user_id, COUNT(*), {LINEUP_AGGREGATE_VALUES}
+        FROM StartingEleven
+        JOIN Players ON Players.player_id = StartingEleven.player_id
+        GROUP BY StartingEleven.user_id
+    ''')
+
 def init_db():
     """
     Initializes the database by creating necessary tables if they do not exist.
     """
     with get_db_connection() as conn:
         cursor = conn.cursor()
+        # Lets maintenance.py return free pages to the file system; only takes effect in a new database
+        cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
         
         # Create Users table
         cursor.execute('''
@@ -70,7 +333,16 @@ def init_db():
     potential VARCHAR(50),                    
     rating VARCHAR(50),                       
     description TEXT,                         
-    foot VARCHAR(20)                          
+    foot VARCHAR(20),                         
+    source_uri TEXT,                          -- Subject URI in the SPARQL source: the player's identity
+    favorite_count INTEGER NOT NULL DEFAULT 0,  -- Maintained by the UserPlayers triggers
+    orphaned_at INTEGER,                      -- Unix time favorite_count dropped to 0
+    rating_value INTEGER,                     -- Typed values parsed by player_values.py
+    potential_value INTEGER,
+    market_value_eur INTEGER,
+    wage_eur INTEGER,
+    height_cm INTEGER,
+    birth_day INTEGER                         -- Days since 1970-01-01
 
 
 
@@ -101,9 +373,208 @@ def init_db():
         );
         ''')
 
+        # Create UserVersions table (bumped on every write to a user's favorites or starting eleven)
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS UserVersions (
+            user_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY (user_id) REFERENCES Users(user_id) ON DELETE CASCADE
+        );
+        ''')
+
+        # Create UserProfile table (pre-serialized favorites and starting eleven per user)
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS UserProfile (
+            user_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL,
+            favorites BLOB NOT NULL,
+            starting_eleven BLOB NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES Users(user_id) ON DELETE CASCADE
+        );
+        ''')
+
+        # Reference count of each player, so unfavoriting does not have to count UserPlayers
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_userplayers_player ON UserPlayers(player_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_startingeleven_player ON StartingEleven(player_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_players_name ON Players(name)')
+        # Players are keyed on their source URI; players added without one (older rows, clients
+        # not sending it) have NULL and are matched on name, team and birth date instead
+        ensure_column(cursor, 'Players', 'source_uri', 'TEXT')
+        cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_players_source_uri ON Players(source_uri) WHERE source_uri IS NOT NULL
+        ''')
+        # Favorites per position, team and nationality, for the leaderboards
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'FavoriteCounts'")
+        counts_exist = cursor.fetchone() is not None
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS FavoriteCounts (
+            dimension TEXT NOT NULL,  -- 'position', 'team' or 'nationality'
+            value TEXT NOT NULL,
+            favorites INTEGER NOT NULL,
+            PRIMARY KEY (dimension, value)
+        ) WITHOUT ROWID;
+        ''')
+        ensure_column(cursor, 'Players', 'orphaned_at', 'INTEGER')
+        if ensure_column(cursor, 'Players', 'favorite_count', 'INTEGER NOT NULL DEFAULT 0') or not counts_exist:
+            recount_favorites(cursor)
+        if any([ensure_column(cursor, 'Players', column, 'INTEGER') for column, _, _ in TYPED_COLUMNS]):
+            backfill_player_values(conn)
+
+        # Per-user sums and counts of the typed values of the starting eleven
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'LineupAggregates'")
+        aggregates_exist = cursor.fetchone() is not None
+        cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS LineupAggregates (
+            user_id INTEGER PRIMARY KEY,
+            players INTEGER NOT NULL DEFAULT 0,
+            {', '.join(f'{metric}_count INTEGER NOT NULL DEFAULT 0, {metric}_sum INTEGER NOT NULL DEFAULT 0'
+                       for metric, _ in LINEUP_METRICS)},
+            FOREIGN KEY (user_id) REFERENCES Users(user_id) ON DELETE CASCADE
+        );
+        ''')
+        if not aggregates_exist:
+            recompute_lineup_aggregates(cursor)
+
+        # Source URL of the /img/<key> links and the content hash of the fetched image (see images.py)
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'Images'")
+        images_exist = cursor.fetchone() is not None
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS Images (
+            image_key TEXT PRIMARY KEY,
+            url TEXT NOT NULL,
+            content_hash TEXT,
+            content_type TEXT,
+            fetched_at INTEGER
+        ) WITHOUT ROWID;
+        ''')
+
+        # Identity of this database, so a feature matrix built from another one is never reused,
+        # and the row counts of the tables at their last ANALYZE (see maintenance.py)
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS Meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+        ''')
+        cursor.execute("INSERT OR IGNORE INTO Meta (key, value) VALUES ('catalogue_id', lower(hex(randomblob(16))))")
+        cursor.execute("SELECT value FROM Meta WHERE key = 'user_document_format'")
+        document_format = cursor.fetchone()
+        if document_format is None or int(document_format[0]) != USER_DOCUMENT_FORMAT:
+            invalidate_user_documents(cursor)
+            cursor.execute("INSERT OR REPLACE INTO Meta (key, value) VALUES ('user_document_format', ?)",
+                           (str(USER_DOCUMENT_FORMAT),))
+        # The proxied hosts decide which players have thumbnail links: when they change, the images
+        # of the players are registered again and the stored documents, whose links changed, rebuilt
+        image_hosts = ','.join(sorted(set(IMAGE_HOSTS)))
+        cursor.execute("SELECT value FROM Meta WHERE key = 'image_hosts'")
+        registered_hosts = cursor.fetchone()
+        if not images_exist or registered_hosts is None or registered_hosts[0] != image_hosts:
+            register_player_images(conn)
+            invalidate_user_documents(cursor)
+            cursor.execute("INSERT OR REPLACE INTO Meta (key, value) VALUES ('image_hosts', ?)", (image_hosts,))
+        # Log of player changes, read by the feature matrix and the player cache (see recommender.py)
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS CatalogueChanges (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            player_id INTEGER NOT NULL
+        );
+        ''')
+
+        cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_players_orphaned ON Players(orphaned_at) WHERE favorite_count = 0
+        ''')
+        # The overall leaderboard (leaderboard.py) reads the top of this index
+        cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_players_favorites ON Players(favorite_count DESC, player_id)
+        WHERE favorite_count > 0
+        ''')
+        # importer.py drops the two insert triggers during a bulk import and makes their updates itself
+        cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS userplayers_insert_count AFTER INSERT ON UserPlayers
+        BEGIN
+            UPDATE Players SET favorite_count = favorite_count + 1, orphaned_at = NULL
+            WHERE player_id = NEW.player_id;
+        END;
+        ''')
+        cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS userplayers_delete_count AFTER DELETE ON UserPlayers
+        BEGIN
+            UPDATE Players SET favorite_count = favorite_count - 1,
+                orphaned_at = CASE WHEN favorite_count = 1 THEN CAST(strftime('%s', 'now') AS INTEGER) END
+            WHERE player_id = OLD.player_id;
+        END;
+        ''')
+        cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS userplayers_insert_groups AFTER INSERT ON UserPlayers
+        BEGIN
+            INSERT INTO FavoriteCounts (dimension, value, favorites)
+            SELECT 'position', COALESCE(position, 'Unknown'), 1 FROM Players WHERE player_id = NEW.player_id
+            ON CONFLICT (dimension, value) DO UPDATE SET favorites = favorites + 1;
+            INSERT INTO FavoriteCounts (dimension, value, favorites)
+            SELECT 'team', COALESCE(team, 'Unknown'), 1 FROM Players WHERE player_id = NEW.player_id
+            ON CONFLICT (dimension, value) DO UPDATE SET favorites = favorites + 1;
+            INSERT INTO FavoriteCounts (dimension, value, favorites)
+            SELECT 'nationality', COALESCE(nationality, 'Unknown'), 1 FROM Players WHERE player_id = NEW.player_id
+            ON CONFLICT (dimension, value) DO UPDATE SET favorites = favorites + 1;
+        END;
+        ''')
+        cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS userplayers_delete_groups AFTER DELETE ON UserPlayers
+        BEGIN
+            UPDATE FavoriteCounts SET favorites = favorites - 1 WHERE dimension = 'position'
+                AND value = (SELECT COALESCE(position, 'Unknown') FROM Players WHERE player_id = OLD.player_id);
+            UPDATE FavoriteCounts SET favorites = favorites - 1 WHERE dimension = 'team'
+                AND value = (SELECT COALESCE(team, 'Unknown') FROM Players WHERE player_id = OLD.player_id);
+            UPDATE FavoriteCounts SET favorites = favorites - 1 WHERE dimension = 'nationality'
+                AND value = (SELECT COALESCE(nationality, 'Unknown') FROM Players WHERE player_id = OLD.player_id);
+        END;
+        ''')
+        cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS players_insert_catalogue AFTER INSERT ON Players
+        BEGIN
+            INSERT INTO CatalogueChanges (player_id) VALUES (NEW.player_id);
+        END;
+        ''')
+        cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS players_delete_catalogue AFTER DELETE ON Players
+        BEGIN
+            INSERT INTO CatalogueChanges (player_id) VALUES (OLD.player_id);
+        END;
+        ''')
+        # Logged columns: the features (recommender.py) and every column the player cache returns (player_cache.py).
+        # A trigger of an older version, logging fewer columns, is replaced
+        catalogue_columns = [*PLAYER_COLUMNS[1:], *(column for column, _, _ in TYPED_COLUMNS)]
+        cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = 'players_update_catalogue'")
+        row = cursor.fetchone()
+        if row is not None and not set(catalogue_columns) <= set(row[0].replace(',', ' ').split()):
+            cursor.execute('DROP TRIGGER players_update_catalogue')
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS players_update_catalogue AFTER UPDATE OF
+            {', '.join(catalogue_columns)}
+        ON Players
+        BEGIN
+            INSERT INTO CatalogueChanges (player_id) VALUES (NEW.player_id);
+        END;
+        ''')
+
 # Initialize the database
 init_db()
 
+def is_admin_request():
+    """
+    Check whether the current request may use the admin endpoints.
+    
+    If ADMIN_TOKEN is set, the request must send it in the X-Admin-Token
+    header. Otherwise only requests from localhost are allowed.
+    
+    Returns:
+        bool: True if the request is authorized.
+    """
+    token = os.getenv('ADMIN_TOKEN')
+    if token:
+        return hmac.compare_digest(request.headers.get('X-Admin-Token', ''), token)
+    return request.remote_addr in ('127.0.0.1', '::1')
+
 def get_user_id(username):
     """
     Retrieve the user ID based on the username.
@@ -116,23 +587,302 @@ def get_user_id(username):
     """
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('SELECT user_id FROM Users WHERE username = ?', (username,))
-    user = cursor.fetchone()
+    with SQL_DURATION.time('get_user_id'):
+        cursor.execute('SELECT user_id FROM Users WHERE username = ?', (username,))
+        user = cursor.fetchone()
     conn.close()
     if user:
         return user['user_id']
     return None
 
+def get_user_version(cursor, username):
+    """
+    Retrieve the user ID and the current data version of a user.
+    
+    Args:
+        cursor (sqlite3.Cursor): The cursor to run the lookup on.
+        username (str): The username of the user.
+    
+    Returns:
+        tuple or None: (user_id, version) if the user exists, None otherwise.
+    """
+    with SQL_DURATION.time('get_user_version'):
+        cursor.execute('''
+            SELECT Users.user_id, COALESCE(UserVersions.version, 0) AS version
+            FROM Users
+            LEFT JOIN UserVersions ON Users.user_id = UserVersions.user_id
+            WHERE Users.username = ?
+        ''', (username,))
+        user = cursor.fetchone()
+    if user:
+        return user['user_id'], user['version']
+    return None
+
+def bump_user_version(cursor, user_id):
+    """
+    Increment the data version of a user. Must be called inside the write
+    transaction that changes the user's favorites or starting eleven.
+    
+    Args:
+        cursor (sqlite3.Cursor): The cursor of the open write transaction.
+        user_id (int): The ID of the user.
+    """
+    with SQL_DURATION.time('bump_user_version'):
+        cursor.execute('''
+            INSERT INTO UserVersions (user_id, version) VALUES (?, 1)
+            ON CONFLICT(user_id) DO UPDATE SET version = version + 1
+        ''', (user_id,))
+
+def dump_json(obj):
+    """
+    Serialize an object to JSON bytes with the application's JSON provider.
+    
+    Args:
+        obj: The object to serialize.
+    
+    Returns:
+        bytes: The UTF-8 encoded JSON document.
+    """
+    return app.json.dumpb(obj)
+
+def serialize_favorites(cursor, user_id):
+    """
+    Serialize the favorite players of a user, as returned by get_user_players.
+    
+    Args:
+        cursor (sqlite3.Cursor): The cursor to run the join on.
+        user_id (int): The ID of the user.
+    
+    Returns:
+        bytes: A JSON array of player objects.
+    """
+    with SQL_DURATION.time('user_favorites'):
+        players = RowList.fetch(cursor, f'''
+            SELECT {PLAYER_SELECT}
+            FROM Players 
+            JOIN UserPlayers ON Players.player_id = UserPlayers.player_id 
+            WHERE UserPlayers.user_id = ?
+        ''', (user_id,))
+    return dump_json(players)
+
+def serialize_starting_eleven(cursor, user_id):
+    """
+    Serialize the starting eleven of a user, as returned by get_starting_eleven.
+    
+    Args:
+        cursor (sqlite3.Cursor): The cursor to run the join on.
+        user_id (int): The ID of the user.
+    
+    Returns:
+        bytes: A JSON array of {position, player_id, name, picture} objects.
+    """
+    with SQL_DURATION.time('user_starting_eleven'):
+        cursor.execute('''
+            SELECT StartingEleven.position, Players.player_id, Players.name, Players.img
+            FROM StartingEleven
+            JOIN Players ON StartingEleven.player_id = Players.player_id
+            WHERE StartingEleven.user_id = ?
+        ''', (user_id,))
+        starting_eleven = cursor.fetchall()
+    # Every link of the document must resolve, whenever the player was added
+    image_proxy.register(cursor, [row["img"] for row in starting_eleven])
+    return dump_json([{"position": row["position"], "player_id": row["player_id"], "name": row["name"], "picture": row["img"],
+                       "thumbnail": image_proxy.link(row["img"])} for row in starting_eleven])
+
+def lineup_delta(cursor, user_id, player_id, sign):
+    """
+    Add a player's typed values to, or subtract them from, the user's
+    LineupAggregates row. Must be called inside the write transaction that
+    changes the starting eleven.
+    
+    Args:
+        cursor (sqlite3.Cursor): The cursor of the open write transaction.
+        user_id (int): The ID of the user.
+        player_id (int): The player entering (sign 1) or leaving (sign -1) the lineup.
+        sign (int): 1 or -1.
+    """
+    values = ', '.join(f'({column} IS NOT NULL) * :sign, COALESCE({column}, 0) * :sign' for _, column in LINEUP_METRICS)
+    updates = ', '.join(f'{metric}_count = {metric}_count + excluded.{metric}_count, '
+                        f'{metric}_sum = {metric}_sum + excluded.{metric}_sum' for metric, _ in LINEUP_METRICS)
+    with SQL_DURATION.time('lineup_delta'):
+        cursor.execute(f'''
+            INSERT INTO LineupAggregates (user_id, players, {LINEUP_AGGREGATE_COLUMNS})
+            SELECT :user_id, :sign, {values} FROM Players WHERE player_id = :player_id
+            ON CONFLICT (user_id) DO UPDATE SET players = players + excluded.players, {updates}
+        ''', {'user_id': user_id, 'player_id': player_id, 'sign': sign})
+
+def refresh_user_profile(cursor, user_id, added_player_id=None, removed_player_id=None, favorites_changed=True):
+    """
+    Bring the UserProfile document of a user up to date with the current
+    version. Must be called inside the write transaction, after
+    bump_user_version.
+    
+    The favorites array is patched incrementally only when the caller says
+    what changed and the stored document is the previous version: an added
+    player is appended to the stored bytes, a removed player is filtered out,
+    and with favorites_changed=False the bytes are kept. Otherwise, e.g. for
+    a document of an older format, it is rebuilt from the join. The starting
+    eleven is at most eleven rows and is always re-serialized.
+    
+    Args:
+        cursor (sqlite3.Cursor): The cursor of the open write transaction.
+        user_id (int): The ID of the user.
+        added_player_id (int, optional): A player just added to the favorites.
+        removed_player_id (int, optional): A player just removed from the favorites.
+        favorites_changed (bool): False if this version changed the starting eleven only.
+    """
+    with SQL_DURATION.time('user_profile_state'):
+        cursor.execute('SELECT version FROM UserVersions WHERE user_id = ?', (user_id,))
+        row = cursor.fetchone()
+        version = row['version'] if row else 0
+
+        cursor.execute('SELECT version, favorites FROM UserProfile WHERE user_id = ?', (user_id,))
+        profile = cursor.fetchone()
+
+    delta = added_player_id is not None or removed_player_id is not None or not favorites_changed
+    if profile is None or profile['version'] != version - 1 or not delta:
+        favorites = serialize_favorites(cursor, user_id)
+    else:
+        favorites = bytes(profile['favorites'])
+        if added_player_id is not None:
+            with SQL_DURATION.time('player_by_id'):
+                cursor.execute(f'SELECT {PLAYER_SELECT} FROM Players WHERE player_id = ?', (added_player_id,))
+                player = dump_json(dict(cursor.fetchone()))
+            favorites = b'[' + player + b']' if favorites == b'[]' else favorites[:-1] + b',' + player + b']'
+        if removed_player_id is not None:
+            favorites = dump_json([player for player in app.json.loads(favorites) if player['player_id'] != removed_player_id])
+
+    starting_eleven = serialize_starting_eleven(cursor, user_id)
+    with SQL_DURATION.time('save_user_profile'):
+        cursor.execute('''
+            INSERT OR REPLACE INTO UserProfile (user_id, version, favorites, starting_eleven)
+            VALUES (?, ?, ?, ?)
+        ''', (user_id, version, favorites, starting_eleven))
+
+def user_etag(user_id, version):
+    """
+    Build the strong ETag for a user-scoped resource.
+    
+    Args:
+        user_id (int): The ID of the user.
+        version (int): The current data version of the user.
+    
+    Returns:
+        str: The (unquoted) entity tag.
+    """
+    return f"u{user_id}-v{version}"
+
+def not_modified(etag):
+    """
+    Build an empty 304 response carrying the given ETag.
+    
+    Args:
+        etag (str): The (unquoted) entity tag.
+    
+    Returns:
+        Response: A 304 Not Modified response.
+    """
+    response = app.response_class(status=304)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+db_pool = ConnectionPool(lambda: get_db_connection(check_same_thread=False), size=DB_POOL_SIZE)
+player_cache = PlayerCache(db_pool, PLAYER_SELECT, size=PLAYER_CACHE_SIZE)
+
+def players_by_id(player_ids):
+    """
+    Fetch players by ID, in the given order, through the player cache (see
+    player_cache.py). IDs of deleted players are skipped.
+    
+    Args:
+        player_ids (list): The player IDs.
+    
+    Returns:
+        list: Player dicts.
+    """
+    return player_cache.get_many(player_ids)
+
+catalogue = Catalogue(get_db_connection, ttl=CATALOGUE_TTL)
+image_proxy = ImageProxy(get_db_connection, IMAGES_DIR, thumbnail_size=IMAGE_THUMBNAIL_SIZE,
+                         max_bytes=IMAGE_MAX_BYTES, allowed_hosts=IMAGE_HOSTS, allow_private=IMAGE_ALLOW_PRIVATE)
+
+def search_catalogue():
+    """
+    Search the local player catalogue with structured filters (see search_players).
+    
+    Returns:
+        JSON: {players, total, offset, limit, facets}, or an error message.
+    """
+    predicates = [Equals(attribute, request.args[attribute])
+                  for attribute in CATEGORICAL if request.args.get(attribute)]
+    for attribute, _ in NUMERIC:
+        bounds = []
+        for bound in ('min', 'max'):
+            value = request.args.get(f'{bound}_{attribute}')
+            try:
+                bounds.append(float(value) if value not in (None, '') else None)
+            except ValueError:
+                return jsonify({"message": f"{bound}_{attribute} must be a number"}), 400
+        if bounds != [None, None]:
+            predicates.append(Range(attribute, *bounds))
+    if request.args.get('q'):
+        predicates.append(NameContains(request.args['q']))
+
+    sort = request.args.get('sort', 'rating')
+    if sort not in dict(NUMERIC):
+        return jsonify({"message": f"sort must be one of {', '.join(attribute for attribute, _ in NUMERIC)}"}), 400
+    descending = request.args.get('order', 'desc') != 'asc'
+    limit = min(max(request.args.get('limit', 20, type=int), 0), SEARCH_MAX_LIMIT)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    facets = [facet for facet in request.args.get('facets', ','.join(CATEGORICAL)).split(',') if facet]
+    if any(facet not in CATEGORICAL for facet in facets):
+        return jsonify({"message": f"facets must be among {', '.join(CATEGORICAL)}"}), 400
+    facet_limit = min(max(request.args.get('facet_limit', 10, type=int), 0), SEARCH_MAX_LIMIT)
+
+    snapshot = catalogue.snapshot()
+    rows, plan = snapshot.match(predicates)
+    logger.debug("Search plan: %s", ', '.join(f'{predicate} (~{estimate})' for predicate, estimate in plan))
+    page = snapshot.rank(rows, sort, descending, offset, limit)
+    players = players_by_id(snapshot.ids[page].tolist())
+    image_proxy.ensure_registered(player['img'] for player in players)
+    return jsonify({
+        "players": [{**player, "thumbnail": image_proxy.link(player['img'])} for player in players],
+        "total": snapshot.size if rows is None else len(rows),
+        "offset": offset,
+        "limit": limit,
+        "facets": snapshot.facet_counts(predicates, rows, facets, facet_limit),
+    }), 200
+
 @app.route('/search', methods=['GET'])
 def search_players():
     """
     Search for players using a SPARQL query and return the results.
     
+    With any structured filter the search runs on the local player catalogue
+    instead (see catalogue.py), and q matches a name substring there.
+    
+    Query Parameters:
+        q (str): A substring of the player name.
+        position, team, nationality, foot (str, optional): Exact values, case-insensitive.
+        min_<attribute>, max_<attribute> (float, optional): Inclusive bounds on rating,
+            potential, market_value (euros), wage (euros) or height (cm).
+        sort (str, optional): The numeric attribute to order by (default rating).
+        order (str, optional): 'desc' (default) or 'asc'.
+        limit, offset (int, optional): The page (default 20 players from 0).
+        facets (str, optional): Comma-separated attributes among position, team,
+            nationality and foot to count the matches by (default all).
+        facet_limit (int, optional): Values per facet, most frequent first (default 10).
+    
     Returns:
-        JSON: A list of players matching the search query or an error message.
+        JSON: A list of players matching the search query or an error message;
+        for structured searches {players, total, offset, limit, facets}.
     """
+    if any(param in request.args for param in STRUCTURED_SEARCH_PARAMS):
+        return search_catalogue()
+
     query = request.args.get('q')
-    sparql_endpoint = "http://127.0.0.1:7200/repositories/kd_repo_project"
+    sparql_endpoint = SPARQL_ENDPOINT
 
     sparql_query = f"""
     PREFIX fot: <http://www.example.org/group-27/football-ontology/>
@@ -158,8 +908,9 @@ def search_players():
 
     try:
         headers = {'Accept': 'application/json'}
-        response = requests.post(sparql_endpoint, data={'query': sparql_query}, headers=headers)
-        data = response.json()
+        with UPSTREAM_DURATION.time('sparql'):
+            response = requests.post(sparql_endpoint, data={'query': sparql_query}, headers=headers)
+            data = response.json()
 
         if 'results' in data and 'bindings' in data['results']:
             players = [
@@ -177,37 +928,308 @@ def search_players():
                     'rating': player['rating']['value'],
                     'description': player['description']['value'],
                     'foot': player['foot']['value'],
-                    'nationality': player['nationality']['value'] if 'nationality' in player else 'Unknown to FIFA database.'
+                    'nationality': player['nationality']['value'] if 'nationality' in player else 'Unknown to FIFA database.',
+                    'thumbnail': image_proxy.link(player['img']['value']),
 
 
                    
                 }
                 for player in data['results']['bindings']
             ]
+            image_proxy.ensure_registered(player['img'] for player in players)
             return jsonify(players), 200
 
         return jsonify({'message': 'No players found'}), 404
 
     except Exception as e:
+        UPSTREAM_ERRORS.inc('sparql')
         return jsonify({'error': str(e)}), 500
 
+@app.route('/img/<key>', methods=['GET'])
+def get_image(key):
+    """
+    Serve a player image from the image cache, fetching it from its host
+    on first request. Links are the thumbnail fields of search results and lineups.
+    
+    Args:
+        key (str): The image key, a hash of the image URL.
+    
+    Query Parameters:
+        size (str, optional): 'thumb' for the fixed-size thumbnail instead of the original.
+    
+    Returns:
+        image: The image, cacheable for a year, or an error message.
+    """
+    size = request.args.get('size')
+    if size not in (None, 'thumb'):
+        return jsonify({"message": "size must be thumb"}), 400
+    try:
+        path, mimetype, etag = image_proxy.open(key, thumbnail=size == 'thumb')
+    except ImageError as e:
+        return jsonify({"message": str(e)}), e.status
+    response = send_file(path, mimetype=mimetype, etag=etag, max_age=IMAGE_MAX_AGE)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    return response
+
 @app.route('/api/players', methods=['GET'])
 def get_players():
     """
-    Retrieve all players from the Players table.
+    Retrieve all players that are favorited by at least one user, or the players with the given IDs.
+    
+    Query Parameters:
+        ids (str, optional): Comma-separated player IDs, at most 100; unknown IDs are skipped.
     
     Returns:
-        JSON: A list of players.
+        JSON: A list of players, in the order of ids if given.
     """
+    if 'ids' in request.args:
+        try:
+            player_ids = [int(player_id) for player_id in request.args['ids'].split(',') if player_id]
+        except ValueError:
+            return jsonify({"message": "ids must be comma-separated integers"}), 400
+        if len(player_ids) > PLAYERS_MAX_IDS:
+            return jsonify({"message": f"At most {PLAYERS_MAX_IDS} ids"}), 400
+        return jsonify(players_by_id(player_ids)), 200
+
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('SELECT * FROM Players')
-    players = cursor.fetchall()
+    with SQL_DURATION.time('all_players'):
+        players = RowList.fetch(cursor, f'SELECT {PLAYER_SELECT} FROM Players WHERE favorite_count > 0')
     conn.close()
 
-    return jsonify([dict(player) for player in players]), 200
+    return jsonify(players), 200
 
 
+@app.route('/api/players/<int:player_id>', methods=['GET'])
+def get_player(player_id):
+    """
+    Retrieve a player by ID.
+    
+    Args:
+        player_id (int): The ID of the player.
+    
+    Returns:
+        JSON: The player or an error message.
+    """
+    player = player_cache.get(player_id)
+    if player is None:
+        return jsonify({"message": "Player not found"}), 404
+    return jsonify(player), 200
+
+read_replica = replica.Replica(REPLICA_PATH, REPLICA_MAX_STALENESS, get_db_connection, factory=TracedConnection)
+REPLICA_STALENESS.set_function(lambda: {} if replica.age(REPLICA_PATH) is None else {(): replica.age(REPLICA_PATH)})
+
+def refresh_replica(min_age=None):
+    """
+    Copy the database into the read-only replica. Every worker schedules
+    refreshes, so a scheduled refresh is skipped if another worker made one
+    in the last half interval.
+    
+    Args:
+        min_age (float, optional): Skip if the replica is younger than this. Defaults to half of REPLICA_REFRESH_INTERVAL.
+    
+    Returns:
+        dict: The copy statistics (see replica.refresh()), or None if skipped.
+    """
+    min_age = REPLICA_REFRESH_INTERVAL / 2 if min_age is None else min_age
+    result = replica.refresh(DATABASE, REPLICA_PATH, BACKUP_STEP_PAGES, BACKUP_STEP_SLEEP, min_age)
+    if result is not None:
+        logger.debug("Refreshed the replica in %ss (%s restarts)", result['seconds'], result['restarts'])
+    return result
+
+replica_refresher = PeriodicTask('replica_refresh', REPLICA_REFRESH_INTERVAL if REPLICA_MAX_STALENESS > 0 else 0,
+                                 refresh_replica).start()
+
+def with_staleness(response, staleness):
+    """
+    Tell the client how old the data of a response may be, in the
+    X-Data-Staleness header.
+    
+    Args:
+        response (Response): The response.
+        staleness (float): Seconds since the data was read from the primary.
+    
+    Returns:
+        Response: The response.
+    """
+    response.headers['X-Data-Staleness'] = f'{max(staleness, 0.0):.1f}'
+    return response
+
+leaderboard = Leaderboard(read_replica.connect, PLAYER_SELECT, size=LEADERBOARD_SIZE, ttl=LEADERBOARD_TTL,
+                          as_of=read_replica.data_time)
+
+@app.route('/api/leaderboard', methods=['GET'])
+def get_leaderboard():
+    """
+    Retrieve the most favorited players, overall or within one position,
+    team or nationality. Served from an in-memory snapshot that is at most
+    LEADERBOARD_TTL seconds old, built from the replica in replica mode;
+    X-Data-Staleness tells how old the data is.
+    
+    Query Parameters:
+        position (str, optional): Rank only players with this position.
+        team (str, optional): Rank only players of this team.
+        nationality (str, optional): Rank only players of this nationality.
+        limit (int, optional): The number of players to return (default 10).
+    
+    Returns:
+        JSON: A list of players with their number of favorites, most favorited first.
+    """
+    limit = min(max(request.args.get('limit', 10, type=int), 0), LEADERBOARD_SIZE)
+    filters = [dimension for dimension in DIMENSIONS if dimension in request.args]
+    if len(filters) > 1:
+        return jsonify({"message": "Filter by at most one of position, team or nationality"}), 400
+
+    if filters:
+        players = leaderboard.players(filters[0], request.args[filters[0]], limit)
+    else:
+        players = leaderboard.players(limit=limit)
+    return with_staleness(jsonify(players), leaderboard.staleness()), 200
+
+@app.route('/api/leaderboard/<dimension>', methods=['GET'])
+def get_group_leaderboard(dimension):
+    """
+    Retrieve the positions, teams or nationalities with the most favorites.
+    
+    Args:
+        dimension (str): 'position', 'team' or 'nationality'.
+    
+    Query Parameters:
+        limit (int, optional): The number of groups to return (default 10).
+    
+    Returns:
+        JSON: A list of {value, favorites} objects, most favorited first.
+    """
+    if dimension not in DIMENSIONS:
+        return jsonify({"message": "Unknown leaderboard"}), 404
+
+    limit = min(max(request.args.get('limit', 10, type=int), 0), LEADERBOARD_SIZE)
+    groups = leaderboard.groups(dimension, limit)
+    return with_staleness(jsonify(groups), leaderboard.staleness()), 200
+
+similarity_index = SimilarityIndex(get_db_connection, FEATURES_DIR, sync_ttl=FEATURES_SYNC_TTL)
+
+def prune_catalogue_changes():
+    """
+    Delete the CatalogueChanges entries that the feature matrix applied and
+    the player caches no longer need: they keep the last PLAYER_CACHE_SIZE,
+    as a cache further behind than that clears itself anyway.
+    
+    Returns:
+        int: The number of entries deleted.
+    """
+    return similarity_index.prune(keep_changes=PLAYER_CACHE_SIZE)
+
+catalogue_pruner = PeriodicTask('catalogue_prune', CATALOGUE_PRUNE_INTERVAL, prune_catalogue_changes).start()
+
+def ranked_players(ranked):
+    """
+    Fetch the players of a similarity ranking, in rank order.
+    
+    Args:
+        ranked (list): (player_id, similarity) tuples.
+    
+    Returns:
+        list: Player dicts with a similarity field.
+    """
+    similarities = dict(ranked)
+    return [{**player, "similarity": similarities[player['player_id']]}
+            for player in players_by_id(list(similarities))]
+
+@app.route('/api/players/<int:player_id>/similar', methods=['GET'])
+def get_similar_players(player_id):
+    """
+    Retrieve the players most similar to a player by rating, potential, market value,
+    wage, height, age, position and foot.
+    
+    Args:
+        player_id (int): The ID of the player.
+    
+    Query Parameters:
+        limit (int, optional): The number of players to return (default 20).
+    
+    Returns:
+        JSON: A list of players with their cosine similarity, most similar first.
+    """
+    limit = min(max(request.args.get('limit', 20, type=int), 0), RECOMMENDATIONS_MAX)
+    ranked = similarity_index.similar(player_id, limit)
+    if ranked is None:
+        return jsonify({"message": "Player not found"}), 404
+    return jsonify(ranked_players(ranked)), 200
+
+@app.route('/api/users/<username>/recommendations', methods=['GET'])
+def get_recommendations(username):
+    """
+    Retrieve players similar to a user's favorites as a whole, excluding the favorites.
+    
+    Args:
+        username (str): The username of the user.
+    
+    Query Parameters:
+        limit (int, optional): The number of players to return (default 20).
+    
+    Returns:
+        JSON: A list of players with their cosine similarity, most similar first.
+    """
+    limit = min(max(request.args.get('limit', 20, type=int), 0), RECOMMENDATIONS_MAX)
+    user_id = get_user_id(username)
+    if user_id is None:
+        return jsonify({"message": "User not found"}), 404
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    with SQL_DURATION.time('recommendation_favorites'):
+        cursor.execute('SELECT player_id FROM UserPlayers WHERE user_id = ?', (user_id,))
+        favorites = [row['player_id'] for row in cursor.fetchall()]
+    conn.close()
+    return jsonify(ranked_players(similarity_index.recommend(favorites, limit))), 200
+
+@app.route('/api/players/<int:player_id>/percentiles', methods=['GET'])
+def get_player_percentiles(player_id):
+    """
+    Retrieve the percentiles of a player's numeric attributes across the catalogue
+    and among the players of the same position.
+    
+    Args:
+        player_id (int): The ID of the player.
+    
+    Returns:
+        JSON: The position, the number of players compared with and, per attribute,
+        the value with its overall and position percentiles (null when unknown).
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    with SQL_DURATION.time('player_percentiles'):
+        cursor.execute(f'''
+            SELECT position, {', '.join(column for _, column in NUMERIC)} FROM Players WHERE player_id = ?
+        ''', (player_id,))
+        player = cursor.fetchone()
+    conn.close()
+    if player is None:
+        return jsonify({"message": "Player not found"}), 404
+    values = {attribute: player[column] for attribute, column in NUMERIC}
+    return jsonify({"player_id": player_id, **catalogue.snapshot().percentiles(values, player['position'])}), 200
+
+@app.route('/api/percentiles', methods=['GET'])
+def get_percentiles():
+    """
+    Retrieve the percentiles of attribute values as the SPARQL endpoint returns them,
+    for players that are not in the local catalogue.
+    
+    Query Parameters:
+        position (str, optional): The position to compare within.
+        rating, potential, market_value, wage, height (str, optional): The values,
+            e.g. rating=85&market_value=€85M&height=1.85 m.
+    
+    Returns:
+        JSON: As /api/players/<player_id>/percentiles, without player_id.
+    """
+    parsers = {source: parser for _, source, parser in TYPED_COLUMNS}
+    values = {attribute: parsers[attribute](request.args.get(attribute)) for attribute, _ in NUMERIC}
+    return jsonify(catalogue.snapshot().percentiles(values, request.args.get('position'))), 200
+
 @app.route('/api/register', methods=['POST'])
 def register():
     """
@@ -227,17 +1249,20 @@ def register():
     if not username or not password:
         return jsonify({"message": "Username and password are required"}), 400
 
+    conn = get_db_connection()
     try:
-        conn = get_db_connection()
         cursor = conn.cursor()
-        cursor.execute('INSERT INTO Users (username, password) VALUES (?, ?)', (username, password))
-        conn.commit()
+        with SQL_DURATION.time('insert_user'):
+            cursor.execute('INSERT INTO Users (username, password) VALUES (?, ?)', (username, password))
+            conn.commit()
         user_id = cursor.lastrowid
         conn.close()
         return jsonify({"message": "User registered successfully", "user_id": user_id}), 200
     except sqlite3.IntegrityError:
+        conn.close()
         return jsonify({"message": "Username already exists"}), 400
     except Exception as e:
+        conn.close()
         return jsonify({"message": "Error registering user", "error": str(e)}), 500
 
 @app.route('/api/login', methods=['POST'])
@@ -259,11 +1284,12 @@ def login():
     if not username or not password:
         return jsonify({"message": "Username and password are required"}), 400
 
+    conn = get_db_connection()
     try:
-        conn = get_db_connection()
         cursor = conn.cursor()
-        cursor.execute('SELECT * FROM Users WHERE username = ? AND password = ?', (username, password))
-        user = cursor.fetchone()
+        with SQL_DURATION.time('check_login'):
+            cursor.execute('SELECT * FROM Users WHERE username = ? AND password = ?', (username, password))
+            user = cursor.fetchone()
         conn.close()
 
         if user:
@@ -271,6 +1297,7 @@ def login():
         else:
             return jsonify({"message": "Invalid username or password"}), 400
     except Exception as e:
+        conn.close()
         return jsonify({"message": "Error logging in", "error": str(e)}), 500
 
 @app.route('/api/users/<username>/players', methods=['GET'])
@@ -284,22 +1311,92 @@ def get_user_players(username):
     Returns:
         JSON: A list of favorite players or an error message.
     """
-    user_id = get_user_id(username)
-    if user_id is None:
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    user = get_user_version(cursor, username)
+    if user is None:
+        conn.close()
         return jsonify({"message": "User not found"}), 404
+
+    user_id, version = user
+    etag = user_etag(user_id, version)
+    if if_none_match(etag):
+        CACHE_REQUESTS.inc('user_etag', 'hit')
+        conn.close()
+        return not_modified(etag)
+    CACHE_REQUESTS.inc('user_etag', 'miss')
+
+    with SQL_DURATION.time('user_favorites'):
+        players = RowList.fetch(cursor, f'''
+            SELECT {PLAYER_SELECT}
+            FROM Players 
+            JOIN UserPlayers ON Players.player_id = UserPlayers.player_id 
+            WHERE UserPlayers.user_id = ?
+        ''', (user_id,))
+    conn.close()
+
+    response = jsonify(players)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response, 200
+
+@app.route('/api/users/<username>/profile', methods=['GET'])
+def get_user_profile(username):
+    """
+    Retrieve the favorite players and the starting eleven of a user in one
+    response, served from the pre-serialized UserProfile document.
+    
+    Args:
+        username (str): The username of the user.
     
+    Returns:
+        JSON: {"favorites": [...], "starting_eleven": [...]} or an error message.
+    """
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('''
-        SELECT Players.* 
-        FROM Players 
-        JOIN UserPlayers ON Players.player_id = UserPlayers.player_id 
-        WHERE UserPlayers.user_id = ?
-    ''', (user_id,))
-    players = cursor.fetchall()
+    query = '''
+        SELECT Users.user_id, COALESCE(UserVersions.version, 0) AS version,
+               UserProfile.version AS profile_version, UserProfile.favorites, UserProfile.starting_eleven
+        FROM Users
+        LEFT JOIN UserVersions ON Users.user_id = UserVersions.user_id
+        LEFT JOIN UserProfile ON Users.user_id = UserProfile.user_id
+        WHERE Users.username = ?
+    '''
+    with SQL_DURATION.time('user_profile'):
+        cursor.execute(query, (username,))
+        profile = cursor.fetchone()
+    if profile is None:
+        conn.close()
+        return jsonify({"message": "User not found"}), 404
+
+    etag = user_etag(profile['user_id'], profile['version'])
+    if if_none_match(etag):
+        CACHE_REQUESTS.inc('user_etag', 'hit')
+        conn.close()
+        return not_modified(etag)
+    CACHE_REQUESTS.inc('user_etag', 'miss')
+
+    if profile['profile_version'] != profile['version']:
+        # Document missing or written outside the request handlers: rebuild it once.
+        # Take the write lock up front; upgrading the read lock of the lookup
+        # above would deadlock against a concurrent writer.
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            refresh_user_profile(cursor, profile['user_id'])
+            with SQL_DURATION.time('commit'):
+                conn.commit()
+            cursor.execute(query, (username,))
+            profile = cursor.fetchone()
+        except sqlite3.Error as e:
+            conn.close()
+            return jsonify({"message": "Error building user profile", "error": str(e)}), 500
     conn.close()
 
-    return jsonify([dict(player) for player in players]), 200
+    body = b'{"favorites":' + profile['favorites'] + b',"starting_eleven":' + profile['starting_eleven'] + b'}'
+    response = app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response, 200
 
 @app.route('/api/users/<username>/favorite_players', methods=['POST'])
 def add_favorite_player(username):
@@ -310,6 +1407,9 @@ def add_favorite_player(username):
         username (str): The username of the user.
     
     Request Body:
+        player (str, optional): The URI of the player in the SPARQL source, as returned by /search;
+            identifies the player. Without it, a player of the same name, team and birth date
+            that has no URI is reused.
         name (str): The name of the player.
         team (str): The team of the player.
         position (str): The position of the player.
@@ -323,15 +1423,14 @@ def add_favorite_player(username):
     Returns:
         JSON: A success message or an error message.
     """
-    logging.debug(f"Adding favorite player for username: {username}")
+    logger.debug("Adding favorite player for username: %s", username)
     user_id = get_user_id(username)
     if user_id is None:
-        logging.debug(f"User not found for username: {username}")
+        logger.debug("User not found for username: %s", username)
         return jsonify({"message": "User not found"}), 404
 
     data = request.get_json()
-    logging.debug(f"Received data: {data}")
-    print(data)
+    logger.debug("Received favorite player %r for username: %s", data.get('name'), username)
     name = data.get('name')
     team = data.get('team', '').split('/').pop().replace('_', ' ') or 'Unknown Team'
     position = data.get('position', '').split('/').pop() or 'Unknown Position'
@@ -340,45 +1439,74 @@ def add_favorite_player(username):
     birthDate = data.get('birthDate', 'Unknown Date')
     height = data.get('height', 'Not Available')
     description = data.get('description', 'No Description')
+    source_uri = data.get('player') or None
     
 
 
     if not name:
         return jsonify({"message": "Player name is required"}), 400
 
+    conn = get_db_connection()
     try:
-        conn = get_db_connection()
         cursor = conn.cursor()
-        print("DATA", data)
-        # Insert player and get the player_id of the new entry
-        # Insert player and get the player_id of the new entry
-        cursor.execute('''
-    INSERT INTO Players 
-    (name, team, position, img, nationality, birthDate, height, description, market_value, potential, rating, foot, wage)
-    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-''', (name, team, position, img, nationality, birthDate, height, description, 
-      data.get('market_value', 'Not Available'),
-      data.get('potential', 'Not Available'), 
-      data.get('rating', 'Not Available'), 
-      data.get('foot', 'Not Specified'),
-      data.get('wage', 'Not Available')))
+        # Take the write lock before the lookup, so the orphan sweeper cannot
+        # delete the player between the lookup and the UserPlayers insert
+        cursor.execute('BEGIN IMMEDIATE')
 
+        # Reuse the player's row if it exists (e.g. unfavorited and not swept yet). Players sharing
+        # a name are distinct: the key is the source URI, and without one name, team and birth date
+        if source_uri is not None:
+            with SQL_DURATION.time('player_by_source_uri'):
+                cursor.execute('SELECT player_id FROM Players WHERE source_uri = ?', (source_uri,))
+                player = cursor.fetchone()
+        else:
+            with SQL_DURATION.time('player_by_name'):
+                cursor.execute('''
+                    SELECT player_id FROM Players
+                    WHERE name = ? AND team IS ? AND birthDate IS ? AND source_uri IS NULL
+                    LIMIT 1
+                ''', (name, team, birthDate))
+                player = cursor.fetchone()
 
-        
-        # Get the last inserted player_id
-        player_id = cursor.lastrowid
+        if player is not None:
+            player_id = player[0]
+        else:
+            # Insert player and get the player_id of the new entry
+            with SQL_DURATION.time('insert_player'):
+                player = {
+                    'name': name, 'team': team, 'position': position, 'img': img, 'nationality': nationality,
+                    'birthDate': birthDate, 'height': height, 'description': description,
+                    'market_value': data.get('market_value', 'Not Available'),
+                    'potential': data.get('potential', 'Not Available'),
+                    'rating': data.get('rating', 'Not Available'),
+                    'foot': data.get('foot', 'Not Specified'),
+                    'wage': data.get('wage', 'Not Available'),
+                    'source_uri': source_uri,
+                }
+                columns = list(player) + [column for column, _, _ in TYPED_COLUMNS]
+                cursor.execute(f'''
+    INSERT INTO Players ({', '.join(columns)})
+    VALUES ({', '.join('?' * len(columns))})
+''', tuple(player.values()) + typed_values(player))
+            player_id = cursor.lastrowid
         
         # Now insert into UserPlayers with user_id and player_id
-        cursor.execute('INSERT INTO UserPlayers (user_id, player_id) VALUES (?, ?)', (user_id, player_id))
+        with SQL_DURATION.time('insert_user_player'):
+            cursor.execute('INSERT INTO UserPlayers (user_id, player_id) VALUES (?, ?)', (user_id, player_id))
+        bump_user_version(cursor, user_id)
+        refresh_user_profile(cursor, user_id, added_player_id=player_id)
         
-        conn.commit()
+        with SQL_DURATION.time('commit'):
+            conn.commit()
         conn.close()
-        logging.debug(f"Player {name} added to favorites for username: {username}")
+        logger.debug("Player %s added to favorites for username: %s", name, username)
         return jsonify({"message": "Player added to favorites"}), 200
     except sqlite3.IntegrityError:
+        conn.close()
         return jsonify({"message": "Player already in favorites"}), 400
     except Exception as e:
-        logging.error(f"Error adding player to favorites: {e}")
+        conn.close()
+        logger.error("Error adding player to favorites: %s", e)
         return jsonify({"message": "Error adding player to favorites", "error": str(e)}), 500
 
 @app.route('/api/news')
@@ -390,12 +1518,14 @@ def get_latest_news():
         JSON: A list of news articles or an error message.
     """
     try:
-        response = requests.get('https://footballnewsapi.netlify.app/.netlify/functions/api/news/espn')
-        if not response.ok:
-            raise Exception('Failed to fetch news')
-        data = response.json()
+        with UPSTREAM_DURATION.time('news'):
+            response = requests.get(NEWS_API_URL)
+            if not response.ok:
+                raise Exception('Failed to fetch news')
+            data = response.json()
         return jsonify(data)
     except Exception as e:
+        UPSTREAM_ERRORS.inc('news')
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/users/<username>/favorite_players', methods=['DELETE'])
@@ -407,14 +1537,17 @@ def remove_favorite_player(username):
         username (str): The username of the user.
     
     Request Body:
-        name (str): The name of the player to be removed.
+        player_id (int, optional): The ID of the player to be removed.
+        player (str, optional): The URI of the player in the SPARQL source, if no player_id is given.
+        name (str, optional): The name of the player, if neither is given; looked up among the
+            user's favorites only.
     
     Returns:
         JSON: A success message or an error message.
     """
     user_id = get_user_id(username)
     if user_id is None:
-        logging.debug(f"User not found for username: {username}")
+        logger.debug("User not found for username: %s", username)
         return jsonify({"message": "User not found"}), 404
 
     # Ensure the request content type is application/json
@@ -422,52 +1555,71 @@ def remove_favorite_player(username):
         return jsonify({"message": "Invalid request format, JSON required"}), 400
 
     data = request.get_json()
-    logging.debug(f"Received data for removal: {data}")
+    player_id = data.get('player_id')
+    source_uri = data.get('player')
     name = data.get('name')  # Extract player's name from JSON body
     
-    if not name:
-        logging.debug("Player name is required but not provided")
+    if player_id is None and not source_uri and not name:
+        logger.debug("Player name is required but not provided")
         return jsonify({"message": "Player name is required"}), 400
 
+    conn = get_db_connection()
     try:
-        conn = get_db_connection()
         cursor = conn.cursor()
 
-        # Get the player_id from the Players table based on the name
-        cursor.execute('SELECT player_id FROM Players WHERE name = ?', (name,))
-        player = cursor.fetchone()
+        # Get the player_id from the Players table: by ID, by source URI, or by name among the
+        # user's favorites, since distinct players may share a name
+        if player_id is not None:
+            with SQL_DURATION.time('player_by_id'):
+                cursor.execute('SELECT player_id FROM Players WHERE player_id = ?', (player_id,))
+                player = cursor.fetchone()
+        elif source_uri:
+            with SQL_DURATION.time('player_by_source_uri'):
+                cursor.execute('SELECT player_id FROM Players WHERE source_uri = ?', (source_uri,))
+                player = cursor.fetchone()
+        else:
+            with SQL_DURATION.time('player_by_name'):
+                cursor.execute('''
+                    SELECT Players.player_id FROM UserPlayers
+                    JOIN Players ON Players.player_id = UserPlayers.player_id
+                    WHERE UserPlayers.user_id = ? AND Players.name = ?
+                    ORDER BY Players.player_id
+                    LIMIT 1
+                ''', (user_id, name))
+                player = cursor.fetchone()
 
         if player is None:
-            logging.debug(f"No player found with name: {name}")
+            conn.close()
+            logger.debug("No player found with name: %s", name)
             return jsonify({"message": "Player not found"}), 404
 
         player_id = player[0]
+        # Only the user and the player: the request body is client data and is not logged
+        logger.debug("Removing player %s from the favorites of %s", player_id, username)
 
         # Remove the player from UserPlayers table
-        cursor.execute('DELETE FROM UserPlayers WHERE user_id = ? AND player_id = ?', (user_id, player_id))
+        with SQL_DURATION.time('delete_user_player'):
+            cursor.execute('DELETE FROM UserPlayers WHERE user_id = ? AND player_id = ?', (user_id, player_id))
         rows_affected = cursor.rowcount
         
         if rows_affected == 0:
             conn.close()
-            logging.debug(f"No player found with player_id: {player_id} for user_id: {user_id}")
+            logger.debug("No player found with player_id: %s for user_id: %s", player_id, user_id)
             return jsonify({"message": "Player not found in favorites"}), 404
         
-        # Check if the player is still favorited by any other user
-        cursor.execute('SELECT COUNT(*) FROM UserPlayers WHERE player_id = ?', (player_id,))
-        count = cursor.fetchone()[0]
-        
-        if count == 0:
-            # Remove the player from Players table if no other user has favorited this player
-            cursor.execute('DELETE FROM Players WHERE player_id = ?', (player_id,))
-            logging.debug(f"Player {player_id} removed from Players table")
-        
-        conn.commit()
+        # favorite_count is decremented by a trigger; the player's row is
+        # deleted by the orphan sweeper once nobody has favorited it for a while
+        bump_user_version(cursor, user_id)
+        refresh_user_profile(cursor, user_id, removed_player_id=player_id)
+        with SQL_DURATION.time('commit'):
+            conn.commit()
         conn.close()
 
-        logging.debug(f"Player {name} removed from favorites for user {user_id}")
+        logger.debug("Player %s removed from favorites for user %s", player_id, user_id)
         return jsonify({"message": "Player removed from favorites"}), 200
     except Exception as e:
-        logging.error(f"Error removing player from favorites: {e}")
+        conn.close()
+        logger.error("Error removing player from favorites: %s", e)
         return jsonify({"message": "Error removing player from favorites", "error": str(e)}), 500
 
 @app.route('/api/users', methods=['GET'])
@@ -480,11 +1632,11 @@ def get_users():
     """
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('SELECT * FROM Users')
-    users = cursor.fetchall()
+    with SQL_DURATION.time('all_users'):
+        users = RowList.fetch(cursor, 'SELECT * FROM Users')
     conn.close()
 
-    return jsonify([dict(user) for user in users]), 200
+    return jsonify(users), 200
 
 @app.route('/api/startingeleven/<username>', methods=['GET'])
 def get_starting_eleven(username):
@@ -497,22 +1649,141 @@ def get_starting_eleven(username):
     Returns:
         JSON: A list of starting eleven players or an error message.
     """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    user = get_user_version(cursor, username)
+    if user is None:
+        conn.close()
+        return jsonify({"message": "User not found"}), 404
+
+    user_id, version = user
+    etag = user_etag(user_id, version)
+    if if_none_match(etag):
+        CACHE_REQUESTS.inc('user_etag', 'hit')
+        conn.close()
+        return not_modified(etag)
+    CACHE_REQUESTS.inc('user_etag', 'miss')
+
+    with SQL_DURATION.time('user_starting_eleven'):
+        cursor.execute('''
+            SELECT StartingEleven.position, Players.player_id, Players.name, Players.img
+            FROM StartingEleven
+            JOIN Players ON StartingEleven.player_id = Players.player_id
+            WHERE StartingEleven.user_id = ?
+        ''', (user_id,))
+        starting_eleven = cursor.fetchall()
+    conn.close()
+
+    image_proxy.ensure_registered(row["img"] for row in starting_eleven)
+    result = [{"position": row["position"], "player_id": row["player_id"], "name": row["name"], "picture": row["img"],
+               "thumbnail": image_proxy.link(row["img"])} for row in starting_eleven]
+    response = jsonify(result)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response, 200
+
+@app.route('/api/startingeleven/<username>/summary', methods=['GET'])
+def get_starting_eleven_summary(username):
+    """
+    Retrieve team-level numbers of a user's starting eleven, read from the
+    incrementally maintained LineupAggregates row.
+    
+    Args:
+        username (str): The username of the user.
+    
+    Returns:
+        JSON: The number of players, average rating, potential, height and age,
+        total market value and wage bill, and how many players each value is known for.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    with SQL_DURATION.time('lineup_aggregates'):
+        cursor.execute(f'''
+            SELECT Users.user_id, COALESCE(UserVersions.version, 0) AS version,
+                   COALESCE(LineupAggregates.players, 0) AS players, {', '.join(
+                       f'COALESCE(LineupAggregates.{metric}_count, 0) AS {metric}_count, '
+                       f'COALESCE(LineupAggregates.{metric}_sum, 0) AS {metric}_sum' for metric, _ in LINEUP_METRICS)}
+            FROM Users
+            LEFT JOIN UserVersions ON Users.user_id = UserVersions.user_id
+            LEFT JOIN LineupAggregates ON Users.user_id = LineupAggregates.user_id
+            WHERE Users.username = ?
+        ''', (username,))
+        row = cursor.fetchone()
+    conn.close()
+    if row is None:
+        return jsonify({"message": "User not found"}), 404
+
+    # The average age depends on the date, so it is part of the entity tag
+    today = today_day()
+    etag = f"{user_etag(row['user_id'], row['version'])}-summary-d{today}"
+    if if_none_match(etag):
+        CACHE_REQUESTS.inc('user_etag', 'hit')
+        return not_modified(etag)
+    CACHE_REQUESTS.inc('user_etag', 'miss')
+
+    def average(metric, digits=1):
+        return round(row[f'{metric}_sum'] / row[f'{metric}_count'], digits) if row[f'{metric}_count'] else None
+
+    average_birth_day = average('birth_day', 3)
+    summary = {
+        "players": row['players'],
+        "average_rating": average('rating'),
+        "average_potential": average('potential'),
+        "total_market_value_eur": row['market_value_sum'] if row['market_value_count'] else None,
+        "total_wage_eur": row['wage_sum'] if row['wage_count'] else None,
+        "average_height_cm": average('height'),
+        "average_age": round((today - average_birth_day) / 365.25, 1) if average_birth_day is not None else None,
+        "known": {metric: row[f'{metric}_count'] for metric, _ in LINEUP_METRICS},
+    }
+    response = jsonify(summary)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response, 200
+
+@app.route('/api/startingeleven/<username>/solve', methods=['POST'])
+def solve_starting_eleven(username):
+    """
+    Suggest the starting eleven with the highest total rating from the user's favorites.
+    The lineup is only returned; it is saved by posting its positions as usual.
+
+    Args:
+        username (str): The username of the user.
+
+    Returns:
+        JSON: The suggested lineup and its totals, or an error message.
+    """
+    data = request.get_json(silent=True) or {}
+    formation = data.get('formation', '4-3-3')
+    foot = data.get('preferred_foot')
+    limits = {}
+    for field in ('max_wage', 'max_market_value', 'max_per_team'):
+        value = data.get(field)
+        if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0):
+            return jsonify({"message": f"{field} must be a non-negative number"}), 400
+        limits[field] = value
+    if foot is not None and not isinstance(foot, str):
+        return jsonify({"message": "preferred_foot must be a string"}), 400
+
     user_id = get_user_id(username)
     if user_id is None:
         return jsonify({"message": "User not found"}), 404
-    
+
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('''
-        SELECT StartingEleven.position, Players.player_id, Players.name, Players.img
-        FROM StartingEleven
-        JOIN Players ON StartingEleven.player_id = Players.player_id
-        WHERE StartingEleven.user_id = ?
-    ''', (user_id,))
-    starting_eleven = cursor.fetchall()
+    with SQL_DURATION.time('solver_candidates'):
+        favorites = RowList.fetch(cursor, f'''
+            SELECT Players.player_id, Players.name, Players.position, Players.team, Players.foot,
+                   Players.img, Players.rating_value, Players.wage_eur, Players.market_value_eur
+            FROM UserPlayers
+            JOIN Players ON UserPlayers.player_id = Players.player_id
+            WHERE UserPlayers.user_id = ?{' AND LOWER(Players.foot) = LOWER(?)' if foot else ''}
+        ''', (user_id, foot) if foot else (user_id,))
     conn.close()
 
-    result = [{"position": row["position"], "player_id": row["player_id"], "name": row["name"], "picture": row["img"]} for row in starting_eleven]
+    try:
+        result = solver.solve(solver.Candidates(favorites.columns, favorites.rows), formation, **limits)
+    except solver.SolverError as e:
+        return jsonify({"message": str(e)}), 422
     return jsonify(result), 200
 
 @app.route('/api/startingeleven/<username>', methods=['POST'])
@@ -541,17 +1812,30 @@ def add_to_starting_eleven(username):
     if not position or not player_id:
         return jsonify({"message": "Position and player ID are required"}), 400
 
+    conn = get_db_connection()
     try:
-        conn = get_db_connection()
         cursor = conn.cursor()
-        cursor.execute('''
-            INSERT OR REPLACE INTO StartingEleven (user_id, position, player_id)
-            VALUES (?, ?, ?)
-        ''', (user_id, position, player_id))
-        conn.commit()
+        # Read the replaced player and write in one transaction, so the aggregates stay exact
+        cursor.execute('BEGIN IMMEDIATE')
+        with SQL_DURATION.time('starting_eleven_position'):
+            cursor.execute('SELECT player_id FROM StartingEleven WHERE user_id = ? AND position = ?', (user_id, position))
+            replaced = cursor.fetchone()
+        with SQL_DURATION.time('upsert_starting_eleven'):
+            cursor.execute('''
+                INSERT OR REPLACE INTO StartingEleven (user_id, position, player_id)
+                VALUES (?, ?, ?)
+            ''', (user_id, position, player_id))
+        if replaced is not None:
+            lineup_delta(cursor, user_id, replaced['player_id'], -1)
+        lineup_delta(cursor, user_id, player_id, 1)
+        bump_user_version(cursor, user_id)
+        refresh_user_profile(cursor, user_id, favorites_changed=False)
+        with SQL_DURATION.time('commit'):
+            conn.commit()
         conn.close()
         return jsonify({"message": "Player added to starting eleven", "player_id": player_id, "position": position}), 200
     except Exception as e:
+        conn.close()
         return jsonify({"message": "Error adding player to starting eleven", "error": str(e)}), 500
 
 @app.route('/api/startingeleven/<username>/<position>', methods=['DELETE'])
@@ -570,18 +1854,258 @@ def remove_from_starting_eleven(username, position):
     if user_id is None:
         return jsonify({"message": "User not found"}), 404
 
+    conn = get_db_connection()
     try:
-        conn = get_db_connection()
         cursor = conn.cursor()
-        cursor.execute('''
-            DELETE FROM StartingEleven 
-            WHERE user_id = ? AND position = ?
-        ''', (user_id, position))
-        conn.commit()
+        cursor.execute('BEGIN IMMEDIATE')
+        with SQL_DURATION.time('starting_eleven_position'):
+            cursor.execute('SELECT player_id FROM StartingEleven WHERE user_id = ? AND position = ?', (user_id, position))
+            removed = cursor.fetchone()
+        with SQL_DURATION.time('delete_starting_eleven'):
+            cursor.execute('''
+                DELETE FROM StartingEleven 
+                WHERE user_id = ? AND position = ?
+            ''', (user_id, position))
+        if removed is not None:
+            lineup_delta(cursor, user_id, removed['player_id'], -1)
+            bump_user_version(cursor, user_id)
+            refresh_user_profile(cursor, user_id, favorites_changed=False)
+        with SQL_DURATION.time('commit'):
+            conn.commit()
         conn.close()
         return jsonify({"message": "Player removed from starting eleven"}), 200
     except Exception as e:
+        conn.close()
         return jsonify({"message": "Error removing player from starting eleven", "error": str(e)}), 500
     
+@app.route('/api/admin/queries', methods=['GET', 'DELETE'])
+def get_query_stats():
+    """
+    List the SQL statements with the highest cost in this process, or reset
+    the statistics with DELETE.
+    
+    Query Parameters:
+        limit (int, optional): The number of statements to return (default 20).
+        order (str, optional): Sort by 'total' (default), 'p99', 'max' or 'count'.
+    
+    Returns:
+        JSON: Normalized statements with count, total, mean, p50, p99 and max in
+        milliseconds, and the query plan of slow statements.
+    """
+    if not is_admin_request():
+        return jsonify({"message": "Forbidden"}), 403
+
+    if request.method == 'DELETE':
+        TRACER.reset()
+        return jsonify({"message": "Query statistics reset"}), 200
+
+    limit = request.args.get('limit', 20, type=int)
+    order = request.args.get('order', 'total')
+    return jsonify(TRACER.top(limit, order)), 200
+
+@app.route('/api/admin/export/<name>', methods=['GET'])
+def export_rows(name):
+    """
+    Stream all users' favorites or starting elevens joined with the players,
+    in batches (see export.py), from the replica in replica mode; X-Data-Staleness
+    tells how old the data is. Also available offline: python export.py --help.
+    
+    Args:
+        name (str): 'favorites' or 'lineups'.
+    
+    Query Parameters:
+        format (str, optional): 'ndjson' (default) or 'csv'.
+        gzip (str, optional): '1' to gzip the output.
+    
+    Returns:
+        NDJSON or CSV as an attachment, or an error message.
+    """
+    if not is_admin_request():
+        return jsonify({"message": "Forbidden"}), 403
+    if name not in EXPORTS:
+        return jsonify({"message": f"Export must be one of {', '.join(sorted(EXPORTS))}"}), 404
+    file_format = request.args.get('format', 'ndjson')
+    if file_format not in FORMATS:
+        return jsonify({"message": f"format must be one of {', '.join(sorted(FORMATS))}"}), 400
+    compress = request.args.get('gzip') == '1'
+
+    as_of = read_replica.data_time()
+
+    def generate():
+        conn = read_replica.connect()
+        try:
+            yield from stream_export(conn, name, file_format, compress)
+        finally:
+            conn.close()
+
+    filename = f'{name}.{file_format}' + ('.gz' if compress else '')
+    response = app.response_class(generate(), mimetype='application/gzip' if compress else FORMATS[file_format],
+                                  headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+    return with_staleness(response, time.time() - as_of)
+
+def sweep_orphan_players(grace_period=None, batch_size=None):
+    """
+    Delete players that nobody has favorited for longer than the grace
+    period and that are not in anyone's starting eleven. Runs in short
+    batches, one transaction each, so request handlers are not blocked.
+    
+    Args:
+        grace_period (int, optional): Seconds a player must have been orphaned. Defaults to ORPHAN_GRACE_PERIOD.
+        batch_size (int, optional): Players deleted per transaction. Defaults to ORPHAN_SWEEP_BATCH.
+    
+    Returns:
+        int: The number of players deleted.
+    """
+    grace_period = ORPHAN_GRACE_PERIOD if grace_period is None else grace_period
+    batch_size = batch_size or ORPHAN_SWEEP_BATCH
+    cutoff = int(time.time()) - grace_period
+    deleted = 0
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        while True:
+            # favorite_count is re-checked inside the delete's own write transaction
+            with SQL_DURATION.time('sweep_orphan_players'):
+                cursor.execute('''
+                    DELETE FROM Players WHERE player_id IN (
+                        SELECT player_id FROM Players
+                        WHERE favorite_count = 0 AND orphaned_at <= ?
+                          AND NOT EXISTS (SELECT 1 FROM StartingEleven WHERE StartingEleven.player_id = Players.player_id)
+                        LIMIT ?
+                    )
+                ''', (cutoff, batch_size))
+                batch = cursor.rowcount
+            with SQL_DURATION.time('commit'):
+                conn.commit()
+            deleted += batch
+            if batch < batch_size:
+                break
+    finally:
+        conn.close()
+    if deleted:
+        ORPHAN_PLAYERS_SWEPT.inc(amount=deleted)
+        logger.info("Swept %s orphaned players", deleted)
+    return deleted
+
+orphan_sweeper = PeriodicTask('orphan_sweep', ORPHAN_SWEEP_INTERVAL, sweep_orphan_players).start()
+
+@app.route('/api/admin/sweep', methods=['POST'])
+def run_orphan_sweep():
+    """
+    Run the orphan player sweeper now.
+    
+    Query Parameters:
+        grace (int, optional): Override the grace period in seconds.
+    
+    Returns:
+        JSON: The number of players deleted.
+    """
+    if not is_admin_request():
+        return jsonify({"message": "Forbidden"}), 403
+
+    grace = request.args.get('grace', type=int)
+    deleted = orphan_sweeper.run_once() if grace is None else sweep_orphan_players(grace_period=grace)
+    return jsonify({"deleted": deleted}), 200
+
+def backup_database(min_age=None):
+    """
+    Back up the database into a new snapshot in BACKUP_DIR, keeping the
+    newest BACKUP_KEEP. Every worker schedules backups, so a scheduled
+    backup is skipped if another worker made one in the last half interval.
+    
+    Args:
+        min_age (float, optional): Skip if the newest snapshot is younger than this. Defaults to half of BACKUP_INTERVAL.
+    
+    Returns:
+        dict: The snapshot and copy statistics (see backup.create()), or None if skipped.
+    """
+    min_age = BACKUP_INTERVAL / 2 if min_age is None else min_age
+    result = backup.create(DATABASE, BACKUP_DIR, BACKUP_KEEP, BACKUP_STEP_PAGES, BACKUP_STEP_SLEEP, min_age)
+    if result is not None:
+        logger.info("Backed up the database to %s in %ss (%s restarts, longest step %sms)",
+                    result['path'], result['seconds'], result['restarts'], result['longest_step_ms'])
+    return result
+
+backup_scheduler = PeriodicTask('backup', BACKUP_INTERVAL, backup_database).start()
+
+@app.route('/api/admin/backups', methods=['GET', 'POST'])
+def database_backups():
+    """
+    List the database snapshots, newest first, or back up the database now
+    with POST. Snapshots are restored offline: python backup.py restore <snapshot>.
+    
+    Returns:
+        JSON: The snapshots, or the new snapshot and its copy statistics (201).
+    """
+    if not is_admin_request():
+        return jsonify({"message": "Forbidden"}), 403
+
+    if request.method == 'GET':
+        return jsonify(backup.snapshots(BACKUP_DIR, DATABASE)), 200
+    try:
+        result = backup_database(min_age=0)
+    except (sqlite3.Error, OSError) as e:
+        logger.exception("Backup failed")
+        return jsonify({"message": "Backup failed", "error": str(e)}), 500
+    if result is None:
+        return jsonify({"message": "Another backup is running"}), 409
+    return jsonify(result), 201
+
+DATABASE_SIZE.set_function(lambda: {('database',): maintenance.file_stats(DATABASE)['bytes'],
+                                    ('wal',): maintenance.file_stats(DATABASE)['wal_bytes']})
+DATABASE_FREELIST.set_function(lambda: {(): maintenance.file_stats(DATABASE)['freelist_pages']})
+traffic = maintenance.Traffic(lambda: sum(REQUESTS.collect().values()))
+
+def maintain_database(min_age=None):
+    """
+    Run routine database maintenance (see maintenance.py) if this worker
+    has been quiet since the last check. Every worker checks, so a run is
+    skipped if any worker ran one in the last MAINTENANCE_INTERVAL.
+    
+    Args:
+        min_age (float, optional): Run regardless of traffic, unless the last run is younger than this.
+            Defaults to MAINTENANCE_INTERVAL, and only in a quiet moment.
+    
+    Returns:
+        dict: What the run did (see maintenance.run()), or None if skipped.
+    """
+    if min_age is None:
+        if traffic.rate() > MAINTENANCE_MAX_RATE:
+            return None
+        min_age = MAINTENANCE_INTERVAL
+    result = maintenance.run(DATABASE, MAINTENANCE_BUDGET, MAINTENANCE_STATEMENT_BUDGET, min_age=min_age)
+    if result is not None:
+        logger.info("Maintained the database in %ss: analyzed %s, freed %s pages, %s interrupted statements",
+                    result['seconds'], result['analyzed'], result['vacuumed_pages'],
+                    sum(result['interrupted'].values()))
+    return result
+
+maintenance_scheduler = PeriodicTask('maintenance', MAINTENANCE_CHECK_INTERVAL if MAINTENANCE_INTERVAL > 0 else 0,
+                                     maintain_database).start()
+
+@app.route('/api/admin/maintenance', methods=['GET', 'POST'])
+def database_maintenance():
+    """
+    Show the size, free pages, vacuum and journal modes and last maintenance
+    run of the database, or run maintenance now with POST, whatever the
+    traffic.
+    
+    Returns:
+        JSON: The database status, or what the run did.
+    """
+    if not is_admin_request():
+        return jsonify({"message": "Forbidden"}), 403
+
+    if request.method == 'GET':
+        return jsonify(maintenance.status(DATABASE)), 200
+    try:
+        result = maintain_database(min_age=0)
+    except (sqlite3.Error, OSError) as e:
+        logger.exception("Maintenance failed")
+        return jsonify({"message": "Maintenance failed", "error": str(e)}), 500
+    if result is None:
+        return jsonify({"message": "Maintenance is already running"}), 409
+    return jsonify(result), 200
+
 if __name__ == '__main__':
     app.run(debug=True, host='127.0.0.1', port=5000)
@@ -0,0 +1,328 @@
+"""
+Online backups of the database into rotated, checksummed snapshots.
+
+A snapshot is copied with SQLite's online backup API
+(sqlite3.Connection.backup), a few pages at a time. Each step holds the
+database's shared lock only while it copies its pages and the copy sleeps
+between steps, so a writer waits at most about one step to commit instead
+of the whole copy.
+
+The price of releasing the lock is that a commit by another connection
+between two steps restarts the copy from the first page: the snapshot must
+be a single version of the database. A copy in small steps therefore only
+finishes if it takes less time than the gap between two writes. After
+every restart the step is doubled, so the copy finishes after at most
+log2(database pages / step) restarts; under a steady write load the last
+step covers most of the database and writers wait about as long as for a
+copy in one step. In WAL mode a reader does not block writers, so the
+database is copied in one step, inside a single read transaction.
+
+A snapshot is written to a temporary file in the backup directory, checked
+with PRAGMA quick_check, hashed, and renamed into place with its SHA-256 in
+a sidecar file in sha256sum format:
+
+    <directory>/database-20261019T031500Z.db
+    <directory>/database-20261019T031500Z.db.sha256
+
+The newest `keep` snapshots are kept. Backups into a directory are
+serialized across processes with a lock file, and a scheduled backup is
+skipped when another worker has just made one.
+
+Restoring verifies the checksum, then copies the snapshot over the live
+database with the backup API in the other direction: it takes the write
+lock and replaces the pages in one transaction, so other connections see
+either the old or the restored database. The application's in-memory
+caches do not notice a restore; restart it afterwards.
+
+From the command line:
+
+    python backup.py create --dir backups --keep 7
+    python backup.py list --dir backups
+    python backup.py verify backups/database-20261019T031500Z.db
+    python backup.py restore backups/database-20261019T031500Z.db
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from metrics import BACKUP_RESTARTS, BACKUP_STEP_DURATION
+
+try:
+    import fcntl
+except ImportError:  # Windows: backups are not serialized across processes
+    fcntl = None
+
+STEP_PAGES = 4096
+STEP_SLEEP = 0.01
+KEEP = 7
+TIMESTAMP = '%Y%m%dT%H%M%SZ'
+
+
+class _Restarted(Exception):
+    pass
+
+
+def copy(source, destination, pages=STEP_PAGES, sleep=STEP_SLEEP):
+    """
+    Copy a database with the online backup API, in steps.
+
+    Args:
+        source (sqlite3.Connection): The database to copy. Give it no busy timeout, so that a step
+            finding the database locked returns at once rather than waiting inside the step.
+        destination (sqlite3.Connection): The database to overwrite.
+        pages (int): Pages per step at first; doubled after every restart. -1 copies in one step.
+        sleep (float): Seconds to sleep between steps, and when the source is locked.
+
+    Returns:
+        dict: Pages copied, steps, restarts, the final step size, the longest step in milliseconds and the seconds taken.
+    """
+    start = time.perf_counter()
+    steps = restarts = 0
+    longest = 0.0
+    while True:
+        expected = None
+        step_start = time.perf_counter()
+
+        def progress(status, left, total):
+            nonlocal expected, step_start, steps, longest
+            if status in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED):
+                # A writer holds the lock: this step copied nothing, retry after the pause
+                time.sleep(sleep)
+                step_start = time.perf_counter()
+                return
+            elapsed = time.perf_counter() - step_start
+            BACKUP_STEP_DURATION.observe(elapsed)
+            steps += 1
+            longest = max(longest, elapsed)
+            # A commit by another connection sends the copy back to the first page
+            if expected is not None and left != expected:
+                raise _Restarted()
+            expected = max(left - pages, 0)
+            if left:
+                time.sleep(sleep)
+            step_start = time.perf_counter()
+
+        try:
+            source.backup(destination, pages=pages, progress=progress, sleep=0)
+            break
+        except _Restarted:
+            restarts += 1
+            BACKUP_RESTARTS.inc()
+            pages = pages * 2 if pages > 0 else pages
+    page_count = destination.execute('PRAGMA page_count').fetchone()[0]
+    return {'pages': page_count, 'steps': steps, 'restarts': restarts, 'step_pages': pages,
+            'longest_step_ms': round(longest * 1000, 1), 'seconds': round(time.perf_counter() - start, 2)}
+
+
+def copy_file(database, path, pages=STEP_PAGES, sleep=STEP_SLEEP):
+    """
+    Copy a live database into a new file, in steps (see copy()). A database
+    in WAL mode is copied in one step; the copy is in rollback journal mode.
+
+    Args:
+        database (str): The path of the database.
+        path (str): The file to write; it is not synced.
+        pages (int): Pages copied per step at first.
+        sleep (float): Seconds between steps.
+
+    Returns:
+        dict: The copy statistics (see copy()).
+    """
+    source = sqlite3.connect(f'file:{database}?mode=ro', uri=True, timeout=30)
+    target = sqlite3.connect(path)
+    try:
+        if source.execute('PRAGMA journal_mode').fetchone()[0] == 'wal':
+            pages = -1
+        # Locked steps return at once (see copy())
+        source.execute('PRAGMA busy_timeout = 0')
+        target.execute('PRAGMA synchronous = OFF')
+        stats = copy(source, target, pages, sleep)
+        # A copy of a WAL database is marked WAL too; the copy is a single file
+        target.execute('PRAGMA journal_mode = DELETE')
+        return stats
+    finally:
+        source.close()
+        target.close()
+
+
+def checksum(path):
+    """
+    The SHA-256 of a file, as hex.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def snapshots(directory, database):
+    """
+    The snapshots of a database in a backup directory, newest first.
+
+    Args:
+        directory (str): The backup directory.
+        database (str): The path of the database the snapshots were made of.
+
+    Returns:
+        list: Dicts with the path, the creation time (UTC, ISO 8601) and the size in bytes of each snapshot.
+    """
+    stem = os.path.splitext(os.path.basename(database))[0]
+    found = []
+    for path in glob.glob(os.path.join(glob.escape(directory), f'{glob.escape(stem)}-*.db')):
+        try:
+            created = datetime.strptime(os.path.basename(path)[len(stem) + 1:-3], TIMESTAMP)
+        except ValueError:
+            continue
+        found.append({'path': path, 'created': created.replace(tzinfo=timezone.utc).isoformat(),
+                      'bytes': os.path.getsize(path)})
+    return sorted(found, key=lambda snapshot: snapshot['created'], reverse=True)
+
+
+def verify(path):
+    """
+    Check a snapshot against the checksum in its sidecar file.
+
+    Raises:
+        ValueError: The sidecar is missing or the checksum does not match.
+    """
+    try:
+        with open(path + '.sha256') as sidecar:
+            expected = sidecar.read().split()[0]
+    except (OSError, IndexError):
+        raise ValueError(f'{path} has no checksum file') from None
+    actual = checksum(path)
+    if actual != expected:
+        raise ValueError(f'{path} is corrupt: SHA-256 {actual}, expected {expected}')
+    return actual
+
+
+def create(database, directory, keep=KEEP, pages=STEP_PAGES, sleep=STEP_SLEEP, min_age=0):
+    """
+    Back up a database into a new snapshot and delete the oldest beyond `keep`.
+
+    Args:
+        database (str): The path of the database.
+        directory (str): The backup directory; created if missing.
+        keep (int): The number of snapshots to keep.
+        pages (int): Pages copied per step at first (see copy()); a database in WAL mode is copied in one step.
+        sleep (float): Seconds between steps.
+        min_age (float): Skip the backup if the newest snapshot is younger than this many seconds.
+
+    Returns:
+        dict: The snapshot's path, size, SHA-256 and copy statistics, and the deleted snapshots,
+        or None if skipped because another backup is running or a recent snapshot exists.
+    """
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, 'backup.lock'), 'a') as lock:
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return None
+        existing = snapshots(directory, database)
+        if existing and min_age > 0:
+            age = time.time() - datetime.fromisoformat(existing[0]['created']).timestamp()
+            if age < min_age:
+                return None
+
+        stem = os.path.splitext(os.path.basename(database))[0]
+        now = datetime.now(timezone.utc)
+        path = os.path.join(directory, f'{stem}-{now.strftime(TIMESTAMP)}.db')
+        fd, temporary = tempfile.mkstemp(dir=directory, prefix=f'.{stem}-', suffix='.tmp')
+        os.close(fd)
+        try:
+            stats = copy_file(database, temporary, pages, sleep)
+            check = sqlite3.connect(temporary)
+            try:
+                problems = check.execute('PRAGMA quick_check').fetchall()
+            finally:
+                check.close()
+            if problems != [('ok',)]:
+                raise sqlite3.DatabaseError(f'quick_check failed on the snapshot: {problems[:5]}')
+            with open(temporary, 'rb+') as file:
+                os.fsync(file.fileno())
+            digest = checksum(temporary)
+            with open(path + '.sha256', 'w') as sidecar:
+                sidecar.write(f'{digest}  {os.path.basename(path)}\n')
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+        deleted = []
+        for old in snapshots(directory, database)[max(keep, 1):]:
+            for stale in (old['path'], old['path'] + '.sha256'):
+                if os.path.exists(stale):
+                    os.unlink(stale)
+            deleted.append(old['path'])
+    return {'path': path, 'bytes': os.path.getsize(path), 'sha256': digest, **stats, 'deleted': deleted}
+
+
+def restore(path, database):
+    """
+    Verify a snapshot and copy it over a database, in one transaction.
+
+    Args:
+        path (str): The snapshot.
+        database (str): The path of the database to overwrite.
+
+    Returns:
+        dict: The snapshot's SHA-256 and copy statistics.
+
+    Raises:
+        ValueError: The snapshot does not match its checksum.
+    """
+    digest = verify(path)
+    source = sqlite3.connect(f'file:{path}?mode=ro', uri=True, timeout=0)
+    target = sqlite3.connect(database, timeout=30)
+    try:
+        stats = copy(source, target, pages=-1)
+    finally:
+        source.close()
+        target.close()
+    return {'sha256': digest, **stats}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Online backups of the database into rotated snapshots.')
+    parser.add_argument('--database', default=os.getenv('DATABASE_PATH', 'database.db'))
+    commands = parser.add_subparsers(dest='command', required=True)
+    create_parser = commands.add_parser('create', help='back up the database now')
+    create_parser.add_argument('--keep', type=int, default=KEEP, help='snapshots to keep')
+    create_parser.add_argument('--pages', type=int, default=STEP_PAGES, help='pages copied per step')
+    create_parser.add_argument('--sleep', type=float, default=STEP_SLEEP, help='seconds between steps')
+    list_parser = commands.add_parser('list', help='list the snapshots, newest first')
+    for command in (create_parser, list_parser):
+        command.add_argument('--dir', default=os.getenv('BACKUP_DIR', 'backups'), help='the backup directory')
+    commands.add_parser('verify', help='check a snapshot against its checksum').add_argument('snapshot')
+    commands.add_parser('restore', help='verify a snapshot and copy it over the database').add_argument('snapshot')
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'create':
+            result = create(args.database, args.dir, args.keep, args.pages, args.sleep)
+            if result is None:
+                result = {'skipped': 'another backup is running'}
+        elif args.command == 'list':
+            result = snapshots(args.dir, args.database)
+        elif args.command == 'verify':
+            result = {'path': args.snapshot, 'sha256': verify(args.snapshot)}
+        else:
+            result = restore(args.snapshot, args.database)
+            print('Restored; restart the application to drop its cached data.', file=sys.stderr)
+    except (sqlite3.Error, OSError, ValueError) as e:
+        print(json.dumps({'error': str(e)}))
+        sys.exit(1)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
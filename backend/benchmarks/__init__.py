@@ -0,0 +1,5 @@
+"""
+Benchmark scripts for the Football Gladiators backend.
+
+Run them from the backend directory, e.g. `python -m benchmarks.bench_profile`.
+"""
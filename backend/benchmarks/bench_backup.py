@@ -0,0 +1,161 @@
+"""
+How long writers stall while the database is backed up (backup.py), on a
+multi-GB database (default 300k users x 100 favorites = 30M UserPlayers
+rows over 500k players).
+
+A writer process commits one favorite at a time, as the API does, at
+--write-rate commits per second, and records the latency of every commit
+(BEGIN IMMEDIATE to COMMIT, with the application's 30 s busy timeout).
+Its latencies are reported with no backup running, then during:
+
+- a backup in steps of --pages pages with --sleep seconds between steps,
+  restarting with a doubled step whenever the writer commits in between;
+- a backup in one step (pages=-1), which holds the lock for the whole copy;
+- the same paced backup with the writer at one commit every 5 seconds;
+- a backup of the database switched to WAL mode, copied in one step.
+
+Usage: python -m benchmarks.bench_backup [--users 300000] [--favorites 100] [--write-rate 20]
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.common import BACKEND_DIR, load_app, report
+from benchmarks.generate_data import player_rows
+
+
+def build_database(app, database, users, favorites, players):
+    """
+    Fill a new database with players, users and `favorites` favorites per user.
+    """
+    conn = sqlite3.connect(database)
+    conn.executemany('''
+        INSERT INTO Players (player_id, name, position, team, market_value, nationality, height, img,
+                             birthDate, wage, potential, rating, description, foot)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', player_rows(random.Random(42), players))
+    app.backfill_player_values(conn)
+    conn.executemany('INSERT INTO Users (user_id, username, password) VALUES (?, ?, ?)',
+                     ((user_id, f'user{user_id}', 'x') for user_id in range(1, users + 1)))
+    # Bulk load without the per-row counter triggers, then recount; 104729 is coprime with the
+    # player count in the default setup, so the favorites of a user are distinct
+    triggers = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'UserPlayers'").fetchall()
+    for (trigger,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'UserPlayers'").fetchall():
+        conn.execute(f'DROP TRIGGER {trigger}')
+    conn.execute('''
+        WITH RECURSIVE k(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM k WHERE i + 1 < ?)
+        INSERT OR IGNORE INTO UserPlayers (user_id, player_id)
+        SELECT Users.user_id, (Users.user_id * 7919 + k.i * 104729) % ? + 1 FROM Users, k
+        ORDER BY Users.user_id
+    ''', (favorites, players))
+    app.recount_favorites(conn.cursor())
+    for (sql,) in triggers:
+        conn.execute(sql)
+    conn.commit()
+    conn.close()
+
+
+def writer(database, rate, users, players):
+    """
+    Add and remove favorites at `rate` commits per second until SIGTERM, then print the commit latencies as JSON.
+    """
+    conn = sqlite3.connect(database, timeout=30, isolation_level=None)
+    rng = random.Random(os.getpid())
+    latencies = []
+    running = True
+
+    def stop(*_):
+        nonlocal running
+        running = False
+
+    signal.signal(signal.SIGTERM, stop)
+    print('ready', flush=True)
+    next_commit = time.perf_counter()
+    while running:
+        user_id, player_id = rng.randint(1, users), rng.randint(1, players)
+        start = time.perf_counter()
+        conn.execute('BEGIN IMMEDIATE')
+        if conn.execute('DELETE FROM UserPlayers WHERE user_id = ? AND player_id = ?', (user_id, player_id)).rowcount == 0:
+            conn.execute('INSERT INTO UserPlayers (user_id, player_id) VALUES (?, ?)', (user_id, player_id))
+        conn.execute('COMMIT')
+        latencies.append(time.perf_counter() - start)
+        next_commit += 1 / rate
+        time.sleep(max(0.0, next_commit - time.perf_counter()))
+    latencies.sort()
+
+    def percentile(p):
+        return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 1)
+
+    print(json.dumps({'commits': len(latencies), 'p50_ms': percentile(0.5), 'p99_ms': percentile(0.99),
+                      'max_ms': round(latencies[-1] * 1000, 1),
+                      'over_100ms': sum(latency > 0.1 for latency in latencies)}))
+
+
+def with_writer(args, rate, work):
+    """
+    Run work() while a writer process commits favorites; return its result and the writer's latencies.
+    """
+    process = subprocess.Popen([sys.executable, '-m', 'benchmarks.bench_backup', '--child', '--database', args.database,
+                                '--write-rate', str(rate), '--users', str(args.users), '--players', str(args.players)],
+                               cwd=BACKEND_DIR, stdout=subprocess.PIPE, text=True)
+    process.stdout.readline()
+    try:
+        result = work()
+    finally:
+        process.send_signal(signal.SIGTERM)
+        output, _ = process.communicate()
+    return result, json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=300_000)
+    parser.add_argument('--favorites', type=int, default=100, help='favorites per user')
+    parser.add_argument('--players', type=int, default=500_000)
+    parser.add_argument('--write-rate', type=float, default=20, help='writer commits per second')
+    parser.add_argument('--pages', type=int, default=4096, help='pages per backup step')
+    parser.add_argument('--sleep', type=float, default=0.01, help='seconds between backup steps')
+    parser.add_argument('--idle-seconds', type=float, default=10)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--database', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        writer(args.database, args.write_rate, args.users, args.players)
+        return
+
+    directory = tempfile.mkdtemp(prefix='bench-')
+    args.database = os.path.join(directory, 'database.db')
+    app = load_app(args.database)
+    app.orphan_sweeper.stop()
+    app.backup_scheduler.stop()
+    app.maintenance_scheduler.stop()
+    app.catalogue_pruner.stop()
+    import backup
+    build_database(app, args.database, args.users, args.favorites, args.players)
+    # Read the file once so every run starts from the same warm page cache
+    backup.checksum(args.database)
+
+    snapshots = os.path.join(directory, 'backups')
+    results = {'database_mb': round(os.path.getsize(args.database) / 1e6), 'write_rate': args.write_rate}
+    _, results['no_backup'] = with_writer(args, args.write_rate, lambda: time.sleep(args.idle_seconds))
+    for name, rate, pages in (('paced', args.write_rate, args.pages), ('one_step', args.write_rate, -1),
+                              ('paced_write_every_5s', 0.2, args.pages), ('wal', args.write_rate, args.pages)):
+        if name == 'wal':
+            sqlite3.connect(args.database).execute('PRAGMA journal_mode = WAL').fetchone()
+        created, writes = with_writer(args, rate, lambda: backup.create(args.database, snapshots, 1, pages, args.sleep))
+        results[name] = {'writer': writes, 'backup': {key: created[key] for key in
+                                                      ('seconds', 'steps', 'restarts', 'step_pages', 'longest_step_ms')}}
+    report('backup', results)
+    shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
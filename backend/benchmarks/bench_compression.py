@@ -0,0 +1,116 @@
+"""
+Measure bytes on the wire with response compression and the number of
+requests per page load with CORS preflight caching.
+
+The news feed and the SPARQL endpoint are replaced by synthetic payloads so
+the benchmark runs offline.
+
+Usage: python -m benchmarks.bench_compression [--players 1000]
+"""
+import argparse
+from unittest import mock
+
+from benchmarks.bench_profile import PLAYER_COLUMNS
+from benchmarks.common import load_app, make_player, report, time_calls
+
+ORIGIN = 'http://localhost:3000'
+
+# Requests the React app sends per page load: (method, path, needs a preflight)
+PAGE_LOADS = {
+    'favourites': [('GET', '/api/users/bench/players', False),
+                   ('GET', '/api/startingeleven/bench', False),
+                   ('POST', '/api/startingeleven/bench', True)],
+    'search': [('GET', '/search?q=player', False),
+               ('POST', '/api/users/bench/favorite_players', True),
+               ('DELETE', '/api/users/bench/favorite_players', True)],
+    'news': [('GET', '/api/news', False)],
+}
+
+
+def fake_response(payload):
+    response = mock.Mock(ok=True, status_code=200)
+    response.json.return_value = payload
+    return response
+
+
+def sparql_payload(count):
+    fields = ['player', 'name', 'team', 'position', 'height', 'marketValue', 'img', 'birth_date',
+              'wage', 'potential', 'rating', 'description', 'foot', 'nationality']
+    bindings = []
+    for i in range(count):
+        binding = {field: {'value': f'{field} {i}'} for field in fields}
+        binding['description']['value'] = 'A long scouting report on this player. ' * 40
+        bindings.append(binding)
+    return {'results': {'bindings': bindings}}
+
+
+def news_payload(count):
+    return [{'title': f'Headline {i}', 'url': f'https://news.example.org/{i}',
+             'img': f'https://news.example.org/{i}.jpg', 'description': 'Match report and reactions. ' * 10}
+            for i in range(count)]
+
+
+def preflights(page_loads, max_age):
+    """Count OPTIONS requests for a sequence of page loads, one second apart."""
+    cache = {}
+    count = 0
+    for now, page in enumerate(page_loads):
+        for method, path, preflighted in PAGE_LOADS[page]:
+            if not preflighted:
+                continue
+            key = (method, path)
+            if cache.get(key, -1) < now:
+                count += 1
+                cache[key] = now + max_age
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--players', type=int, default=1000)
+    args = parser.parse_args()
+
+    app = load_app()
+    conn = app.get_db_connection()
+    conn.executemany(f'INSERT INTO Players ({PLAYER_COLUMNS}) VALUES ({", ".join("?" * 13)})',
+                     (make_player(i) for i in range(args.players)))
+    conn.commit()
+    conn.close()
+    client = app.app.test_client()
+
+    endpoints = {'/api/players': None, '/search?q=player': sparql_payload(10), '/api/news': news_payload(50)}
+    wire = {}
+    with mock.patch.object(app.requests, 'post', return_value=fake_response(endpoints['/search?q=player'])), \
+            mock.patch.object(app.requests, 'get', return_value=fake_response(endpoints['/api/news'])):
+        for path in endpoints:
+            sizes = {}
+            for encoding in ('identity', 'gzip', 'br'):
+                response = client.get(path, headers={'Accept-Encoding': encoding})
+                sizes[encoding] = {'bytes': len(response.data),
+                                   'content_encoding': response.headers.get('Content-Encoding', 'identity')}
+            wire[path] = sizes
+
+        news_gzip = time_calls(lambda: client.get('/api/news', headers={'Accept-Encoding': 'gzip'}), 50)
+
+    preflight = client.options('/api/startingeleven/bench', headers={
+        'Origin': ORIGIN, 'Access-Control-Request-Method': 'POST',
+        'Access-Control-Request-Headers': 'Content-Type'})
+    max_age = int(preflight.headers.get('Access-Control-Max-Age', 0))
+    session = ['favourites', 'search', 'news', 'favourites', 'search', 'favourites'] * 5
+    requests_without_cache = sum(len(PAGE_LOADS[page]) for page in session) + preflights(session, 0)
+    requests_with_cache = sum(len(PAGE_LOADS[page]) for page in session) + preflights(session, max_age)
+
+    report('compression_and_preflight', {
+        'bytes_on_wire': wire,
+        'news_gzip_cached_request': news_gzip,
+        'compressed_body_cache': {'hits': app.CACHE_REQUESTS.value('compressed_body', 'hit'),
+                                  'misses': app.CACHE_REQUESTS.value('compressed_body', 'miss')},
+        'access_control_max_age': max_age,
+        'page_loads': len(session),
+        'requests_without_preflight_cache': requests_without_cache,
+        'requests_with_preflight_cache': requests_with_cache,
+    })
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""
+Throughput and peak memory of the bulk export (export.py) of users'
+favorites joined with Users and Players, on a large UserPlayers table
+(default 100k users x 100 favorites = 10M rows over 500k players).
+
+Every run happens in a child process, so its peak RSS (ru_maxrss) is its
+own: the CLI as NDJSON, CSV and gzipped CSV, the admin endpoint streaming
+gzipped NDJSON, and, for comparison, the rows fetched into memory at once
+with fetchall() and serialized, on the first --fetchall-rows rows only.
+
+Usage: python -m benchmarks.bench_export [--users 100000] [--favorites 100] [--players 500000]
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.common import BACKEND_DIR, load_app, report
+from benchmarks.generate_data import player_rows
+
+
+def child(mode, database, rows_limit):
+    """
+    Run one export to /dev/null and print rows/sec and peak RSS as JSON.
+    """
+    sys.path.insert(0, BACKEND_DIR)
+    import export
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    written = 0
+    if mode == 'endpoint':
+        os.environ.update(DATABASE_PATH=database, ORPHAN_SWEEP_INTERVAL='0', LOG_LEVEL='ERROR')
+        import app
+        baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.perf_counter()
+        response = app.app.test_client().get('/api/admin/export/favorites?gzip=1', buffered=False)
+        for chunk in response.response:
+            written += len(chunk)
+        response.close()
+        rows = sqlite3.connect(database).execute('SELECT COUNT(*) FROM UserPlayers').fetchone()[0]
+    elif mode == 'fetchall':
+        conn = sqlite3.connect(database)
+        columns = export.export_columns('favorites')
+        select = ', '.join(['UserPlayers.user_id', 'Users.username', *(f'Players.{column}' for column in export.PLAYER_COLUMNS)])
+        data = conn.execute(f'''
+            SELECT {select} FROM UserPlayers JOIN Users ON Users.user_id = UserPlayers.user_id
+            JOIN Players ON Players.player_id = UserPlayers.player_id LIMIT ?
+        ''', (rows_limit,)).fetchall()
+        body = json.dumps([dict(zip(columns, row)) for row in data]).encode('utf-8')
+        written, rows = len(body), len(data)
+    else:
+        file_format, compress = mode.split('-')[0], mode.endswith('-gzip')
+        conn = sqlite3.connect(f'file:{database}?mode=ro', uri=True)
+        with open(os.devnull, 'wb') as output:
+            for chunk in export.stream(conn, 'favorites', file_format, compress):
+                written += len(chunk)
+                output.write(chunk)
+        rows = conn.execute('SELECT COUNT(*) FROM UserPlayers').fetchone()[0]
+    seconds = time.perf_counter() - start
+    print(json.dumps({'rows': rows, 'seconds': round(seconds, 1), 'rows_per_sec': round(rows / seconds),
+                      'output_mb': round(written / 1e6, 1), 'peak_rss_mb': round(resource.getrusage(
+                          resource.RUSAGE_SELF).ru_maxrss / 1024), 'baseline_rss_mb': round(baseline / 1024)}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=100_000)
+    parser.add_argument('--favorites', type=int, default=100, help='favorites per user')
+    parser.add_argument('--players', type=int, default=500_000)
+    parser.add_argument('--fetchall-rows', type=int, default=1_000_000)
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--database', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.child, args.database, args.fetchall_rows)
+        return
+
+    database = os.path.join(tempfile.mkdtemp(prefix='bench-'), 'database.db')
+    app = load_app(database)
+    app.orphan_sweeper.stop()
+    conn = sqlite3.connect(database)
+    conn.executemany('''
+        INSERT INTO Players (player_id, name, position, team, market_value, nationality, height, img,
+                             birthDate, wage, potential, rating, description, foot)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', player_rows(random.Random(42), args.players))
+    app.backfill_player_values(conn)
+    conn.executemany('INSERT INTO Users (user_id, username, password) VALUES (?, ?, ?)',
+                     ((user_id, f'user{user_id}', 'x') for user_id in range(1, args.users + 1)))
+    # Bulk load without the per-row counter triggers; 104729 is coprime with the player count
+    # in the default setup, so the favorites of a user are distinct
+    for (trigger,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'UserPlayers'").fetchall():
+        conn.execute(f'DROP TRIGGER {trigger}')
+    conn.execute('''
+        WITH RECURSIVE k(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM k WHERE i + 1 < ?)
+        INSERT OR IGNORE INTO UserPlayers (user_id, player_id)
+        SELECT Users.user_id, (Users.user_id * 7919 + k.i * 104729) % ? + 1 FROM Users, k
+        ORDER BY Users.user_id
+    ''', (args.favorites, args.players))
+    conn.commit()
+    rows = conn.execute('SELECT COUNT(*) FROM UserPlayers').fetchone()[0]
+    conn.close()
+
+    results = {}
+    for mode in ('ndjson', 'csv', 'csv-gzip', 'endpoint', 'fetchall'):
+        output = subprocess.run([sys.executable, '-m', 'benchmarks.bench_export', '--child', mode, '--database', database,
+                                 '--fetchall-rows', str(args.fetchall_rows)],
+                                cwd=BACKEND_DIR, check=True, capture_output=True, text=True).stdout
+        results[mode] = json.loads(output.strip().splitlines()[-1])
+    report('export', {'favorites_rows': rows, 'runs': results})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+The player image proxy (GET /img/<key>) against a local stub image host
+with injected latency: a /search through the stub SPARQL endpoint hands
+out thumbnail links, which are requested cold (fetch, store and make the
+thumbnail), warm (served from disk) and conditionally (304). Also checks
+that concurrent cold requests for one image fetch it from the host once,
+and compares the bytes sent with hotlinking the originals.
+
+Usage: python -m benchmarks.bench_images [--latency-ms 50] [--repeat 200]
+"""
+import argparse
+import os
+import threading
+
+from benchmarks.common import load_app, report, time_calls
+from benchmarks.stubs import Latency, image_server, sparql_server, synthetic_players
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--latency-ms', type=float, default=50.0, help='latency of the image host')
+    parser.add_argument('--concurrency', type=int, default=8, help='concurrent cold requests for one image')
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    images = image_server(Latency(args.latency_ms))
+    sparql = sparql_server(synthetic_players(2000, image_host=images.url))
+    os.environ['SPARQL_ENDPOINT'] = f'{sparql.url}/repositories/kd_repo_project'
+    # The stub image host listens on the loopback address, which the proxy refuses by default
+    os.environ.update(IMAGE_HOSTS='127.0.0.1', IMAGE_ALLOW_PRIVATE='1')
+    app = load_app()
+    client = app.app.test_client()
+
+    players = client.get('/search?q=a').get_json()
+    links = [player['thumbnail'] for player in players]
+    originals = [player['img'] for player in players]
+
+    def get(link, status=200, **headers):
+        response = client.get(link, headers=headers)
+        assert response.status_code == status, (link, response.status_code)
+        body = response.get_data()
+        response.close()
+        return response, body
+
+    cold = iter(links)
+    cold_ms = time_calls(lambda: get(next(cold)), len(links))
+    thumbnail, body = get(links[0])
+    etag = thumbnail.headers['ETag']
+    warm = iter(links * (args.repeat // len(links) + 1))
+    warm_ms = time_calls(lambda: get(next(warm)), args.repeat)
+    not_modified_ms = time_calls(lambda: get(links[0], 304, if_none_match=etag), args.repeat)
+
+    # One image requested by several clients at once, before it is cached
+    concurrent = synthetic_players(1, seed=7, image_host=images.url)[0]['img'].replace('/0.png', '/99999.png')
+    app.image_proxy.ensure_registered([concurrent])
+    threads = [threading.Thread(target=get, args=(app.image_proxy.link(concurrent),))
+               for _ in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    original_bytes = sum(len(get(app.image_proxy.link(url, thumbnail=False))[1]) for url in originals)
+    thumbnail_bytes = sum(len(get(link)[1]) for link in links)
+    upstream = {path: count for path, count in images.requests.items()}
+    images.stop()
+    sparql.stop()
+
+    report('images', {
+        'image_host_latency_ms': args.latency_ms,
+        'images': len(links),
+        'cold_thumbnail_ms': cold_ms,
+        'warm_thumbnail_ms': warm_ms,
+        'not_modified_ms': not_modified_ms,
+        'cache_control': thumbnail.headers['Cache-Control'],
+        'upstream_fetches_per_image': max(upstream.values()),
+        'concurrent_cold_requests': args.concurrency,
+        'concurrent_upstream_fetches': upstream['/players/99999.png'],
+        'original_bytes': original_bytes,
+        'thumbnail_bytes': thumbnail_bytes,
+    })
+
+
+if __name__ == '__main__':
+    main()
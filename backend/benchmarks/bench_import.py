@@ -0,0 +1,163 @@
+"""
+Throughput of the bulk import of favorites (importer.py) against adding
+them one by one through POST /api/users/<username>/favorite_players.
+
+The input is written with the export encoder (export.py), so it has the
+columns of a favorites export: by default 50k users with about 20
+favorites each (1M rows), drawn with Zipf popularity from a 50k-player
+catalogue, with 2% of the rows naming players not in the catalogue and
+0.1% of them naming unknown users. Every run imports into a fresh copy of
+the same database:
+
+- the CLI, from NDJSON and from gzipped CSV;
+- the CLI killed halfway and run again with its checkpoint;
+- the API, on the first --api-rows rows.
+
+After each import the favorite counts are checked against a full recount.
+
+Usage: python -m benchmarks.bench_import [--users 50000] [--favorites 20] [--players 50000]
+"""
+import argparse
+import os
+import random
+import shutil
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.common import BACKEND_DIR, load_app, report
+from benchmarks.generate_data import ZipfSampler, favorite_counts, player_rows, user_rows
+
+
+def write_input(path, columns, rows, file_format, compress):
+    import export
+    with open(path, 'wb') as output:
+        chunks = export.encode(columns, (rows[start:start + 10_000] for start in range(0, len(rows), 10_000)),
+                               file_format)
+        for chunk in export.gzipped(chunks) if compress else chunks:
+            output.write(chunk)
+
+
+def counters(database):
+    """
+    The counters maintained on import, and whether they match a recount.
+    """
+    conn = sqlite3.connect(database)
+    favorites = conn.execute('SELECT COUNT(*) FROM UserPlayers').fetchone()[0]
+    wrong_counts = conn.execute('''
+        SELECT COUNT(*) FROM Players
+        WHERE favorite_count != (SELECT COUNT(*) FROM UserPlayers WHERE UserPlayers.player_id = Players.player_id)
+    ''').fetchone()[0]
+    groups = conn.execute("SELECT SUM(favorites) FROM FavoriteCounts WHERE dimension = 'team'").fetchone()[0]
+    state = conn.execute('''
+        SELECT COUNT(*), TOTAL(favorite_count), TOTAL(favorite_count * player_id) FROM Players
+    ''').fetchone()
+    conn.close()
+    return {'favorites': favorites, 'consistent': wrong_counts == 0 and groups == favorites}, state
+
+
+def run_cli(database, path, checkpoint=None, kill_after=None):
+    command = [sys.executable, 'importer.py', path, '--database', database]
+    if checkpoint:
+        command += ['--checkpoint', checkpoint]
+    start = time.perf_counter()
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, stdout=subprocess.PIPE, text=True)
+    if kill_after is not None:
+        time.sleep(kill_after)
+        process.send_signal(signal.SIGKILL)
+    output, _ = process.communicate()
+    return time.perf_counter() - start, output.strip().splitlines()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=50_000)
+    parser.add_argument('--favorites', type=int, default=20, help='mean favorites per user')
+    parser.add_argument('--players', type=int, default=50_000)
+    parser.add_argument('--new-players', type=float, default=0.02, help='share of rows naming players not in the catalogue')
+    parser.add_argument('--unknown-users', type=float, default=0.001, help='share of rows naming unknown users')
+    parser.add_argument('--api-rows', type=int, default=5_000)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='bench-')
+    database = os.path.join(directory, 'database.db')
+    app = load_app(database)
+    app.orphan_sweeper.stop()
+    import export
+    conn = sqlite3.connect(database)
+    conn.executemany('''
+        INSERT INTO Players (player_id, name, position, team, market_value, nationality, height, img,
+                             birthDate, wage, potential, rating, description, foot)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', player_rows(random.Random(42), args.players))
+    app.backfill_player_values(conn)
+    app.register_player_images(conn)
+    conn.executemany('INSERT INTO Users (user_id, username, password) VALUES (?, ?, ?)', user_rows(args.users))
+    conn.commit()
+
+    # Input rows in the export's column order; new players come from a pool past the catalogue
+    columns = export.export_columns('favorites')
+    select = ', '.join(f'Players.{column}' for column in export.PLAYER_COLUMNS)
+    catalogue = {row[0]: row for row in conn.execute(f'SELECT {select} FROM Players')}
+    conn.close()
+    new_players = {player_id: (None, name, position, team, nationality, foot, birth_date, height, market_value, wage,
+                               rating, potential, img, None, None, None, None, None, None, None)
+                   for (player_id, name, position, team, market_value, nationality, height, img, birth_date, wage,
+                        potential, rating, _, foot) in player_rows(random.Random(43), args.players // 5)}
+    rng = random.Random(7)
+    sampler = ZipfSampler(rng, catalogue, 1.1)
+    new_sampler = ZipfSampler(rng, new_players, 1.1)
+    width = len(str(args.users))
+    rows = []
+    for user_id, k in enumerate(favorite_counts(rng, args.users, args.users * args.favorites), start=1):
+        for player_id in sampler.distinct(k):
+            username = f'user{user_id:0{width}d}' if rng.random() >= args.unknown_users else f'ghost{user_id}'
+            player = catalogue[player_id] if rng.random() >= args.new_players else new_players[new_sampler.draw()]
+            rows.append((user_id, username, *player))
+    ndjson, csv_gz = os.path.join(directory, 'favorites.ndjson'), os.path.join(directory, 'favorites.csv.gz')
+    write_input(ndjson, columns, rows, 'ndjson', False)
+    write_input(csv_gz, columns, rows, 'csv', True)
+
+    results = {'rows': len(rows), 'input_mb': {'ndjson': round(os.path.getsize(ndjson) / 1e6, 1),
+                                               'csv_gz': round(os.path.getsize(csv_gz) / 1e6, 1)}}
+    expected = None
+    for name, path in (('ndjson', ndjson), ('csv_gz', csv_gz)):
+        target = os.path.join(directory, f'{name}.db')
+        shutil.copy(database, target)
+        seconds, output = run_cli(target, path)
+        check, state = counters(target)
+        expected = expected or state
+        results[name] = {'seconds': round(seconds, 1), 'rows_per_sec': round(len(rows) / seconds), **check,
+                         'summary': output[-1]}
+
+    # Kill the import halfway through, then resume it from its checkpoint
+    target, checkpoint = os.path.join(directory, 'resumed.db'), os.path.join(directory, 'checkpoint.json')
+    shutil.copy(database, target)
+    _, killed = run_cli(target, ndjson, checkpoint, kill_after=results['ndjson']['seconds'] / 2)
+    seconds, output = run_cli(target, ndjson, checkpoint)
+    check, state = counters(target)
+    results['resumed'] = {'batches_before_kill': len(killed), 'seconds_after_resume': round(seconds, 1), **check,
+                          'same_state_as_uninterrupted': state == expected, 'summary': output[-1]}
+
+    # One request per favorite, as the frontend adds them
+    os.environ['DATABASE_PATH'] = target = os.path.join(directory, 'api.db')
+    shutil.copy(database, target)
+    app.DATABASE = target
+    client = app.app.test_client()
+    keys = ('name', 'position', 'team', 'nationality', 'foot', 'birthDate', 'height', 'market_value', 'wage',
+            'rating', 'potential', 'img')
+    start = time.perf_counter()
+    for row in rows[:args.api_rows]:
+        response = client.post(f'/api/users/{row[1]}/favorite_players', json=dict(zip(keys, row[3:15])))
+        assert response.status_code in (200, 400, 404), response.get_json()
+    seconds = time.perf_counter() - start
+    results['api'] = {'rows': args.api_rows, 'rows_per_sec': round(args.api_rows / seconds)}
+    report('import', results)
+    shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Serialization microbenchmark over Players rows: sqlite3.Row -> dict ->
+stdlib json (the previous path) against tuples with precomputed column
+names through FastJSONProvider, with and without orjson.
+
+Usage: python -m benchmarks.bench_json [--rows 100000] [--repeat 5]
+"""
+import argparse
+import json
+
+import json_provider
+from benchmarks.bench_profile import PLAYER_COLUMNS
+from benchmarks.common import load_app, make_player, report, time_calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    app = load_app()
+    conn = app.get_db_connection()
+    conn.executemany(f'INSERT INTO Players ({PLAYER_COLUMNS}) VALUES ({", ".join("?" * 13)})',
+                     (make_player(i) for i in range(args.rows)))
+    conn.commit()
+
+    rows = conn.execute('SELECT * FROM Players').fetchall()
+    row_list = json_provider.RowList.fetch(conn.cursor(), 'SELECT * FROM Players')
+    provider = app.app.json
+    orjson = json_provider.orjson
+
+    def stdlib_dicts():
+        json.dumps([dict(row) for row in rows], separators=(',', ':'))
+
+    def provider_rows():
+        provider.dumpb(row_list)
+
+    def provider_rows_stdlib():
+        json_provider.orjson = None
+        try:
+            provider.dumpb(row_list)
+        finally:
+            json_provider.orjson = orjson
+
+    def end_to_end_before():
+        json.dumps([dict(row) for row in conn.execute('SELECT * FROM Players').fetchall()], separators=(',', ':'))
+
+    def end_to_end_after():
+        provider.dumpb(json_provider.RowList.fetch(conn.cursor(), 'SELECT * FROM Players'))
+
+    results = {
+        'rows': args.rows,
+        'orjson_available': orjson is not None,
+        'serialize_row_dicts_stdlib': time_calls(stdlib_dicts, args.repeat),
+        'serialize_rowlist_provider': time_calls(provider_rows, args.repeat),
+        'serialize_rowlist_provider_stdlib_fallback': time_calls(provider_rows_stdlib, args.repeat),
+        'fetch_and_serialize_before': time_calls(end_to_end_before, args.repeat),
+        'fetch_and_serialize_after': time_calls(end_to_end_after, args.repeat),
+    }
+    conn.close()
+    report('json_serialization', results)
+
+
+if __name__ == '__main__':
+    main()
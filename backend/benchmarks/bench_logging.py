@@ -0,0 +1,64 @@
+"""
+Throughput of the favorites endpoint under different logging setups:
+synchronous DEBUG logging to a stream (the previous global basicConfig)
+against the queue-based pipeline at DEBUG and at INFO. Also reports the
+cost of a single debug call on the request thread.
+
+Usage: python -m benchmarks.bench_logging [--requests 2000]
+"""
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+import logging_setup
+from benchmarks.common import load_app, report, time_calls
+
+
+def favorites_throughput(client, prefix, count):
+    # A fresh user every 50 favorites keeps the per-user documents small and comparable
+    for batch in range(0, count, 50):
+        client.post('/api/register', json={'username': f'{prefix}-{batch}', 'password': 'bench'})
+    start = time.perf_counter()
+    for i in range(count):
+        response = client.post(f'/api/users/{prefix}-{i - i % 50}/favorite_players', json={
+            'name': f'{prefix} {i}', 'team': 'Team', 'position': 'Forward',
+            'description': 'A long description of the player. ' * 20})
+        assert response.status_code == 200
+    elapsed = time.perf_counter() - start
+    return {'requests': count, 'seconds': round(elapsed, 3), 'requests_per_sec': round(count / elapsed, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+
+    app = load_app()
+    client = app.app.test_client()
+    log_file = open(os.path.join(tempfile.mkdtemp(prefix='bench-'), 'bench.log'), 'w')
+    logger = logging.getLogger('app')
+    results = {}
+
+    logging.basicConfig(level=logging.DEBUG, stream=log_file, force=True)
+    results['sync_debug'] = favorites_throughput(client, 'sync', args.requests)
+    results['sync_debug_call'] = time_calls(lambda: logger.debug('Received data for removal: %s', {'name': 'x'}), 10000)
+
+    os.environ['LOG_LEVEL'] = 'DEBUG'
+    logging_setup.configure_logging(log_file)
+    results['queue_debug'] = favorites_throughput(client, 'queue', args.requests)
+    results['queue_debug_call'] = time_calls(lambda: logger.debug('Received data for removal: %s', {'name': 'x'}), 10000)
+
+    os.environ['LOG_LEVEL'] = 'INFO'
+    logging_setup.configure_logging(log_file)
+    results['queue_info'] = favorites_throughput(client, 'info', args.requests)
+    results['queue_info_debug_call'] = time_calls(lambda: logger.debug('Received data for removal: %s', {'name': 'x'}), 10000)
+    logging_setup.stop_logging()
+    log_file.close()
+
+    report('logging_pipeline', results)
+
+
+if __name__ == '__main__':
+    main()
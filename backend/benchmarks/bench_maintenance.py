@@ -0,0 +1,98 @@
+"""
+How long writers stall while the database is maintained (maintenance.py),
+on a large database (default 100k users x 100 favorites = 10M UserPlayers
+rows over 500k players) after the favorites of the first --churn of the
+users were deleted, which leaves free pages and a changed row count.
+
+A writer process commits one favorite at a time at --write-rate commits per
+second (see bench_backup.py). Its latencies are reported with no
+maintenance running, then, on two copies of the same database, during:
+
+- a maintenance run within its budgets (maintenance.run());
+- the same work without budgets: a full ANALYZE and one
+  PRAGMA incremental_vacuum freeing every free page.
+
+Usage: python -m benchmarks.bench_maintenance [--users 100000] [--favorites 100] [--churn 0.2]
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+
+from benchmarks.bench_backup import build_database, with_writer
+from benchmarks.common import load_app, report
+
+
+def delete_favorites(app, database, users):
+    """
+    Delete the favorites of users 1 to `users` in bulk, then recount.
+    """
+    conn = sqlite3.connect(database)
+    triggers = conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'UserPlayers'").fetchall()
+    for name, _ in triggers:
+        conn.execute(f'DROP TRIGGER {name}')
+    conn.execute('DELETE FROM UserPlayers WHERE user_id <= ?', (users,))
+    app.recount_favorites(conn.cursor())
+    for _, sql in triggers:
+        conn.execute(sql)
+    conn.commit()
+    conn.close()
+
+
+def unbudgeted(database):
+    """
+    Analyze every table in full and free every free page, in two statements.
+    """
+    start = time.perf_counter()
+    conn = sqlite3.connect(database, timeout=30, isolation_level=None)
+    free = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    conn.execute('ANALYZE')
+    conn.executescript('PRAGMA incremental_vacuum')
+    conn.close()
+    return {'vacuumed_pages': free, 'seconds': round(time.perf_counter() - start, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=100_000)
+    parser.add_argument('--favorites', type=int, default=100, help='favorites per user')
+    parser.add_argument('--players', type=int, default=500_000)
+    parser.add_argument('--churn', type=float, default=0.2, help='fraction of the users whose favorites are deleted')
+    parser.add_argument('--write-rate', type=float, default=20, help='writer commits per second')
+    parser.add_argument('--idle-seconds', type=float, default=10)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='bench-')
+    args.database = os.path.join(directory, 'database.db')
+    app = load_app(args.database)
+    for task in (app.orphan_sweeper, app.backup_scheduler, app.maintenance_scheduler, app.catalogue_pruner):
+        task.stop()
+    import maintenance
+    build_database(app, args.database, args.users, args.favorites, args.players)
+    # Record the row counts, as a first maintenance run would, before the churn
+    maintenance.run(args.database, budget=60, statement_budget=60)
+    delete_favorites(app, args.database, int(args.users * args.churn))
+    before = maintenance.file_stats(args.database)
+    copy = os.path.join(directory, 'copy.db')
+    shutil.copy(args.database, copy)
+    shutil.copy(args.database + '.maintenance.lock', copy + '.maintenance.lock')
+
+    results = {'database_mb': round(before['bytes'] / 1e6), 'freelist_pages': before['freelist_pages'],
+               'write_rate': args.write_rate}
+    _, results['no_maintenance'] = with_writer(args, args.write_rate, lambda: time.sleep(args.idle_seconds))
+    run, writes = with_writer(args, args.write_rate, lambda: maintenance.run(args.database))
+    results['budgeted'] = {'writer': writes, 'maintenance': {
+        key: run[key] for key in ('analyzed', 'vacuumed_pages', 'interrupted', 'statements',
+                                  'longest_statement_ms', 'seconds', 'freelist_pages')}}
+    results['budgeted']['maintenance']['mb_after'] = round(run['bytes'] / 1e6)
+    args.database = copy
+    run, writes = with_writer(args, args.write_rate, lambda: unbudgeted(copy))
+    results['unbudgeted'] = {'writer': writes, 'maintenance': {**run, 'mb_after': round(os.path.getsize(copy) / 1e6)}}
+    report('maintenance', results)
+    shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+Overhead of metrics recording: single histogram observations and counter
+increments, concurrent recording from several threads, the full per-request
+hook pair, and rendering /metrics.
+
+Usage: python -m benchmarks.bench_metrics [--calls 200000] [--threads 8]
+"""
+import argparse
+import threading
+import time
+
+from benchmarks.common import load_app, report
+
+import metrics
+
+
+def per_call_us(func, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        func()
+    return round((time.perf_counter() - start) / calls * 1e6, 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--calls', type=int, default=200000)
+    parser.add_argument('--threads', type=int, default=8)
+    args = parser.parse_args()
+
+    app = load_app()
+    registry = metrics.Registry()
+    histogram = registry.histogram('bench_seconds', 'Benchmark histogram.', ('endpoint', 'method'))
+    counter = registry.counter('bench_total', 'Benchmark counter.', ('endpoint', 'method', 'status'))
+
+    results = {
+        'histogram_observe_us': per_call_us(lambda: histogram.observe(0.0042, 'get_user_players', 'GET'), args.calls),
+        'counter_inc_us': per_call_us(lambda: counter.inc('get_user_players', 'GET', 200), args.calls),
+    }
+
+    def timed_block():
+        with histogram.time('get_user_players', 'GET'):
+            pass
+    results['histogram_time_context_us'] = per_call_us(timed_block, args.calls)
+
+    def record_request():
+        histogram.observe(time.perf_counter() - time.perf_counter(), 'get_user_players', 'GET')
+        counter.inc('get_user_players', 'GET', 200)
+
+    def worker():
+        for _ in range(args.calls // args.threads):
+            record_request()
+
+    threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    results['concurrent_request_recording_us'] = round(elapsed / (args.calls // args.threads * args.threads) * 1e6, 3)
+    results['total_observations'] = sum(histogram.collect()[('get_user_players', 'GET')][:-1])
+
+    with app.app.test_request_context('/api/users/bench/players'):
+        response = app.app.response_class(status=200)
+
+        def hooks():
+            app.start_request_timer()
+            app.record_request_metrics(response)
+        results['request_hooks_us'] = per_call_us(hooks, args.calls // 10)
+
+    client = app.app.test_client()
+    for _ in range(100):
+        client.get('/')
+    start = time.perf_counter()
+    body = client.get('/metrics').data
+    results['render_metrics_ms'] = round((time.perf_counter() - start) * 1000, 3)
+    results['render_metrics_bytes'] = len(body)
+
+    report('metrics_overhead', results)
+
+
+if __name__ == '__main__':
+    main()
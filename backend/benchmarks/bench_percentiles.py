@@ -0,0 +1,95 @@
+"""
+Latency of attribute percentiles (GET /api/players/<player_id>/percentiles)
+over a large local catalogue: binary searches in the catalogue snapshot's
+sorted columns against the same percentiles as SQL COUNTs over Players,
+plus the extra cost of the sorted per-position columns in a snapshot build.
+
+Usage: python -m benchmarks.bench_percentiles [--players 500000] [--repeat 200]
+"""
+import argparse
+import random
+import time
+
+from benchmarks.common import load_app, report, time_calls
+from benchmarks.generate_data import player_rows
+
+
+def sql_percentiles(cursor, player_id, numeric):
+    """
+    The percentiles of a player with two COUNTs per attribute and scope.
+    """
+    cursor.execute(f"SELECT position, {', '.join(column for _, column in numeric)} FROM Players WHERE player_id = ?",
+                   (player_id,))
+    player = cursor.fetchone()
+    percentiles = {}
+    for attribute, column in numeric:
+        value = player[column]
+        scopes = {}
+        for scope, where, values in (('overall', '', ()),
+                                     ('position', 'AND COALESCE(position, ?) = COALESCE(?, ?)',
+                                      ('Unknown', player['position'], 'Unknown'))):
+            cursor.execute(f'''
+                SELECT SUM({column} < ?), SUM({column} = ?), COUNT({column}) FROM Players
+                WHERE {column} IS NOT NULL {where}
+            ''', (value, value, *values))
+            below, equal, known = cursor.fetchone()
+            scopes[scope] = None if value is None or not known else round(100 * (below + equal / 2) / known, 1)
+        percentiles[attribute] = {'value': value, **scopes}
+    return percentiles
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--players', type=int, default=500_000)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    app = load_app()
+    conn = app.get_db_connection()
+    conn.executemany('''
+        INSERT INTO Players (player_id, name, position, team, market_value, nationality, height, img,
+                             birthDate, wage, potential, rating, description, foot)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', player_rows(random.Random(42), args.players))
+    app.backfill_player_values(conn)
+    conn.commit()
+
+    start = time.perf_counter()
+    snapshot = app.catalogue.snapshot()
+    build_ms = (time.perf_counter() - start) * 1000
+    from catalogue import GroupedColumn
+    start = time.perf_counter()
+    positions = snapshot.facets['position']
+    for column in snapshot.numbers.values():
+        GroupedColumn(column, positions.codes, len(positions.values))
+    grouped_ms = (time.perf_counter() - start) * 1000
+
+    client = app.app.test_client()
+    cursor = conn.cursor()
+    rng = random.Random(7)
+    player_ids = [rng.randint(1, args.players) for _ in range(args.repeat)]
+    for player_id in player_ids[:20]:
+        body = client.get(f'/api/players/{player_id}/percentiles').get_json()
+        assert body['percentiles'] == sql_percentiles(cursor, player_id, app.NUMERIC), player_id
+
+    queries = iter(player_ids * 2)
+
+    def request():
+        response = client.get(f'/api/players/{next(queries)}/percentiles')
+        assert response.status_code == 200
+
+    sql_queries = iter(player_ids)
+    result = {
+        'players': args.players,
+        'catalogue_build_ms': round(build_ms, 1),
+        'position_columns_build_ms': round(grouped_ms, 1),
+        'endpoint_ms': time_calls(request, args.repeat),
+        'sql_ms': time_calls(lambda: sql_percentiles(cursor, next(sql_queries), app.NUMERIC),
+                             max(1, args.repeat // 20)),
+    }
+    conn.close()
+    report('percentiles', result)
+
+
+if __name__ == '__main__':
+    main()
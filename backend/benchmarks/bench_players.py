@@ -0,0 +1,82 @@
+"""
+Latency of player lookups by ID (GET /api/players/<id> and
+/api/players?ids=...) over a large catalogue: a new connection and an IN
+query per request, as players_by_id() did before, against the pooled
+connection with the read-through player cache, cold (every ID missing)
+and warm (every ID cached).
+
+Usage: python -m benchmarks.bench_players [--players 500000] [--ids 20] [--repeat 500]
+"""
+import argparse
+import random
+
+from benchmarks.common import load_app, report, time_calls
+from benchmarks.generate_data import player_rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--players', type=int, default=500_000)
+    parser.add_argument('--ids', type=int, default=20, help='players per multi-get')
+    parser.add_argument('--repeat', type=int, default=500)
+    args = parser.parse_args()
+
+    app = load_app()
+    conn = app.get_db_connection()
+    conn.executemany('''
+        INSERT INTO Players (player_id, name, position, team, market_value, nationality, height, img,
+                             birthDate, wage, potential, rating, description, foot)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', player_rows(random.Random(42), args.players))
+    app.backfill_player_values(conn)
+    conn.commit()
+    conn.close()
+
+    rng = random.Random(7)
+    cold_ids = iter(rng.sample(range(1, args.players + 1), 2 * args.repeat * (args.ids + 1)))
+    warm_ids = rng.sample(range(1, args.players + 1), args.ids)
+
+    def uncached(player_ids):
+        conn = app.get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute(f'SELECT {app.PLAYER_SELECT} FROM Players WHERE player_id IN ({", ".join("?" * len(player_ids))})',
+                       player_ids)
+        players = {row['player_id']: dict(row) for row in cursor.fetchall()}
+        conn.close()
+        return [players[player_id] for player_id in player_ids if player_id in players]
+
+    def cold(count):
+        return [next(cold_ids) for _ in range(count)]
+
+    client = app.app.test_client()
+
+    def request(path):
+        response = client.get(path)
+        assert response.status_code == 200
+        return response
+
+    app.player_cache.get_many(warm_ids)
+    assert uncached(warm_ids) == app.player_cache.get_many(warm_ids)
+    multi = ','.join(map(str, warm_ids))
+    report('players', {
+        'players': args.players,
+        'ids_per_multi_get': args.ids,
+        'single': {
+            'new_connection_ms': time_calls(lambda: uncached(cold(1)), args.repeat),
+            'pooled_cold_ms': time_calls(lambda: app.player_cache.get_many(cold(1)), args.repeat),
+            'cached_ms': time_calls(lambda: app.player_cache.get_many(warm_ids[:1]), args.repeat),
+        },
+        'multi_get': {
+            'new_connection_ms': time_calls(lambda: uncached(cold(args.ids)), args.repeat),
+            'pooled_cold_ms': time_calls(lambda: app.player_cache.get_many(cold(args.ids)), args.repeat),
+            'cached_ms': time_calls(lambda: app.player_cache.get_many(warm_ids), args.repeat),
+        },
+        'endpoint': {
+            'single_cached_ms': time_calls(lambda: request(f'/api/players/{warm_ids[0]}'), args.repeat),
+            'multi_get_cached_ms': time_calls(lambda: request(f'/api/players?ids={multi}'), args.repeat),
+        },
+    })
+
+
+if __name__ == '__main__':
+    main()
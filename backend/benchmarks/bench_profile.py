@@ -0,0 +1,55 @@
+"""
+Compare read latency of the combined profile document against the two-join
+path (GET /api/users/<username>/players + GET /api/startingeleven/<username>).
+
+Usage: python -m benchmarks.bench_profile [--favorites 10000] [--repeat 200]
+"""
+import argparse
+
+from benchmarks.common import load_app, make_player, report, time_calls
+
+PLAYER_COLUMNS = ('name, position, team, market_value, nationality, height, img, '
+                  'birthDate, wage, potential, rating, description, foot')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--favorites', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    app = load_app()
+    conn = app.get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO Users (username, password) VALUES ('bench', 'bench')")
+    user_id = cursor.lastrowid
+    cursor.executemany(f'INSERT INTO Players ({PLAYER_COLUMNS}) VALUES ({", ".join("?" * 13)})',
+                       (make_player(i) for i in range(args.favorites)))
+    cursor.execute('INSERT INTO UserPlayers (user_id, player_id) SELECT ?, player_id FROM Players', (user_id,))
+    positions = ['goalkeeper'] + [f'defense{i}' for i in range(1, 5)] + \
+                [f'midfield{i}' for i in range(1, 4)] + [f'forward{i}' for i in range(1, 4)]
+    cursor.executemany('INSERT INTO StartingEleven (user_id, position, player_id) VALUES (?, ?, ?)',
+                       [(user_id, position, i + 1) for i, position in enumerate(positions)])
+    app.bump_user_version(cursor, user_id)
+    app.refresh_user_profile(cursor, user_id)
+    conn.commit()
+    conn.close()
+
+    client = app.app.test_client()
+
+    def two_joins():
+        assert client.get('/api/users/bench/players').status_code == 200
+        assert client.get('/api/startingeleven/bench').status_code == 200
+
+    def profile():
+        assert client.get('/api/users/bench/profile').status_code == 200
+
+    report('profile_read', {
+        'favorites': args.favorites,
+        'two_join_path': time_calls(two_joins, args.repeat),
+        'profile_document': time_calls(profile, args.repeat),
+    })
+
+
+if __name__ == '__main__':
+    main()
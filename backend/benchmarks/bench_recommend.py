@@ -0,0 +1,87 @@
+"""
+Latency of the similar-player recommendations over a large catalogue:
+building the memory-mapped feature matrix, top-k neighbours of a player
+(SimilarityIndex.similar) and of a set of favorites (recommend), an
+incremental sync after new players are added, and the full endpoint.
+
+Usage: python -m benchmarks.bench_recommend [--players 500000] [--limit 20] [--repeat 200]
+"""
+import argparse
+import random
+import time
+
+from benchmarks.common import load_app, report, time_calls
+from benchmarks.generate_data import player_rows
+
+INSERT_PLAYERS = '''
+    INSERT INTO Players (player_id, name, position, team, market_value, nationality, height, img,
+                         birthDate, wage, potential, rating, description, foot)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--players', type=int, default=500_000)
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--favorites', type=int, default=50, help='favorites of the recommend() query')
+    parser.add_argument('--batch-rows', type=int, default=65536)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    app = load_app()
+    conn = app.get_db_connection()
+    conn.executemany(INSERT_PLAYERS, player_rows(random.Random(42), args.players))
+    app.backfill_player_values(conn)
+    conn.execute('DELETE FROM CatalogueChanges')
+    conn.commit()
+
+    index = app.SimilarityIndex(app.get_db_connection, app.FEATURES_DIR, sync_ttl=3600, batch_rows=args.batch_rows)
+    start = time.perf_counter()
+    index.sync()
+    build_ms = (time.perf_counter() - start) * 1000
+    index.similar(1)  # maps the files
+
+    rng = random.Random(7)
+    player_ids = [rng.randint(1, args.players) for _ in range(args.repeat)]
+    queries = iter(player_ids * 2)
+    similar = time_calls(lambda: index.similar(next(queries), args.limit), args.repeat)
+    favorites = rng.sample(range(1, args.players + 1), args.favorites)
+    recommend = time_calls(lambda: index.recommend(favorites, args.limit), args.repeat)
+
+    # 100 new players and 100 changed ones, applied in place
+    conn.executemany(INSERT_PLAYERS, ((player_id + args.players, *row[1:])
+                                      for player_id, row in enumerate(player_rows(random.Random(1), 100), start=1)))
+    app.backfill_player_values(conn)  # also logs a change for every player, so undo that below
+    conn.execute('DELETE FROM CatalogueChanges WHERE player_id <= ? AND player_id > 100', (args.players,))
+    conn.commit()
+    conn.close()
+    start = time.perf_counter()
+    sync = index.sync()
+    sync_ms = (time.perf_counter() - start) * 1000
+
+    client = app.app.test_client()
+    app.similarity_index.sync_ttl = 3600
+    queries = iter(player_ids * 2)
+
+    def request():
+        response = client.get(f'/api/players/{next(queries)}/similar?limit={args.limit}')
+        assert response.status_code == 200
+
+    request()
+    endpoint = time_calls(request, args.repeat)
+
+    report('recommend', {
+        'players': args.players,
+        'limit': args.limit,
+        'batch_rows': args.batch_rows,
+        'build_ms': round(build_ms, 1),
+        'similar_ms': similar,
+        'recommend_ms': recommend,
+        'incremental_sync': {**sync, 'ms': round(sync_ms, 1)},
+        'endpoint_ms': endpoint,
+    })
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""
+Latency of interactive requests while heavy read-only queries run, with
+the queries on the primary database and on the read-only replica
+(replica.py), on a large database (default 100k users x 100 favorites =
+10M UserPlayers rows over 500k players).
+
+The interactive load adds a favorite, lists the user's favorites and
+removes the favorite again, for random users, through the test client.
+The heavy load is a child process running an analytics query over all
+favorites (favorites and mean rating per nationality) in a loop, through
+replica.Replica with replica mode off (the primary) or on (the replica).
+
+Usage: python -m benchmarks.bench_replica [--users 100000] [--favorites 100] [--seconds 30]
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.bench_backup import build_database
+from benchmarks.common import BACKEND_DIR, load_app, report
+
+ANALYTICS = '''
+    SELECT Players.nationality, COUNT(*), AVG(Players.rating_value)
+    FROM UserPlayers JOIN Players ON Players.player_id = UserPlayers.player_id
+    GROUP BY Players.nationality
+'''
+
+
+def analytics(database, max_staleness):
+    """
+    Run the analytics query until SIGTERM, then print the number of queries and their mean duration as JSON.
+    """
+    sys.path.insert(0, BACKEND_DIR)
+    import replica
+    source = replica.Replica(replica.default_path(database), max_staleness,
+                             lambda: sqlite3.connect(database, timeout=30))
+    durations = []
+    running = True
+
+    def stop(*_):
+        nonlocal running
+        running = False
+
+    signal.signal(signal.SIGTERM, stop)
+    print('ready', flush=True)
+    while running:
+        start = time.perf_counter()
+        conn = source.connect()
+        conn.execute(ANALYTICS).fetchall()
+        conn.close()
+        durations.append(time.perf_counter() - start)
+    print(json.dumps({'queries': len(durations),
+                      'mean_seconds': round(sum(durations) / len(durations), 2) if durations else None}))
+
+
+def interactive(client, usernames, names, seconds):
+    """
+    Add, list and remove favorites for `seconds`; latency percentiles in milliseconds per request type.
+    """
+    rng = random.Random(7)
+    latencies = {'add': [], 'list': [], 'remove': []}
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        username, name = rng.choice(usernames), rng.choice(names)
+        for kind, call in (('add', lambda: client.post(f'/api/users/{username}/favorite_players',
+                                                       json={'name': name})),
+                           ('list', lambda: client.get(f'/api/users/{username}/players')),
+                           ('remove', lambda: client.delete(f'/api/users/{username}/favorite_players',
+                                                            json={'name': name}))):
+            start = time.perf_counter()
+            response = call()
+            latencies[kind].append(time.perf_counter() - start)
+            assert response.status_code in (200, 400), response.get_json()
+    results = {}
+    for kind, values in latencies.items():
+        values.sort()
+        results[kind] = {'requests': len(values),
+                         **{f'p{p}_ms': round(values[min(len(values) - 1, int(p / 100 * len(values)))] * 1000, 1)
+                            for p in (50, 99)},
+                         'max_ms': round(values[-1] * 1000, 1)}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=100_000)
+    parser.add_argument('--favorites', type=int, default=100, help='favorites per user')
+    parser.add_argument('--players', type=int, default=500_000)
+    parser.add_argument('--seconds', type=float, default=30, help='duration of each run')
+    parser.add_argument('--child', type=float, help=argparse.SUPPRESS)
+    parser.add_argument('--database', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child is not None:
+        analytics(args.database, args.child)
+        return
+
+    database = os.path.join(tempfile.mkdtemp(prefix='bench-'), 'database.db')
+    app = load_app(database)
+    app.orphan_sweeper.stop()
+    app.backup_scheduler.stop()
+    app.maintenance_scheduler.stop()
+    app.catalogue_pruner.stop()
+    build_database(app, database, args.users, args.favorites, args.players)
+    import replica
+    refreshed = replica.refresh(database, replica.default_path(database))
+    conn = sqlite3.connect(database)
+    names = [name for (name,) in conn.execute('SELECT name FROM Players ORDER BY random() LIMIT 1000')]
+    conn.close()
+    usernames = [f'user{user_id}' for user_id in random.Random(3).sample(range(1, args.users + 1), 1000)]
+    client = app.app.test_client()
+
+    results = {'database_mb': round(os.path.getsize(database) / 1e6),
+               'replica_refresh': {key: refreshed[key] for key in ('seconds', 'restarts', 'longest_step_ms')},
+               'no_heavy_queries': interactive(client, usernames, names, args.seconds)}
+    # The replica was made before the interactive runs, so it stays within a day's staleness
+    for name, max_staleness in (('queries_on_primary', 0), ('queries_on_replica', 86400)):
+        process = subprocess.Popen([sys.executable, '-m', 'benchmarks.bench_replica', '--child', str(max_staleness),
+                                    '--database', database], cwd=BACKEND_DIR, stdout=subprocess.PIPE, text=True)
+        process.stdout.readline()
+        try:
+            requests = interactive(client, usernames, names, args.seconds)
+        finally:
+            process.send_signal(signal.SIGTERM)
+            output, _ = process.communicate()
+        results[name] = {'interactive': requests, 'analytics': json.loads(output.strip().splitlines()[-1])}
+    report('replica', results)
+    shutil.rmtree(os.path.dirname(database))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+"""
+Latency of structured /search queries over a large local catalogue: the
+in-memory catalogue planner (catalogue.py) against the same filters as a
+SQL WHERE clause on the typed Players columns, for a mix of selective and
+broad filters. Each query is timed with and without the four facet counts,
+and the counts are compared with one GROUP BY per facet in SQL.
+
+Usage: python -m benchmarks.bench_search [--players 500000] [--repeat 50]
+"""
+import argparse
+import random
+import time
+
+from benchmarks.common import load_app, report, time_calls
+from benchmarks.generate_data import player_rows
+
+# (name, query string)
+QUERIES = (
+    ('left_centre_backs_85_cheap', 'foot=Left&position=CentreBack&min_rating=85&max_wage=200000'),
+    ('one_team', 'team=Team 17&sort=market_value'),
+    ('nationality_potential_range', 'nationality=Brazil&min_potential=80&max_potential=90'),
+    ('expensive_strikers', 'position=Striker&min_market_value=150000000'),
+    ('broad_right_footed', 'foot=Right&min_height=185'),
+    ('top_rated', 'sort=rating'),
+    ('name_within_position', 'position=Goalkeeper&q=an'),
+)
+
+SQL_COLUMNS = {'rating': 'rating_value', 'potential': 'potential_value', 'market_value': 'market_value_eur',
+               'wage': 'wage_eur', 'height': 'height_cm'}
+
+
+def sql_where(query_string):
+    """
+    The equivalent SQL filter of a structured search: (WHERE clause, parameters, parsed query).
+    """
+    params = dict(pair.split('=') for pair in query_string.split('&'))
+    where, values = [], []
+    for attribute in ('position', 'team', 'nationality', 'foot'):
+        if attribute in params:
+            where.append(f'LOWER({attribute}) = LOWER(?)')
+            values.append(params[attribute])
+    for attribute, column in SQL_COLUMNS.items():
+        if f'min_{attribute}' in params:
+            where.append(f'{column} >= ?')
+            values.append(float(params[f'min_{attribute}']))
+        if f'max_{attribute}' in params:
+            where.append(f'{column} <= ?')
+            values.append(float(params[f'max_{attribute}']))
+    if 'q' in params:
+        where.append("name LIKE '%' || ? || '%'")
+        values.append(params['q'])
+    return ('WHERE ' + ' AND '.join(where) if where else '', values, params)
+
+
+def sql_query(query_string):
+    """
+    The equivalent SQL of a structured search page: (statement, parameters).
+    """
+    where, values, params = sql_where(query_string)
+    sort = SQL_COLUMNS[params.get('sort', 'rating')]
+    return (f'''
+        SELECT player_id, COUNT(*) OVER () FROM Players {where}
+        ORDER BY {sort} IS NULL, {sort} DESC, player_id LIMIT 20
+    ''', values)
+
+
+def sql_facets(cursor, query_string):
+    """
+    Facet counts with one GROUP BY per facet, without the facet's own filter.
+    """
+    facets = {}
+    for attribute in ('position', 'team', 'nationality', 'foot'):
+        where, values, _ = sql_where('&'.join(pair for pair in query_string.split('&')
+                                              if not pair.startswith(f'{attribute}=')))
+        cursor.execute(f'''
+            SELECT COALESCE({attribute}, 'Unknown') AS value, COUNT(*) AS count FROM Players {where}
+            GROUP BY value ORDER BY count DESC, value LIMIT 10
+        ''', values)
+        facets[attribute] = [{'value': value, 'count': count} for value, count in cursor.fetchall()]
+    return facets
+
+
+def catalogue_predicates(app, query_string):
+    """
+    The catalogue predicates of a structured search, as search_catalogue() builds them.
+    """
+    params = dict(pair.split('=') for pair in query_string.split('&'))
+    predicates = [app.Equals(attribute, params[attribute]) for attribute in app.CATEGORICAL if attribute in params]
+    for attribute in SQL_COLUMNS:
+        low, high = params.get(f'min_{attribute}'), params.get(f'max_{attribute}')
+        if low is not None or high is not None:
+            predicates.append(app.Range(attribute, low and float(low), high and float(high)))
+    if 'q' in params:
+        predicates.append(app.NameContains(params['q']))
+    return predicates
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--players', type=int, default=500_000)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    app = load_app()
+    conn = app.get_db_connection()
+    conn.executemany('''
+        INSERT INTO Players (player_id, name, position, team, market_value, nationality, height, img,
+                             birthDate, wage, potential, rating, description, foot)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', player_rows(random.Random(42), args.players))
+    app.backfill_player_values(conn)
+    conn.commit()
+
+    start = time.perf_counter()
+    snapshot = app.catalogue.snapshot()
+    build_ms = (time.perf_counter() - start) * 1000
+
+    client = app.app.test_client()
+    cursor = conn.cursor()
+    results = {}
+    for name, query_string in QUERIES:
+        def endpoint(facets=True):
+            response = client.get(f'/search?{query_string}' + ('' if facets else '&facets='))
+            assert response.status_code == 200
+            return response.get_json()
+
+        statement, values = sql_query(query_string)
+
+        def sql():
+            cursor.execute(statement, values)
+            return cursor.fetchall()
+
+        body = endpoint()
+        rows = sql()
+        assert [player['player_id'] for player in body['players']] == [row[0] for row in rows], name
+        assert body['facets'] == sql_facets(cursor, query_string), name
+        plan = app.catalogue.snapshot().plan(catalogue_predicates(app, query_string))
+        results[name] = {
+            'query': query_string,
+            'matches': body['total'],
+            'plan': [f'{predicate} (~{estimate})' for predicate, estimate in plan],
+            'catalogue_endpoint_ms': time_calls(endpoint, args.repeat),
+            'catalogue_endpoint_no_facets_ms': time_calls(lambda: endpoint(facets=False), args.repeat),
+            'sql_ms': time_calls(sql, max(1, args.repeat // 5)),
+            'sql_facets_ms': time_calls(lambda: sql_facets(cursor, query_string), max(1, args.repeat // 10)),
+        }
+    conn.close()
+    report('search', {'players': args.players, 'catalogue_build_ms': round(build_ms, 1),
+                      'snapshot_players': snapshot.size, 'queries': results})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Latency of the starting-eleven solver (POST /api/startingeleven/<username>/solve)
+across favorites-list sizes, without constraints, with a wage budget and
+with a wage budget plus a per-team cap. solver_ms times solver.solve()
+alone; endpoint_ms includes the query and the JSON response.
+
+Usage: python -m benchmarks.bench_solver [--sizes 100,1000,5000,10000] [--repeat 30]
+"""
+import argparse
+import random
+
+from benchmarks.common import load_app, report, time_calls
+from benchmarks.generate_data import player_rows
+
+SCENARIOS = {
+    'unconstrained': {},
+    'wage_budget': {'max_wage': 1_500_000},
+    'wage_budget_team_cap': {'max_wage': 1_500_000, 'max_per_team': 2},
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', default='100,1000,5000,10000', help='favorites per user, comma-separated')
+    parser.add_argument('--repeat', type=int, default=30)
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(',')]
+
+    app = load_app()
+    conn = app.get_db_connection()
+    cursor = conn.cursor()
+    cursor.executemany('''
+        INSERT INTO Players (player_id, name, position, team, market_value, nationality, height, img,
+                             birthDate, wage, potential, rating, description, foot)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', player_rows(random.Random(42), max(sizes)))
+    app.backfill_player_values(conn)
+    for size in sizes:
+        cursor.execute('INSERT INTO Users (username, password) VALUES (?, ?)', (f'bench{size}', 'bench'))
+        cursor.execute('INSERT INTO UserPlayers (user_id, player_id) SELECT ?, player_id FROM Players LIMIT ?',
+                       (cursor.lastrowid, size))
+    conn.commit()
+
+    client = app.app.test_client()
+    results = {}
+    for size in sizes:
+        username = f'bench{size}'
+        favorites = app.RowList.fetch(cursor, '''
+            SELECT Players.player_id, Players.name, Players.position, Players.team, Players.foot,
+                   Players.img, Players.rating_value, Players.wage_eur, Players.market_value_eur
+            FROM UserPlayers JOIN Players ON UserPlayers.player_id = Players.player_id
+            JOIN Users ON UserPlayers.user_id = Users.user_id
+            WHERE Users.username = ?
+        ''', (username,))
+        for name, limits in SCENARIOS.items():
+            def solve():
+                candidates = app.solver.Candidates(favorites.columns, favorites.rows)
+                return app.solver.solve(candidates, '4-3-3', **limits)
+
+            def request():
+                response = client.post(f'/api/startingeleven/{username}/solve', json=limits)
+                assert response.status_code == 200, response.get_json()
+
+            result = solve()
+            results[f'{size}/{name}'] = {
+                'solver_ms': time_calls(solve, args.repeat),
+                'endpoint_ms': time_calls(request, args.repeat),
+                'total_score': result['total_score'],
+                'total_wage_eur': result['total_wage_eur'],
+            }
+    conn.close()
+    report('solver', {'favorites': sizes, 'results': results})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Shared helpers for the benchmark scripts.
+"""
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_app(db_path=None):
+    """
+    Import the Flask application against a throwaway database.
+
+    Args:
+        db_path (str, optional): Path of the database file. Defaults to a new temporary file.
+
+    Returns:
+        module: The imported app module.
+    """
+    if db_path is None:
+        db_path = os.path.join(tempfile.mkdtemp(prefix='bench-'), 'database.db')
+    os.environ['DATABASE_PATH'] = db_path
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+    import app
+    return app
+
+
+def make_player(i):
+    """
+    Build a synthetic Players row.
+
+    Args:
+        i (int): Sequence number of the player.
+
+    Returns:
+        tuple: Values for (name, position, team, market_value, nationality, height, img,
+               birthDate, wage, potential, rating, description, foot).
+    """
+    return (
+        f'Player {i}', ('Goalkeeper', 'Defender', 'Midfielder', 'Forward')[i % 4], f'Team {i % 500}',
+        f'€{(i % 150) + 1}M', f'Country {i % 120}', f'{165 + i % 35}cm', f'https://img.example.org/{i}.png',
+        f'{1980 + i % 25}-0{1 + i % 9}-1{i % 10}', f'€{(i % 300) + 1}K', str(60 + i % 40), str(50 + i % 45),
+        'A synthetic player used for benchmarking. ' * 4, ('Left', 'Right')[i % 2],
+    )
+
+
+def time_calls(func, repeat):
+    """
+    Call func repeatedly and collect latencies.
+
+    Args:
+        func (callable): The zero-argument function to time.
+        repeat (int): The number of calls.
+
+    Returns:
+        dict: Latency summary in milliseconds.
+    """
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        'calls': repeat,
+        'mean_ms': round(statistics.fmean(samples), 4),
+        'p50_ms': round(samples[len(samples) // 2], 4),
+        'p99_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.99))], 4),
+    }
+
+
+def report(name, results):
+    """
+    Print benchmark results as a single JSON document.
+
+    Args:
+        name (str): The benchmark name.
+        results (dict): The measured values.
+    """
+    print(json.dumps({'benchmark': name, **results}, indent=2))
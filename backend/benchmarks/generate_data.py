@@ -0,0 +1,258 @@
+"""
+Generate a large, reproducible dataset for scale testing.
+
+Run with: python -m benchmarks.generate_data --database database.db --users 1000000 --favorites 5000000
+
+Users, Players, UserPlayers and StartingEleven are filled with seeded
+synthetic rows: player popularity follows a Zipf distribution, so a few
+players are favorited by a large share of the users, and a fraction of the
+users get a full 4-3-3 lineup. The schema is created by the app's init_db().
+
+Loading runs in a single transaction with journaling and syncing switched
+off. Explicit indexes and triggers are dropped first and recreated at the
+end. The favorite counts, typed player values and lineup aggregates are
+computed once after the load. The primary-key indexes cannot be deferred,
+so rows are generated in key order and every insert appends to the end of
+its b-tree.
+"""
+import argparse
+import bisect
+import itertools
+import os
+import random
+import sqlite3
+import time
+
+from benchmarks.common import load_app, report
+from benchmarks.stubs import COUNTRIES, FIRST_NAMES, LAST_NAMES, POSITIONS
+
+# Positions of the 4-3-3 lineup used by the frontend
+LINEUP_POSITIONS = sorted(('goalkeeper', 'defense1', 'defense2', 'defense3', 'defense4',
+                           'midfield1', 'midfield2', 'midfield3', 'forward1', 'forward2', 'forward3'))
+
+
+def zipf_cum_weights(count, exponent):
+    """
+    Cumulative Zipf weights for ranks 1..count.
+
+    Args:
+        count (int): The number of ranks.
+        exponent (float): The Zipf exponent; larger values concentrate popularity.
+
+    Returns:
+        list: The cumulative weights.
+    """
+    return list(itertools.accumulate(1.0 / rank ** exponent for rank in range(1, count + 1)))
+
+
+class ZipfSampler:
+    """
+    Draws player IDs with Zipf popularity. Rank r maps to a shuffled player
+    ID, so popularity is not correlated with insertion order.
+
+    Args:
+        rng (random.Random): The random generator.
+        player_ids (list): The IDs to draw from.
+        exponent (float): The Zipf exponent.
+    """
+
+    def __init__(self, rng, player_ids, exponent):
+        self.rng = rng
+        self.ids = list(player_ids)
+        rng.shuffle(self.ids)
+        self.cum_weights = zipf_cum_weights(len(self.ids), exponent)
+        self.total = self.cum_weights[-1]
+        self.last = len(self.ids) - 1
+
+    def draw(self):
+        return self.ids[bisect.bisect(self.cum_weights, self.rng.random() * self.total, 0, self.last)]
+
+    def distinct(self, k):
+        """
+        Draw k distinct player IDs, in ascending order.
+        """
+        k = min(k, len(self.ids))
+        chosen = set()
+        while len(chosen) < k:
+            chosen.add(self.draw())
+        return sorted(chosen)
+
+
+def player_rows(rng, count):
+    """
+    Yield Players rows as stored by add_favorite_player.
+    """
+    for i in range(count):
+        rating = rng.randint(55, 94)
+        name = f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {i}'
+        position = rng.choice(POSITIONS)
+        yield (
+            i + 1, name, position, f'Team {rng.randint(1, 400)}', f'€{rng.randint(1, 180)}M',
+            rng.choice(COUNTRIES), f'{rng.randint(165, 200)}cm', f'https://img.example.org/players/{i}.png',
+            f'{rng.randint(1985, 2006)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}',
+            f'€{rng.randint(5, 450)}K', str(min(99, rating + rng.randint(0, 8))), str(rating),
+            f'{name} is a {position.lower()} known for work rate and vision.',
+            rng.choice(('Left', 'Right', 'Right', 'Right')),
+        )
+
+
+def user_rows(count):
+    """
+    Yield Users rows; zero-padded names keep the UNIQUE index in insertion order.
+    """
+    width = len(str(count))
+    for i in range(1, count + 1):
+        yield (i, f'user{i:0{width}d}', 'password')
+
+
+def favorite_counts(rng, users, favorites):
+    """
+    Draw the number of favorites of each user, exponentially distributed
+    around favorites / users.
+    """
+    mean = favorites / users if users else 0
+    for _ in range(users):
+        yield round(rng.expovariate(1 / mean)) if mean else 0
+
+
+def drop_schema_objects(conn, kind):
+    """
+    Drop the explicit indexes or triggers and return their definitions for recreation.
+
+    Args:
+        conn (sqlite3.Connection): The connection.
+        kind (str): 'index' or 'trigger'.
+
+    Returns:
+        list: The CREATE statements.
+    """
+    objects = conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = ? AND sql IS NOT NULL", (kind,)).fetchall()
+    for name, _ in objects:
+        conn.execute(f'DROP {kind.upper()} "{name}"')
+    return [sql for _, sql in objects]
+
+
+def generate(args):
+    if os.path.exists(args.database):
+        if not args.force:
+            raise SystemExit(f'{args.database} exists; pass --force to replace it')
+        os.remove(args.database)
+
+    # init_db() creates the schema when the app is imported
+    app = load_app(os.path.abspath(args.database))
+
+    rng = random.Random(args.seed)
+    conn = sqlite3.connect(args.database, isolation_level=None)
+    conn.execute('PRAGMA journal_mode = OFF')
+    conn.execute('PRAGMA synchronous = OFF')
+    conn.execute('PRAGMA locking_mode = EXCLUSIVE')
+    conn.execute('PRAGMA temp_store = MEMORY')
+    conn.execute(f'PRAGMA cache_size = -{args.cache_mb * 1024}')
+
+    timings = {}
+    counts = {}
+    start = time.perf_counter()
+    conn.execute('BEGIN')
+    index_sql = drop_schema_objects(conn, 'index')
+    trigger_sql = drop_schema_objects(conn, 'trigger')
+
+    phase = time.perf_counter()
+    conn.executemany('''
+        INSERT INTO Players (player_id, name, position, team, market_value, nationality, height, img,
+                             birthDate, wage, potential, rating, description, foot)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', player_rows(rng, args.players))
+    counts['players'] = args.players
+    timings['players_s'] = time.perf_counter() - phase
+
+    phase = time.perf_counter()
+    conn.executemany('INSERT INTO Users (user_id, username, password) VALUES (?, ?, ?)', user_rows(args.users))
+    counts['users'] = args.users
+    timings['users_s'] = time.perf_counter() - phase
+
+    sampler = ZipfSampler(rng, range(1, args.players + 1), args.zipf_exponent)
+    # Favorites of the users that get a lineup, so lineups reuse them
+    lineup_users = set(rng.sample(range(1, args.users + 1), int(args.users * args.lineup_fraction)))
+    lineup_favorites = {}
+
+    def favorites():
+        for user_id, k in enumerate(favorite_counts(rng, args.users, args.favorites), start=1):
+            player_ids = sampler.distinct(k)
+            if user_id in lineup_users:
+                lineup_favorites[user_id] = player_ids
+            for player_id in player_ids:
+                yield (user_id, player_id)
+
+    phase = time.perf_counter()
+    cursor = conn.executemany('INSERT INTO UserPlayers (user_id, player_id) VALUES (?, ?)', favorites())
+    counts['favorites'] = cursor.rowcount
+    timings['favorites_s'] = time.perf_counter() - phase
+
+    def lineups():
+        for user_id in sorted(lineup_users):
+            pool = lineup_favorites.get(user_id, [])
+            if len(pool) >= len(LINEUP_POSITIONS):
+                chosen = rng.sample(pool, len(LINEUP_POSITIONS))
+            else:
+                chosen = list(pool)
+                while len(chosen) < len(LINEUP_POSITIONS):
+                    player_id = sampler.draw()
+                    if player_id not in chosen:
+                        chosen.append(player_id)
+            for position, player_id in zip(LINEUP_POSITIONS, chosen):
+                yield (user_id, position, player_id)
+
+    phase = time.perf_counter()
+    cursor = conn.executemany('INSERT INTO StartingEleven (user_id, position, player_id) VALUES (?, ?, ?)',
+                              lineups())
+    counts['starting_eleven'] = cursor.rowcount
+    timings['starting_eleven_s'] = time.perf_counter() - phase
+
+    phase = time.perf_counter()
+    for sql in index_sql:
+        conn.execute(sql)
+    timings['indexes_s'] = time.perf_counter() - phase
+
+    phase = time.perf_counter()
+    app.recount_favorites(conn.cursor())
+    app.backfill_player_values(conn)
+    app.recompute_lineup_aggregates(conn.cursor())
+    for sql in trigger_sql:
+        conn.execute(sql)
+    timings['recount_s'] = time.perf_counter() - phase
+
+    phase = time.perf_counter()
+    conn.execute('COMMIT')
+    conn.execute('ANALYZE')
+    conn.execute('PRAGMA journal_mode = DELETE')
+    conn.close()
+    timings['commit_analyze_s'] = time.perf_counter() - phase
+    timings['total_s'] = time.perf_counter() - start
+
+    return {
+        'database': os.path.abspath(args.database),
+        'size_mb': round(os.path.getsize(args.database) / 2 ** 20, 1),
+        'rows': counts,
+        'timings': {key: round(value, 2) for key, value in timings.items()},
+        'config': vars(args),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', default='database.db', help='path of the database to create')
+    parser.add_argument('--users', type=int, default=1_000_000)
+    parser.add_argument('--players', type=int, default=50_000)
+    parser.add_argument('--favorites', type=int, default=5_000_000, help='approximate total favorites')
+    parser.add_argument('--zipf-exponent', type=float, default=1.1, help='skew of player popularity')
+    parser.add_argument('--lineup-fraction', type=float, default=0.5, help='share of users with a full lineup')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--cache-mb', type=int, default=512, help='SQLite page cache during the load')
+    parser.add_argument('--force', action='store_true', help='replace an existing database')
+    args = parser.parse_args()
+    report('generate_data', generate(args))
+
+
+if __name__ == '__main__':
+    main()
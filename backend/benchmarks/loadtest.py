@@ -0,0 +1,294 @@
+"""
+End-to-end load test: runs the app under gunicorn against the local SPARQL
+and news stubs and drives a weighted mix of user scenarios concurrently.
+
+Run with: python -m benchmarks.loadtest --duration 30 --concurrency 16 --output baseline.json
+
+Each scenario is a short sequence of HTTP requests made by one simulated
+user. Results are reported per scenario and per request as throughput,
+p50/p95/p99 latency and error rate, as one JSON document.
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.common import BACKEND_DIR
+from benchmarks.stubs import Latency, news_server, sparql_server, synthetic_news, synthetic_players
+
+# Positions of the 4-3-3 lineup used by the frontend
+LINEUP_POSITIONS = ('goalkeeper', 'defense1', 'defense2', 'defense3', 'defense4',
+                    'midfield1', 'midfield2', 'midfield3', 'forward1', 'forward2', 'forward3')
+
+SEARCH_TERMS = ('silva', 'kane', 'luka', 'mar', 'diaz', 'costa', 'jude', 'an', 'rodri', 'novak')
+
+DEFAULT_MIX = 'register_login=1,search=4,favorite=3,build_eleven=2,read=6,news=2'
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return 0.0
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+class Recorder:
+    """
+    Thread-safe collection of latencies and failures by name.
+    """
+
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+        self.lock = threading.Lock()
+
+    def add(self, name, seconds, ok):
+        with self.lock:
+            self.samples.setdefault(name, []).append(seconds)
+            if not ok:
+                self.errors[name] = self.errors.get(name, 0) + 1
+
+    def summary(self, elapsed):
+        rows = {}
+        with self.lock:
+            items = sorted(self.samples.items())
+        for name, samples in items:
+            samples = sorted(samples)
+            errors = self.errors.get(name, 0)
+            rows[name] = {
+                'count': len(samples),
+                'errors': errors,
+                'error_rate': round(errors / len(samples), 4),
+                'throughput_per_s': round(len(samples) / elapsed, 2),
+                'p50_ms': round(percentile(samples, 0.50) * 1000, 3),
+                'p95_ms': round(percentile(samples, 0.95) * 1000, 3),
+                'p99_ms': round(percentile(samples, 0.99) * 1000, 3),
+                'max_ms': round(samples[-1] * 1000, 3),
+            }
+        return rows
+
+
+class Client:
+    """
+    One simulated user with its own HTTP session.
+
+    Args:
+        base_url (str): The URL of the app under test.
+        username (str): The user to act as.
+        recorder (Recorder): Where request timings are recorded.
+    """
+
+    def __init__(self, base_url, username, recorder):
+        self.base_url = base_url
+        self.username = username
+        self.password = 'secret'
+        self.recorder = recorder
+        self.session = requests.Session()
+        self.etags = {}
+        self.failures = 0
+
+    def call(self, name, method, path, expect=(200,), **kwargs):
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, self.base_url + path, timeout=30, **kwargs)
+            ok = response.status_code in expect
+        except requests.RequestException:
+            response, ok = None, False
+        self.recorder.add(name, time.perf_counter() - start, ok)
+        if not ok:
+            self.failures += 1
+        return response
+
+    def register_login(self):
+        self.call('POST /api/register', 'POST', '/api/register',
+                  json={'username': self.username, 'password': self.password}, expect=(200, 400))
+        self.call('POST /api/login', 'POST', '/api/login',
+                  json={'username': self.username, 'password': self.password})
+
+    def search(self):
+        response = self.call('GET /search', 'GET', '/search',
+                             params={'q': random.choice(SEARCH_TERMS)}, expect=(200, 404))
+        if response is not None and response.status_code == 200:
+            return response.json()
+        return []
+
+    def favorite(self):
+        for player in self.search()[:2]:
+            self.call('POST favorite_players', 'POST', f'/api/users/{self.username}/favorite_players',
+                      json={**player, 'market_value': player.get('marketValue'),
+                            'birthDate': player.get('birth_date')}, expect=(200, 400))
+
+    def build_eleven(self):
+        response = self.call('GET players', 'GET', f'/api/users/{self.username}/players', expect=(200, 404))
+        favorites = response.json() if response is not None and response.status_code == 200 else []
+        if not favorites:
+            self.favorite()
+            return
+        for position in random.sample(LINEUP_POSITIONS, 3):
+            player = random.choice(favorites)
+            self.call('POST startingeleven', 'POST', f'/api/startingeleven/{self.username}',
+                      json={'position': position, 'player_id': player['player_id']})
+        self.call('DELETE startingeleven', 'DELETE',
+                  f'/api/startingeleven/{self.username}/{random.choice(LINEUP_POSITIONS)}')
+
+    def read(self):
+        path = f'/api/users/{self.username}/profile'
+        headers = {'If-None-Match': self.etags[path]} if path in self.etags else {}
+        response = self.call('GET profile', 'GET', path, headers=headers, expect=(200, 304))
+        if response is not None and response.headers.get('ETag'):
+            self.etags[path] = response.headers['ETag']
+        self.call('GET startingeleven', 'GET', f'/api/startingeleven/{self.username}', expect=(200, 304, 404))
+
+    def news(self):
+        self.call('GET /api/news', 'GET', '/api/news')
+
+
+def parse_mix(text):
+    """
+    Parse a scenario mix such as 'search=4,read=6'.
+
+    Args:
+        text (str): Comma-separated scenario=weight pairs.
+
+    Returns:
+        dict: Scenario names to weights.
+    """
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if not hasattr(Client, name):
+            raise SystemExit(f'Unknown scenario: {name}')
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_gunicorn(port, workers, threads, env):
+    """
+    Start the app under gunicorn and wait until it answers.
+
+    Returns:
+        subprocess.Popen: The gunicorn master process.
+    """
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-w', str(workers), '-k', 'gthread', '--threads', str(threads),
+         '-b', f'127.0.0.1:{port}', '--log-level', 'warning', 'app:app'],
+        cwd=BACKEND_DIR, env=env)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f'gunicorn exited with status {process.returncode}')
+        try:
+            requests.get(f'http://127.0.0.1:{port}/', timeout=1)
+            return process
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    process.terminate()
+    raise SystemExit('gunicorn did not start within 30 seconds')
+
+
+def run(args):
+    latency = Latency(args.upstream_latency_ms, args.upstream_jitter_ms)
+    sparql = sparql_server(synthetic_players(args.players), latency)
+    news = news_server(synthetic_news(), latency)
+
+    port = free_port()
+    env = dict(os.environ,
+               DATABASE_PATH=os.path.join(tempfile.mkdtemp(prefix='loadtest-'), 'database.db'),
+               SPARQL_ENDPOINT=f'{sparql.url}/repositories/kd_repo_project',
+               NEWS_API_URL=f'{news.url}/news',
+               LOG_LEVEL='WARNING')
+    server = start_gunicorn(port, args.workers, args.threads, env)
+    base_url = f'http://127.0.0.1:{port}'
+
+    mix = parse_mix(args.mix)
+    names, weights = list(mix), list(mix.values())
+    recorder = Recorder()
+    scenarios = Recorder()
+    for i in range(args.users):
+        Client(base_url, f'loadtest-{i}', Recorder()).register_login()
+
+    deadline = time.monotonic() + args.duration
+
+    def worker(index):
+        # Clients, and their sessions and ETags, are never shared between threads: each worker
+        # acts as its share of the users, or as one user too when there are more workers than users
+        users = range(index, args.users, args.concurrency) if index < args.users else [index % args.users]
+        clients = itertools.cycle([Client(base_url, f'loadtest-{i}', recorder) for i in users])
+        while time.monotonic() < deadline:
+            client = next(clients)
+            name = random.choices(names, weights)[0]
+            failures = client.failures
+            start = time.perf_counter()
+            getattr(client, name)()
+            scenarios.add(name, time.perf_counter() - start, client.failures == failures)
+
+    try:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(args.concurrency) as pool:
+            for future in [pool.submit(worker, index) for index in range(args.concurrency)]:
+                future.result()
+        elapsed = time.perf_counter() - start
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+        sparql.stop()
+        news.stop()
+
+    request_rows = recorder.summary(elapsed)
+    total = sum(row['count'] for row in request_rows.values())
+    errors = sum(row['errors'] for row in request_rows.values())
+    return {
+        'benchmark': 'loadtest',
+        'config': {key: value for key, value in vars(args).items() if key != 'output'},
+        'elapsed_s': round(elapsed, 3),
+        'requests': total,
+        'throughput_per_s': round(total / elapsed, 2),
+        'error_rate': round(errors / total, 4) if total else 0.0,
+        'scenarios': scenarios.summary(elapsed),
+        'endpoints': request_rows,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--duration', type=float, default=30, help='seconds to generate load for')
+    parser.add_argument('--concurrency', type=int, default=16, help='concurrent load generator threads')
+    parser.add_argument('--users', type=int, default=50, help='distinct simulated users')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn worker processes')
+    parser.add_argument('--threads', type=int, default=8, help='threads per gunicorn worker')
+    parser.add_argument('--players', type=int, default=5000, help='size of the synthetic SPARQL dataset')
+    parser.add_argument('--upstream-latency-ms', type=float, default=20, help='injected upstream latency')
+    parser.add_argument('--upstream-jitter-ms', type=float, default=10, help='uniform jitter added to the latency')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='scenario weights, e.g. "search=4,read=6"')
+    parser.add_argument('--seed', type=int, default=None, help='seed for scenario selection')
+    parser.add_argument('--output', help='also write the JSON report to this file')
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    results = run(args)
+    document = json.dumps(results, indent=2)
+    print(document)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(document + '\n')
+
+
+if __name__ == '__main__':
+    main()
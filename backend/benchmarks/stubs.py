@@ -0,0 +1,296 @@
+"""
+Local stand-ins for the upstream services: a SPARQL endpoint serving a
+synthetic player dataset, a news feed and an image host, all with
+injectable latency.
+
+Run standalone with: python -m benchmarks.stubs --players 5000 --latency-ms 20
+"""
+import argparse
+import io
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+ONTOLOGY = 'http://www.example.org/group-27/football-ontology/'
+
+FIRST_NAMES = ['Luka', 'Kylian', 'Erling', 'Kevin', 'Mohamed', 'Virgil', 'Jude', 'Pedri', 'Bukayo', 'Rodri',
+               'Harry', 'Lautaro', 'Bernardo', 'Marc', 'Joshua', 'Vinicius', 'Martin', 'Federico', 'Rafael', 'Thibaut']
+LAST_NAMES = ['Silva', 'Santos', 'Muller', 'Kane', 'Diaz', 'Fernandes', 'Martinez', 'Rossi', 'Dias', 'Costa',
+              'Garcia', 'Kovac', 'Jensen', 'Dubois', 'Novak', 'Moreau', 'Becker', 'Lopez', 'Petrov', 'Andersen']
+POSITIONS = ['Goalkeeper', 'CentreBack', 'LeftBack', 'RightBack', 'DefensiveMidfield', 'CentralMidfield',
+             'AttackingMidfield', 'LeftWinger', 'RightWinger', 'Striker']
+COUNTRIES = ['Brazil', 'France', 'Spain', 'England', 'Germany', 'Argentina', 'Portugal', 'Netherlands',
+             'Italy', 'Belgium', 'Croatia', 'Norway', 'Denmark', 'Serbia', 'Morocco']
+
+
+def synthetic_players(count, seed=42, image_host='https://img.example.org'):
+    """
+    Generate a reproducible synthetic player catalogue.
+
+    Args:
+        count (int): The number of players.
+        seed (int): The random seed.
+        image_host (str): The base URL of the player images (see image_server).
+
+    Returns:
+        list: Player dicts keyed like the SPARQL variables of /search.
+    """
+    rng = random.Random(seed)
+    players = []
+    for i in range(count):
+        name = f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {i}'
+        rating = rng.randint(55, 94)
+        players.append({
+            'player': f'{ONTOLOGY}player/{i}',
+            'name': name,
+            'team': f'{ONTOLOGY}Team_{rng.randint(1, 400)}',
+            'position': f'{ONTOLOGY}{rng.choice(POSITIONS)}',
+            'height': f'{rng.randint(165, 200)}cm',
+            'marketValue': f'€{rng.randint(1, 180)}M',
+            'img': f'{image_host}/players/{i}.png',
+            'birth_date': f'{rng.randint(1985, 2006)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}',
+            'wage': f'€{rng.randint(5, 450)}K',
+            'potential': str(min(99, rating + rng.randint(0, 8))),
+            'rating': str(rating),
+            'description': f'{name} is a {rng.choice(POSITIONS).lower()} known for work rate and vision. ' * 3,
+            'foot': rng.choice(['Left', 'Right', 'Right', 'Right']),
+            'nationality': rng.choice(COUNTRIES),
+        })
+    return players
+
+
+def synthetic_news(count=40):
+    """
+    Generate a news feed shaped like the upstream football news API.
+
+    Args:
+        count (int): The number of articles.
+
+    Returns:
+        list: Article dicts.
+    """
+    return [{'title': f'Matchday report {i}: late winner settles the derby',
+             'url': f'https://news.example.org/articles/{i}',
+             'img': f'https://news.example.org/images/{i}.jpg',
+             'description': 'Reactions, ratings and analysis from the weekend fixtures. ' * 4}
+            for i in range(count)]
+
+
+class Latency:
+    """
+    Injected latency: a base delay plus uniform jitter, in milliseconds.
+    """
+
+    def __init__(self, base_ms=0.0, jitter_ms=0.0):
+        self.base_ms = base_ms
+        self.jitter_ms = jitter_ms
+
+    def sleep(self):
+        delay = self.base_ms + random.uniform(0, self.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+
+class StubServer(ThreadingHTTPServer):
+    """
+    A threaded HTTP server running in a daemon thread.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, handler, port=0):
+        super().__init__(('127.0.0.1', port), handler)
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class QuietHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, payload, status=200, content_type='application/json'):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def sparql_server(players, latency=None, port=0):
+    """
+    Start a stub SPARQL endpoint answering the /search query.
+
+    The name filter of the query is applied to the synthetic players and at
+    most LIMIT bindings are returned in SPARQL JSON results format.
+
+    Args:
+        players (list): The catalogue from synthetic_players().
+        latency (Latency, optional): Injected latency per request.
+        port (int): The port to listen on; 0 picks a free one.
+
+    Returns:
+        StubServer: The started server.
+    """
+    latency = latency or Latency()
+    lowered = [(player['name'].lower(), player) for player in players]
+    name_filter = re.compile(r'CONTAINS\(LCASE\(\?name\), LCASE\("(.*?)"\)\)')
+    limit_clause = re.compile(r'LIMIT\s+(\d+)')
+
+    class Handler(QuietHandler):
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            query = parse_qs(self.rfile.read(length).decode('utf-8')).get('query', [''])[0]
+            match = name_filter.search(query)
+            needle = match.group(1).lower() if match else ''
+            limit_match = limit_clause.search(query)
+            limit = int(limit_match.group(1)) if limit_match else 10
+            latency.sleep()
+            bindings = []
+            for name, player in lowered:
+                if needle in name:
+                    bindings.append({key: {'type': 'literal', 'value': value} for key, value in player.items()})
+                    if len(bindings) >= limit:
+                        break
+            self.send_json({'head': {'vars': list(players[0]) if players else []},
+                            'results': {'bindings': bindings}}, content_type='application/sparql-results+json')
+
+    return StubServer(Handler, port).start()
+
+
+def news_server(articles, latency=None, port=0):
+    """
+    Start a stub news API returning the same feed for every GET.
+
+    Args:
+        articles (list): The feed from synthetic_news().
+        latency (Latency, optional): Injected latency per request.
+        port (int): The port to listen on; 0 picks a free one.
+
+    Returns:
+        StubServer: The started server.
+    """
+    latency = latency or Latency()
+
+    class Handler(QuietHandler):
+        def do_GET(self):
+            latency.sleep()
+            self.send_json(articles)
+
+    return StubServer(Handler, port).start()
+
+
+def synthetic_image(i, size=(400, 500)):
+    """
+    Generate a reproducible PNG portrait.
+
+    Args:
+        i (int): The image number, which sets the colours.
+        size (tuple): (width, height) in pixels.
+
+    Returns:
+        bytes: The PNG file.
+    """
+    from PIL import Image, ImageDraw
+
+    rng = random.Random(i)
+    image = Image.new('RGB', size, tuple(rng.randrange(256) for _ in range(3)))
+    draw = ImageDraw.Draw(image)
+    for _ in range(20):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        draw.ellipse((x, y, x + rng.randint(10, 120), y + rng.randint(10, 120)),
+                     fill=tuple(rng.randrange(256) for _ in range(3)))
+    buffer = io.BytesIO()
+    image.save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def image_server(latency=None, port=0):
+    """
+    Start a stub image host serving synthetic_image(i) at /players/<i>.png.
+    Other paths answer 404; /broken.png is served as image/png but is not an image.
+    The number of GETs per path is counted in server.requests.
+
+    Args:
+        latency (Latency, optional): Injected latency per request.
+        port (int): The port to listen on; 0 picks a free one.
+
+    Returns:
+        StubServer: The started server.
+    """
+    latency = latency or Latency()
+    images = {}
+    lock = threading.Lock()
+    path_pattern = re.compile(r'/players/(\d+)\.png')
+
+    class Handler(QuietHandler):
+        def do_GET(self):
+            with lock:
+                server.requests[self.path] = server.requests.get(self.path, 0) + 1
+            latency.sleep()
+            match = path_pattern.fullmatch(self.path)
+            if self.path == '/broken.png':
+                body = b'not an image'
+            elif match is None:
+                self.send_error(404)
+                return
+            else:
+                i = int(match.group(1))
+                with lock:
+                    if i not in images:
+                        images[i] = synthetic_image(i)
+                    body = images[i]
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/png')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = StubServer(Handler, port)
+    server.requests = {}
+    return server.start()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--players', type=int, default=5000)
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    parser.add_argument('--jitter-ms', type=float, default=0.0)
+    parser.add_argument('--sparql-port', type=int, default=7200)
+    parser.add_argument('--news-port', type=int, default=7300)
+    parser.add_argument('--images-port', type=int, default=7400)
+    args = parser.parse_args()
+
+    latency = Latency(args.latency_ms, args.jitter_ms)
+    images = image_server(latency, args.images_port)
+    sparql = sparql_server(synthetic_players(args.players, image_host=images.url), latency, args.sparql_port)
+    news = news_server(synthetic_news(), latency, args.news_port)
+    print(f'SPARQL_ENDPOINT={sparql.url}/repositories/kd_repo_project')
+    print(f'NEWS_API_URL={news.url}/news')
+    print(f'Player images: {images.url}/players/<i>.png (IMAGE_HOSTS=127.0.0.1 IMAGE_ALLOW_PRIVATE=1)')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        sparql.stop()
+        news.stop()
+        images.stop()
+
+
+if __name__ == '__main__':
+    main()
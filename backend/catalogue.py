@@ -0,0 +1,419 @@
+"""
+In-memory index of the local player catalogue for structured search.
+
+A snapshot of Players holds, per categorical attribute (position, team,
+nationality, foot), a code per player and a posting list per value (the
+rows with that value, in player_id order), and per numeric attribute
+(rating, potential, market value, wage, height) the values and the rows
+sorted by value. Every filter predicate can then estimate how many rows it
+matches without touching them: a posting-list length, or two binary
+searches in a sorted array.
+
+The planner evaluates the most selective predicate first, as a posting
+list or a slice of a sorted array, and checks the other predicates, most
+selective next, with vectorized lookups on the shrinking candidate set
+only. The name substring test runs last since it is a Python loop.
+Facet counts of a result set are one bincount of its codes per attribute.
+Percentiles are binary searches in the sorted values, overall or within
+the player's position.
+
+Snapshots are rebuilt in the background when the catalogue version
+(CatalogueChanges, see recommender.py) moved and the snapshot is older than
+the TTL; requests keep using the previous snapshot meanwhile.
+"""
+import logging
+import threading
+import time
+
+import numpy as np
+
+from metrics import CACHE_REQUESTS, SQL_DURATION
+from recommender import catalogue_version
+
+logger = logging.getLogger('catalogue')
+
+CATEGORICAL = ('position', 'team', 'nationality', 'foot')
+# (attribute, typed Players column)
+NUMERIC = (('rating', 'rating_value'), ('potential', 'potential_value'), ('market_value', 'market_value_eur'),
+           ('wage', 'wage_eur'), ('height', 'height_cm'))
+
+CATALOGUE_SELECT = ', '.join(['player_id', 'name', *CATEGORICAL, *(column for _, column in NUMERIC)])
+
+
+class Facet:
+    """
+    Codes and posting lists of one categorical attribute. Values are matched
+    case-insensitively; missing values are 'Unknown', as in FavoriteCounts.
+    """
+
+    def __init__(self, values):
+        codes = {}
+        self.values = []
+        for value in set(values):
+            key = ('Unknown' if value is None else value).lower()
+            if key not in codes:
+                codes[key] = len(self.values)
+                self.values.append('Unknown' if value is None else value)
+        self.lookup = codes
+        self.codes = np.array([codes[('Unknown' if value is None else value).lower()] for value in values],
+                              dtype=np.int32)
+        self.counts = np.bincount(self.codes, minlength=len(self.values))
+        # Posting lists in CSR form: rows of value c are order[offsets[c]:offsets[c + 1]]
+        self.order = np.argsort(self.codes, kind='stable').astype(np.int32)
+        self.offsets = np.concatenate(([0], np.cumsum(self.counts)))
+
+    def code(self, value):
+        return self.lookup.get(value.lower())
+
+    def rows(self, code):
+        return self.order[self.offsets[code]:self.offsets[code + 1]]
+
+
+class SortedColumn:
+    """
+    Values of one numeric attribute and the rows in ascending value order,
+    unknown (NaN) values last.
+    """
+
+    def __init__(self, values):
+        self.values = np.array(values, dtype=np.float64)
+        self.order = np.argsort(self.values, kind='stable').astype(np.int32)
+        self.known = int(np.count_nonzero(~np.isnan(self.values)))
+        self.sorted = self.values[self.order[:self.known]]
+
+    def bounds(self, low, high):
+        start = 0 if low is None else int(np.searchsorted(self.sorted, low, 'left'))
+        stop = self.known if high is None else int(np.searchsorted(self.sorted, high, 'right'))
+        return start, max(start, stop)
+
+    def percentile(self, value):
+        return percentile(self.sorted, value)
+
+
+class GroupedColumn:
+    """
+    Known values of one numeric attribute sorted within each value of a
+    categorical attribute (e.g. rating per position), in CSR form.
+    """
+
+    def __init__(self, column, codes, groups):
+        # A stable sort of the value order by code keeps the values sorted within each code
+        rows = column.order[:column.known]
+        grouped = rows[np.argsort(codes[rows], kind='stable')]
+        self.sorted = column.values[grouped]
+        self.offsets = np.concatenate(([0], np.cumsum(np.bincount(codes[rows], minlength=groups))))
+
+    def percentile(self, code, value):
+        return percentile(self.sorted[self.offsets[code]:self.offsets[code + 1]], value)
+
+
+def percentile(sorted_values, value):
+    """
+    Mid-rank percentile of a value among sorted values: the share below it plus
+    half the share equal to it, by two binary searches.
+
+    Returns:
+        float or None: The percentile (0-100), or None without values.
+    """
+    if value is None or not len(sorted_values):
+        return None
+    below = np.searchsorted(sorted_values, value, 'left')
+    equal = np.searchsorted(sorted_values, value, 'right') - below
+    return round(float(100 * (below + equal / 2) / len(sorted_values)), 1)
+
+
+class Equals:
+    """
+    Predicate: a categorical attribute has a value.
+    """
+
+    def __init__(self, attribute, value):
+        self.attribute = attribute
+        self.value = value
+
+    def estimate(self, snapshot):
+        code = snapshot.facets[self.attribute].code(self.value)
+        return 0 if code is None else int(snapshot.facets[self.attribute].counts[code])
+
+    def rows(self, snapshot):
+        facet = snapshot.facets[self.attribute]
+        code = facet.code(self.value)
+        return facet.rows(code) if code is not None else np.empty(0, dtype=np.int32)
+
+    def test(self, snapshot, rows):
+        facet = snapshot.facets[self.attribute]
+        code = facet.code(self.value)
+        return facet.codes[rows] == code if code is not None else np.zeros(len(rows), dtype=bool)
+
+    def __str__(self):
+        return f'{self.attribute} = {self.value!r}'
+
+
+class Range:
+    """
+    Predicate: a numeric attribute is known and within [low, high]; either bound may be None.
+    """
+
+    def __init__(self, attribute, low=None, high=None):
+        self.attribute = attribute
+        self.low = low
+        self.high = high
+
+    def estimate(self, snapshot):
+        start, stop = snapshot.numbers[self.attribute].bounds(self.low, self.high)
+        return stop - start
+
+    def rows(self, snapshot):
+        column = snapshot.numbers[self.attribute]
+        start, stop = column.bounds(self.low, self.high)
+        # The slice is in value order; the result sets are kept in row order
+        return np.sort(column.order[start:stop])
+
+    def test(self, snapshot, rows):
+        values = snapshot.numbers[self.attribute].values[rows]
+        with np.errstate(invalid='ignore'):
+            keep = ~np.isnan(values)
+            if self.low is not None:
+                keep &= values >= self.low
+            if self.high is not None:
+                keep &= values <= self.high
+        return keep
+
+    def __str__(self):
+        return f'{self.attribute} in [{self.low}, {self.high}]'
+
+
+class NameContains:
+    """
+    Predicate: the name contains a substring, case-insensitively.
+    """
+
+    def __init__(self, text):
+        self.text = text.lower()
+
+    def estimate(self, snapshot):
+        # Unknown without scanning; always evaluated last
+        return snapshot.size + 1
+
+    def rows(self, snapshot):
+        rows = np.arange(snapshot.size, dtype=np.int32)
+        return rows[self.test(snapshot, rows)]
+
+    def test(self, snapshot, rows):
+        names, text = snapshot.names, self.text
+        return np.fromiter((text in names[row] for row in rows.tolist()), dtype=bool, count=len(rows))
+
+    def __str__(self):
+        return f'name contains {self.text!r}'
+
+
+class Snapshot:
+    """
+    The indexed catalogue at one version.
+
+    Args:
+        rows (list): Tuples of the CATALOGUE_SELECT columns, in player_id order.
+        version (int): The catalogue version of the rows.
+    """
+
+    def __init__(self, rows, version):
+        self.version = version
+        self.size = len(rows)
+        columns = list(zip(*rows)) if rows else [()] * (2 + len(CATEGORICAL) + len(NUMERIC))
+        self.ids = np.array(columns[0], dtype=np.int64)
+        self.names = [(name or '').lower() for name in columns[1]]
+        self.facets = {attribute: Facet(columns[2 + i]) for i, attribute in enumerate(CATEGORICAL)}
+        self.numbers = {attribute: SortedColumn(columns[2 + len(CATEGORICAL) + i])
+                        for i, (attribute, _) in enumerate(NUMERIC)}
+        positions = self.facets['position']
+        self.by_position = {attribute: GroupedColumn(column, positions.codes, len(positions.values))
+                            for attribute, column in self.numbers.items()}
+
+    def plan(self, predicates):
+        """
+        Order predicates by estimated matches, most selective first.
+
+        Returns:
+            list: (predicate, estimated rows) tuples.
+        """
+        return sorted(((predicate, predicate.estimate(self)) for predicate in predicates), key=lambda p: p[1])
+
+    def match(self, predicates):
+        """
+        The rows matching all predicates.
+
+        Returns:
+            tuple: (row indices in player_id order, or None for all rows; the plan).
+        """
+        plan = self.plan(predicates)
+        if not plan:
+            return None, plan
+        rows = plan[0][0].rows(self)
+        for predicate, _ in plan[1:]:
+            if not len(rows):
+                break
+            rows = rows[predicate.test(self, rows)]
+        return rows, plan
+
+    def percentiles(self, values, position):
+        """
+        Percentiles of numeric values across the catalogue and among the players of a position.
+
+        Args:
+            values (dict): {attribute: value or None} for the NUMERIC attributes.
+            position (str): The position, or None for 'Unknown'.
+
+        Returns:
+            dict: position, players (overall and in the position) and per attribute
+            {value, overall, position} percentiles, None where unknown.
+        """
+        code = self.facets['position'].code('Unknown' if position is None else position)
+        position_players = 0 if code is None else int(self.facets['position'].counts[code])
+        return {
+            'position': position,
+            'players': {'overall': self.size, 'position': position_players},
+            'percentiles': {
+                attribute: {
+                    'value': values.get(attribute),
+                    'overall': self.numbers[attribute].percentile(values.get(attribute)),
+                    'position': None if code is None else
+                    self.by_position[attribute].percentile(code, values.get(attribute)),
+                }
+                for attribute, _ in NUMERIC
+            },
+        }
+
+    def facet_counts(self, predicates, rows, attributes, limit):
+        """
+        Count the matches per value of categorical attributes. Counting the
+        codes of the matching rows intersects them with every posting list
+        of the attribute at once. A facet that is itself filtered is counted
+        over the matches of the other predicates, so the alternatives to the
+        selected value keep their counts.
+
+        Args:
+            predicates (list): The search predicates.
+            rows (numpy.ndarray): The rows matching all predicates, or None for all rows.
+            attributes (list): The categorical attributes to count.
+            limit (int): Values returned per attribute.
+
+        Returns:
+            dict: {attribute: [{value, count}]}, most frequent values first.
+        """
+        facets = {}
+        for attribute in attributes:
+            facet = self.facets[attribute]
+            others = [predicate for predicate in predicates
+                      if not (isinstance(predicate, Equals) and predicate.attribute == attribute)]
+            facet_rows = rows if len(others) == len(predicates) else self.match(others)[0]
+            if facet_rows is None:
+                counts = facet.counts
+            else:
+                counts = np.bincount(facet.codes[facet_rows], minlength=len(facet.values))
+            nonzero = np.flatnonzero(counts)
+            if len(nonzero) > limit > 0:
+                # All values tied with the last one, then sort: the page does not depend on the partition
+                kth = np.partition(counts[nonzero], len(nonzero) - limit)[len(nonzero) - limit]
+                nonzero = nonzero[counts[nonzero] >= kth]
+            ranked = sorted(nonzero.tolist(), key=lambda code: (-counts[code], facet.values[code]))[:limit]
+            facets[attribute] = [{'value': facet.values[code], 'count': int(counts[code])} for code in ranked]
+        return facets
+
+    def rank(self, rows, sort, descending, offset, limit):
+        """
+        One page of rows ordered by a numeric attribute, unknown values last, ties by player_id.
+
+        Args:
+            rows (numpy.ndarray): Row indices in player_id order, or None for all rows.
+            sort (str): The numeric attribute.
+            descending (bool): Highest values first.
+            offset (int): Rows to skip.
+            limit (int): Rows to return.
+
+        Returns:
+            numpy.ndarray: The row indices of the page.
+        """
+        column = self.numbers[sort]
+        wanted = offset + limit
+        if rows is None:
+            if not descending:
+                # The stable ascending order already breaks ties by row, with unknown values last
+                return column.order[offset:wanted]
+            # The top of the sorted order, widened to all ties of its lowest value
+            start = column.known - min(wanted, column.known)
+            if start < column.known:
+                start = int(np.searchsorted(column.sorted, column.sorted[start], 'left'))
+            rows = np.concatenate((column.order[start:column.known],
+                                   column.order[column.known:column.known + wanted]))
+        return self._top(column, rows, wanted, descending)[offset:wanted]
+
+    @staticmethod
+    def _top(column, rows, wanted, descending):
+        keys = column.values[rows]
+        keys = np.where(np.isnan(keys), np.inf, -keys if descending else keys)
+        if len(rows) > wanted > 0:
+            # Keep all ties of the last key, so the page does not depend on the partition order
+            selected = keys <= np.partition(keys, wanted - 1)[wanted - 1]
+            rows, keys = rows[selected], keys[selected]
+        return rows[np.lexsort((rows, keys))]
+
+
+class Catalogue:
+    """
+    The current catalogue snapshot, rebuilt in the background when the catalogue changed.
+
+    Args:
+        connect (callable): Returns a new database connection.
+        ttl (float): Seconds before the catalogue version is checked again.
+    """
+
+    def __init__(self, connect, ttl=30.0):
+        self.connect = connect
+        self.ttl = ttl
+        self._snapshot = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def snapshot(self):
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    CACHE_REQUESTS.inc('catalogue', 'miss')
+                    self._refresh()
+                return self._snapshot
+        CACHE_REQUESTS.inc('catalogue', 'hit')
+        if time.monotonic() - self._checked_at >= self.ttl and self._lock.acquire(blocking=False):
+            threading.Thread(target=self._refresh_and_release, name='catalogue-refresh', daemon=True).start()
+        return snapshot
+
+    def _refresh(self):
+        conn = self.connect()
+        try:
+            cursor = conn.cursor()
+            version = catalogue_version(cursor)
+            if self._snapshot is None or self._snapshot.version != version:
+                start = time.perf_counter()
+                # One read transaction, so the rows match the version
+                cursor.execute('BEGIN')
+                try:
+                    version = catalogue_version(cursor)
+                    with SQL_DURATION.time('catalogue_rows'):
+                        cursor.execute(f'SELECT {CATALOGUE_SELECT} FROM Players ORDER BY player_id')
+                        rows = [tuple(row) for row in cursor.fetchall()]
+                finally:
+                    conn.rollback()
+                self._snapshot = Snapshot(rows, version)
+                logger.info("Indexed the catalogue: %d players in %.0f ms", len(rows),
+                            (time.perf_counter() - start) * 1000)
+            self._checked_at = time.monotonic()
+        finally:
+            conn.close()
+
+    def _refresh_and_release(self):
+        try:
+            self._refresh()
+        except Exception:
+            logger.exception("Catalogue refresh failed")
+        finally:
+            self._lock.release()
@@ -0,0 +1,180 @@
+"""
+Response compression middleware for the Flask application.
+
+Negotiates brotli (when the brotli package is installed) or gzip from the
+Accept-Encoding header and compresses JSON and text responses above a size
+threshold. Compressed bodies of responses from cacheable endpoints are kept
+in a small LRU cache keyed by a hash of the uncompressed body, so a feed that
+does not change between requests is only compressed once.
+"""
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+
+from flask import request
+
+from metrics import CACHE_REQUESTS
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = {
+    'application/json',
+    'application/x-ndjson',
+    'text/plain',
+    'text/html',
+    'text/css',
+    'text/csv',
+    'application/javascript',
+}
+
+
+def encoded_etags(etag):
+    """
+    List the entity tags a representation of the given ETag can be served with.
+
+    Compressed responses carry the encoding as an ETag suffix, so conditional
+    requests must accept every variant.
+
+    Args:
+        etag (str): The (unquoted) entity tag of the uncompressed body.
+
+    Returns:
+        tuple: The entity tag and its encoded variants.
+    """
+    return (etag, f'{etag}-gzip', f'{etag}-br')
+
+
+def if_none_match(etag):
+    """
+    Check whether the current request's If-None-Match matches an ETag in any
+    of its encodings.
+
+    Args:
+        etag (str): The (unquoted) entity tag of the uncompressed body.
+
+    Returns:
+        bool: True if the client already has the representation.
+    """
+    tags = request.if_none_match
+    if not tags:
+        return False
+    return any(tags.contains_weak(tag) for tag in encoded_etags(etag))
+
+
+class Compressor:
+    """
+    after_request hook that compresses eligible responses.
+
+    Args:
+        app (Flask, optional): The application to register the hook on.
+        min_size (int): Bodies smaller than this many bytes are sent as-is.
+        gzip_level (int): The gzip compression level.
+        brotli_quality (int): The brotli quality setting.
+        cache_size (int): The number of compressed bodies to keep.
+        cacheable_endpoints (iterable): Endpoint names whose compressed bodies are cached.
+    """
+
+    def __init__(self, app=None, min_size=1024, gzip_level=6, brotli_quality=5,
+                 cache_size=64, cacheable_endpoints=()):
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.cache_size = cache_size
+        self.cacheable_endpoints = set(cacheable_endpoints)
+        self.cache = OrderedDict()
+        self.cache_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.after_request(self.after_request)
+
+    def negotiate(self):
+        """
+        Pick the best supported encoding from the request's Accept-Encoding.
+
+        Returns:
+            str or None: 'br', 'gzip' or None if the client accepts neither.
+        """
+        accept = request.accept_encodings
+        if brotli is not None and accept['br'] > 0 and accept['br'] >= accept['gzip']:
+            return 'br'
+        if accept['gzip'] > 0:
+            return 'gzip'
+        return None
+
+    def compress(self, body, encoding):
+        """
+        Compress a body with the given encoding.
+
+        Args:
+            body (bytes): The uncompressed body.
+            encoding (str): 'br' or 'gzip'.
+
+        Returns:
+            bytes: The compressed body.
+        """
+        if encoding == 'br':
+            return brotli.compress(body, quality=self.brotli_quality)
+        return gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
+
+    def cached_compress(self, body, encoding):
+        """
+        Compress a body, reusing a previously compressed copy of the same bytes.
+
+        Args:
+            body (bytes): The uncompressed body.
+            encoding (str): 'br' or 'gzip'.
+
+        Returns:
+            bytes: The compressed body.
+        """
+        key = (encoding, hashlib.blake2b(body, digest_size=16).digest())
+        with self.cache_lock:
+            compressed = self.cache.get(key)
+            if compressed is not None:
+                self.cache.move_to_end(key)
+        if compressed is not None:
+            CACHE_REQUESTS.inc('compressed_body', 'hit')
+            return compressed
+        CACHE_REQUESTS.inc('compressed_body', 'miss')
+
+        compressed = self.compress(body, encoding)
+        with self.cache_lock:
+            self.cache[key] = compressed
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return compressed
+
+    def after_request(self, response):
+        if (response.status_code != 200
+                or response.direct_passthrough
+                or response.is_streamed
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        encoding = self.negotiate()
+        if encoding is None:
+            return response
+
+        body = response.get_data()
+        if len(body) < self.min_size:
+            return response
+
+        if request.endpoint in self.cacheable_endpoints:
+            compressed = self.cached_compress(body, encoding)
+        else:
+            compressed = self.compress(body, encoding)
+
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag:
+            response.set_etag(f'{etag}-{encoding}', weak)
+        return response
@@ -0,0 +1,201 @@
+"""
+Streaming bulk export of users' favorites and starting elevens.
+
+An export is the join of UserPlayers or StartingEleven with Users and
+Players, in primary-key order, written as NDJSON or CSV and optionally
+gzip-compressed. Rows are read in fixed-size batches and every batch is
+encoded and compressed before the next is read, so memory stays bounded by
+one batch whatever the size of the export.
+
+Each batch is its own statement, resuming after the primary key of the
+previous batch (keyset pagination on the table's primary key index). A
+single statement stepping through millions of rows would hold SQLite's
+shared lock for the whole export and keep every writer waiting; between
+batches writers can commit. The export is therefore not a point-in-time
+snapshot: a row changed during the export appears once, as it was when its
+batch was read.
+
+Export from the command line, without starting the application:
+
+    python export.py favorites --format csv --gzip --output favorites.csv.gz
+
+The command line reads the replica when it is fresh enough (see
+replica.py, REPLICA_MAX_STALENESS), unless --primary is given.
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sqlite3
+import sys
+import time
+import zlib
+
+from replica import Replica, default_path
+
+try:
+    import orjson
+except ImportError:  # orjson is optional
+    orjson = None
+
+# Player columns of an export: the attributes as stored and their typed values
+PLAYER_COLUMNS = ('player_id', 'name', 'position', 'team', 'nationality', 'foot', 'birthDate', 'height',
+                  'market_value', 'wage', 'rating', 'potential', 'img', 'height_cm', 'market_value_eur',
+                  'wage_eur', 'rating_value', 'potential_value', 'birth_day', 'source_uri')
+
+# name -> (table, primary key, columns of the table besides user_id)
+EXPORTS = {
+    'favorites': ('UserPlayers', ('user_id', 'player_id'), ()),
+    'lineups': ('StartingEleven', ('user_id', 'position'), (('position', 'lineup_position'),)),
+}
+FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+BATCH_SIZE = 5000
+
+
+def export_columns(name):
+    """
+    The column names of an export, in order.
+    """
+    _, _, own = EXPORTS[name]
+    return ('user_id', 'username', *(alias for _, alias in own), *PLAYER_COLUMNS)
+
+
+def batches(conn, name, batch_size=BATCH_SIZE):
+    """
+    Read the rows of an export in primary-key order, one batch at a time.
+
+    Args:
+        conn (sqlite3.Connection): The connection to read from.
+        name (str): 'favorites' or 'lineups'.
+        batch_size (int): Rows per batch.
+
+    Yields:
+        list: Up to batch_size row tuples, in the order of export_columns(name).
+    """
+    table, key, own = EXPORTS[name]
+    select = ', '.join([f'{table}.user_id', 'Users.username', *(f'{table}.{column}' for column, _ in own),
+                        *(f'Players.{column}' for column in PLAYER_COLUMNS)])
+    statement = f'''
+        SELECT {select}, {', '.join(f'{table}.{column}' for column in key)}
+        FROM {table}
+        JOIN Users ON Users.user_id = {table}.user_id
+        JOIN Players ON Players.player_id = {table}.player_id
+        {{where}}
+        ORDER BY {', '.join(f'{table}.{column}' for column in key)}
+        LIMIT ?
+    '''
+    first = statement.format(where='')
+    following = statement.format(where=f'WHERE ({", ".join(f"{table}.{column}" for column in key)}) > '
+                                       f'({", ".join("?" * len(key))})')
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    after = None
+    while True:
+        if after is None:
+            cursor.execute(first, (batch_size,))
+        else:
+            cursor.execute(following, (*after, batch_size))
+        # fetchall() steps the statement to its end, which releases the shared lock before the batch is written
+        rows = cursor.fetchall()
+        if not rows:
+            return
+        after = rows[-1][-len(key):]
+        yield [row[:-len(key)] for row in rows]
+        if len(rows) < batch_size:
+            return
+
+
+def encode(columns, row_batches, file_format):
+    """
+    Encode batches of rows as NDJSON or CSV.
+
+    Args:
+        columns (tuple): The column names.
+        row_batches (iterable): Lists of row tuples.
+        file_format (str): 'ndjson' or 'csv'.
+
+    Yields:
+        bytes: The encoded header (CSV) and batches.
+    """
+    if file_format == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator='\n')
+        writer.writerow(columns)
+        yield buffer.getvalue().encode('utf-8')
+        for rows in row_batches:
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows(rows)
+            yield buffer.getvalue().encode('utf-8')
+    elif orjson is not None:
+        for rows in row_batches:
+            yield b''.join(orjson.dumps(dict(zip(columns, row))) + b'\n' for row in rows)
+    else:
+        for rows in row_batches:
+            yield ''.join(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + '\n' for row in rows).encode('utf-8')
+
+
+def gzipped(chunks, level=6):
+    """
+    Compress a stream of chunks into one gzip stream.
+
+    Yields:
+        bytes: Compressed data, as it becomes available.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def stream(conn, name, file_format='ndjson', compress=False, batch_size=BATCH_SIZE):
+    """
+    Stream an export as bytes.
+
+    Args:
+        conn (sqlite3.Connection): The connection to read from; it is not closed.
+        name (str): 'favorites' or 'lineups'.
+        file_format (str): 'ndjson' or 'csv'.
+        compress (bool): Gzip the output.
+        batch_size (int): Rows read and encoded at a time.
+
+    Yields:
+        bytes: The export, chunk by chunk.
+    """
+    chunks = encode(export_columns(name), batches(conn, name, batch_size), file_format)
+    yield from gzipped(chunks) if compress else chunks
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export users\' favorites or starting elevens joined with the players.')
+    parser.add_argument('export', choices=sorted(EXPORTS))
+    parser.add_argument('--format', choices=sorted(FORMATS), default='ndjson')
+    parser.add_argument('--gzip', action='store_true', help='gzip the output')
+    parser.add_argument('--output', help='the output file (default stdout)')
+    parser.add_argument('--database', default=os.getenv('DATABASE_PATH', 'database.db'))
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--primary', action='store_true', help='read the database even if a fresh replica exists')
+    args = parser.parse_args()
+
+    replica = Replica(os.getenv('REPLICA_PATH') or default_path(args.database),
+                      0 if args.primary else float(os.getenv('REPLICA_MAX_STALENESS', 0)),
+                      lambda: sqlite3.connect(f'file:{args.database}?mode=ro', uri=True, timeout=30))
+    as_of = replica.as_of()
+    if as_of is not None:
+        print(f'Reading the replica, {time.time() - as_of:.0f} s old', file=sys.stderr)
+    conn = replica.connect()
+    output = open(args.output, 'wb') if args.output else sys.stdout.buffer
+    try:
+        for chunk in stream(conn, args.export, args.format, args.gzip, args.batch_size):
+            output.write(chunk)
+    finally:
+        conn.close()
+        if args.output:
+            output.close()
+
+
+if __name__ == '__main__':
+    main()
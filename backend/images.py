@@ -0,0 +1,397 @@
+"""
+Player image proxy with a content-addressed cache on disk.
+
+Player pictures are third-party URLs (Players.img, SPARQL results). Instead
+of making browsers hotlink them at full size, the API hands out
+/img/<key> links, where the key is a hash of the source URL. Keys are
+registered in Images with their URL when a link is handed out, so the
+proxy only ever fetches URLs the application has seen.
+
+Only hosts in the allowlist are proxied; an empty allowlist proxies
+nothing. The host must resolve to public addresses only (no loopback,
+private, link-local or reserved ones, unless allow_private is set for an
+image host on the local network), and redirects are followed by hand,
+at most MAX_REDIRECTS, each hop checked the same way, so a URL cannot make
+the server fetch from its own network.
+
+The first request for a key fetches the image once, checks that it is a
+raster image and stores it under the SHA-256 of its bytes; thumbnails are
+made from the stored original on first request (an original that passed
+the check but cannot be decoded, e.g. truncated, is served instead):
+
+    <directory>/<hh>/<sha256>              the original
+    <directory>/<hh>/<sha256>-<size>.webp  a size x size thumbnail, cropped from the top centre
+
+Files are written to a temporary name and renamed, and never change
+afterwards, so they are served with the content hash as ETag and an
+immutable Cache-Control. Keys whose image has the same bytes share the
+files. Concurrent requests for a key in a process wait for a single fetch;
+failed fetches are remembered for FAILURE_TTL seconds.
+"""
+import hashlib
+import ipaddress
+import logging
+import os
+import re
+import socket
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urljoin, urlsplit
+
+import requests
+from PIL import Image, ImageOps
+
+from metrics import CACHE_REQUESTS, SQL_DURATION, THUMBNAIL_ERRORS, UPSTREAM_DURATION, UPSTREAM_ERRORS
+
+logger = logging.getLogger('images')
+
+KEY = re.compile(r'[0-9a-f]{32}')
+# Served as-is; anything else (e.g. SVG, which may carry scripts) is refused
+RASTER_FORMATS = {'JPEG', 'PNG', 'GIF', 'WEBP'}
+FAILURE_TTL = 300
+CHUNK_SIZE = 65536
+MAX_REDIRECTS = 3
+LOCK_STRIPES = 64
+
+
+class ImageError(Exception):
+    """
+    An image that cannot be served, with the HTTP status to answer with.
+    """
+
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.status = status
+
+
+def image_key(url):
+    """
+    The key of an image URL in /img/<key> links.
+
+    Returns:
+        str: 32 hex digits of the SHA-256 of the URL.
+    """
+    return hashlib.sha256(url.encode('utf-8')).hexdigest()[:32]
+
+
+def allowed(url, hosts):
+    """
+    Whether an image URL is an http(s) URL on one of the allowed hosts.
+
+    Args:
+        url (str): The image URL.
+        hosts (iterable): Lower-case host names; empty allows none.
+    """
+    if not url:
+        return False
+    parts = urlsplit(url)
+    return parts.scheme in ('http', 'https') and bool(parts.hostname) and parts.hostname.lower() in hosts
+
+
+class ImageProxy:
+    """
+    Fetches, stores and resolves proxied player images.
+
+    Args:
+        connect (callable): Returns a new database connection.
+        directory (str): Where the images are stored.
+        thumbnail_size (int): The width and height of thumbnails, in pixels.
+        max_bytes (int): Larger images are refused.
+        timeout (float): Seconds to wait for the image host.
+        allowed_hosts (iterable): Hosts images may be fetched from; empty allows none.
+        cache_size (int): Resolved keys and failures kept in memory.
+        allow_private (bool): Also fetch from hosts with loopback, private, link-local or reserved addresses.
+    """
+
+    def __init__(self, connect, directory, thumbnail_size=128, max_bytes=5_000_000, timeout=10.0,
+                 allowed_hosts=(), cache_size=10_000, allow_private=False):
+        self.connect = connect
+        self.directory = directory
+        self.thumbnail_size = thumbnail_size
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.allowed_hosts = {host.lower() for host in allowed_hosts}
+        self.cache_size = cache_size
+        self.allow_private = allow_private
+        self.resolved = OrderedDict()  # key -> (content hash, content type)
+        self.registered = set()
+        self.failures = OrderedDict()  # key -> monotonic time of the failure
+        self.locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        self.lock = threading.Lock()
+
+    def proxied(self, url):
+        """
+        Whether an image URL can be served through the proxy.
+        """
+        return allowed(url, self.allowed_hosts)
+
+    def link(self, url, thumbnail=True):
+        """
+        The /img link of an image URL, or None if it is not proxied.
+        The URL must be registered (see register).
+        """
+        if not self.proxied(url):
+            return None
+        return f'/img/{image_key(url)}' + ('?size=thumb' if thumbnail else '')
+
+    def register(self, cursor, urls):
+        """
+        Record the source URL of image keys, inside the caller's write transaction.
+
+        Args:
+            cursor (sqlite3.Cursor): The cursor of the transaction.
+            urls (iterable): Image URLs; URLs that are not proxied are skipped.
+        """
+        with SQL_DURATION.time('register_images'):
+            cursor.executemany('INSERT OR IGNORE INTO Images (image_key, url) VALUES (?, ?)',
+                               ((image_key(url), url) for url in set(urls) if self.proxied(url)))
+
+    def ensure_registered(self, urls):
+        """
+        Record the source URL of image keys not known yet, e.g. of SPARQL search
+        results. Keys registered earlier by this process cost no query.
+
+        Args:
+            urls (iterable): Image URLs; URLs that are not proxied are skipped.
+        """
+        pending = {image_key(url): url for url in urls if self.proxied(url)}
+        pending = {key: url for key, url in pending.items() if key not in self.registered}
+        if not pending:
+            return
+        conn = self.connect()
+        try:
+            cursor = conn.cursor()
+            with SQL_DURATION.time('registered_images'):
+                cursor.execute(f'SELECT image_key FROM Images WHERE image_key IN ({", ".join("?" * len(pending))})',
+                               list(pending))
+                known = {row[0] for row in cursor.fetchall()}
+            if len(known) < len(pending):
+                self.register(cursor, [url for key, url in pending.items() if key not in known])
+                conn.commit()
+        finally:
+            conn.close()
+        with self.lock:
+            if len(self.registered) + len(pending) > self.cache_size:
+                self.registered.clear()
+            self.registered.update(pending)
+
+    def open(self, key, thumbnail=False):
+        """
+        Resolve a key to a stored file, fetching the image or making the
+        thumbnail first if needed.
+
+        Args:
+            key (str): The image key.
+            thumbnail (bool): Return the thumbnail instead of the original.
+
+        Returns:
+            tuple: (path, content type, entity tag) of the file.
+
+        Raises:
+            ImageError: Unknown key (404) or the image could not be fetched (502).
+        """
+        if not KEY.fullmatch(key):
+            raise ImageError('Image not found', 404)
+        resolved = self._resolved(key)
+        if resolved is None:
+            with self._key_lock(key):
+                resolved = self._resolved(key) or self._fetch(key)
+        else:
+            CACHE_REQUESTS.inc('image', 'hit')
+        content_hash, content_type = resolved
+        if not thumbnail:
+            return self._path(content_hash), content_type, content_hash
+
+        path = self._path(content_hash, self.thumbnail_size)
+        if os.path.exists(path):
+            CACHE_REQUESTS.inc('thumbnail', 'hit')
+        else:
+            with self._key_lock(content_hash):
+                if not os.path.exists(path):
+                    CACHE_REQUESTS.inc('thumbnail', 'miss')
+                    if not self._make_thumbnail(content_hash, path):
+                        return self._path(content_hash), content_type, content_hash
+        return path, 'image/webp', f'{content_hash}-{self.thumbnail_size}'
+
+    def _path(self, content_hash, size=None):
+        name = content_hash if size is None else f'{content_hash}-{size}.webp'
+        return os.path.join(self.directory, content_hash[:2], name)
+
+    def _key_lock(self, key):
+        return self.locks[int(key[:8], 16) % LOCK_STRIPES]
+
+    def _resolved(self, key):
+        """
+        The (content hash, content type) of a fetched image whose file exists, or None.
+        """
+        with self.lock:
+            resolved = self.resolved.get(key)
+            if resolved is not None:
+                self.resolved.move_to_end(key)
+                return resolved
+        conn = self.connect()
+        try:
+            with SQL_DURATION.time('image_by_key'):
+                row = conn.execute('SELECT content_hash, content_type FROM Images WHERE image_key = ?',
+                                   (key,)).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            raise ImageError('Image not found', 404)
+        if row[0] is None or not os.path.exists(self._path(row[0])):
+            return None
+        with self.lock:
+            self.resolved[key] = (row[0], row[1])
+            if len(self.resolved) > self.cache_size:
+                self.resolved.popitem(last=False)
+        return row[0], row[1]
+
+    def _fetch(self, key):
+        """
+        Fetch the image of a key into the cache and record its content hash.
+
+        Returns:
+            tuple: (content hash, content type).
+        """
+        with self.lock:
+            failed_at = self.failures.get(key)
+        if failed_at is not None and time.monotonic() - failed_at < FAILURE_TTL:
+            raise ImageError('Image could not be fetched', 502)
+        CACHE_REQUESTS.inc('image', 'miss')
+
+        conn = self.connect()
+        try:
+            url = conn.execute('SELECT url FROM Images WHERE image_key = ?', (key,)).fetchone()[0]
+        finally:
+            conn.close()
+        if not self.proxied(url):
+            raise ImageError('Image not found', 404)
+        os.makedirs(self.directory, exist_ok=True)
+        descriptor, temporary = tempfile.mkstemp(dir=self.directory, prefix='.fetch-')
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                content_hash = self._download(url, file)
+            with Image.open(temporary) as image:
+                image_format = image.format
+                image.verify()
+            if image_format not in RASTER_FORMATS:
+                raise ImageError(f'Unsupported image format {image_format}', 502)
+            path = self._path(content_hash)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(temporary, path)
+        except (requests.RequestException, OSError, SyntaxError, ValueError, ImageError) as e:
+            # Pillow raises OSError (UnidentifiedImageError), SyntaxError or ValueError for non-images.
+            # The details stay in the log: they may name internal hosts
+            UPSTREAM_ERRORS.inc('image')
+            logger.warning("Image %s from %s could not be fetched: %s", key, url, e)
+            self._record_failure(key)
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise ImageError('Image could not be fetched', 502) from e
+        with self.lock:
+            self.failures.pop(key, None)
+
+        content_type = Image.MIME[image_format]
+        conn = self.connect()
+        try:
+            with SQL_DURATION.time('store_image'):
+                conn.execute('UPDATE Images SET content_hash = ?, content_type = ?, fetched_at = ? WHERE image_key = ?',
+                             (content_hash, content_type, int(time.time()), key))
+                conn.commit()
+        finally:
+            conn.close()
+        return content_hash, content_type
+
+    def _record_failure(self, key):
+        """
+        Remember a failed fetch, dropping expired failures and the oldest beyond cache_size.
+        """
+        now = time.monotonic()
+        with self.lock:
+            self.failures.pop(key, None)
+            self.failures[key] = now
+            while self.failures and (len(self.failures) > self.cache_size
+                                     or now - next(iter(self.failures.values())) >= FAILURE_TTL):
+                self.failures.popitem(last=False)
+
+    def _check_address(self, url):
+        """
+        Refuse a URL whose host is not allowed or resolves to a non-public address.
+
+        Raises:
+            ImageError: The URL may not be fetched.
+        """
+        if not self.proxied(url):
+            raise ImageError(f'Host of {url} is not allowed', 502)
+        if self.allow_private:
+            return
+        parts = urlsplit(url)
+        try:
+            addresses = socket.getaddrinfo(parts.hostname, parts.port or (443 if parts.scheme == 'https' else 80),
+                                           proto=socket.IPPROTO_TCP)
+        except socket.gaierror as e:
+            raise ImageError(f'Host of {url} does not resolve: {e}', 502) from None
+        for *_, sockaddr in addresses:
+            address = ipaddress.ip_address(sockaddr[0].split('%')[0])
+            if not address.is_global or address.is_multicast:
+                raise ImageError(f'Host of {url} resolves to the non-public address {address}', 502)
+
+    def _download(self, url, file):
+        """
+        Stream an image into a file, up to max_bytes, following at most
+        MAX_REDIRECTS redirects to hosts that pass the same checks.
+
+        Returns:
+            str: The SHA-256 of the bytes.
+        """
+        digest = hashlib.sha256()
+        size = 0
+        with UPSTREAM_DURATION.time('image'):
+            for _ in range(MAX_REDIRECTS + 1):
+                self._check_address(url)
+                response = requests.get(url, stream=True, timeout=self.timeout, allow_redirects=False)
+                if not response.is_redirect:
+                    break
+                response.close()
+                url = urljoin(url, response.headers['Location'])
+            else:
+                raise ImageError(f'More than {MAX_REDIRECTS} redirects', 502)
+            with response:
+                response.raise_for_status()
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise ImageError(f'Image larger than {self.max_bytes} bytes', 502)
+                    digest.update(chunk)
+                    file.write(chunk)
+        return digest.hexdigest()
+
+    def _make_thumbnail(self, content_hash, path):
+        """
+        Make the thumbnail of a stored original.
+
+        Returns:
+            bool: False if the original cannot be decoded, e.g. a truncated image that passed
+            verify(); the original is then served instead.
+        """
+        try:
+            with Image.open(self._path(content_hash)) as image:
+                image = ImageOps.exif_transpose(image)
+                image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+                thumbnail = ImageOps.fit(image, (self.thumbnail_size, self.thumbnail_size), Image.LANCZOS,
+                                         centering=(0.5, 0.0))
+        except (OSError, SyntaxError, ValueError, Image.DecompressionBombError) as e:
+            THUMBNAIL_ERRORS.inc()
+            logger.warning("Image %s could not be decoded for a thumbnail: %s", content_hash, e)
+            return False
+        descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.thumbnail-')
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                thumbnail.save(file, 'WEBP', quality=80)
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+        return True
@@ -0,0 +1,593 @@
+"""
+Bulk import of users' favorites and lineups, e.g. when migrating from
+another system.
+
+Adding favorites or lineup positions through the API costs a request, two
+connections and a commit per row. The importer instead reads its input as a
+stream, in the format written by `export.py favorites` or `export.py
+lineups` (NDJSON or CSV, optionally gzip-compressed, one favorite or lineup
+position per row with the username, the player's attributes and, for
+lineups, the lineup_position), and loads it in batches, one write
+transaction per batch:
+
+1. the distinct usernames, player source URIs and player names of the batch
+   are looked up with `IN (...)` queries; rows of unknown users, and rows
+   without a username, player name or lineup position, are rejected and
+   reported with the batch;
+2. players are identified as in add_favorite_player: by their source_uri,
+   and those without one by name, team and birth date among the players
+   without one. The players the catalogue does not have yet are inserted,
+   with their typed values, and their images registered if they are on an
+   allowed host (--image-hosts, by default IMAGE_HOSTS as in app.py);
+3. the favorites or lineup positions are staged in a temporary table in
+   primary-key order and the ones the users already have are dropped:
+   - the favorites are inserted with one INSERT ... SELECT. Instead of the
+     UserPlayers insert triggers, which would run four statements per
+     favorite, favorite_count and FavoriteCounts are updated once per
+     player and per group;
+   - the lineup positions are upserted with one INSERT ... SELECT, the last
+     row of a user and position winning as in add_to_starting_eleven, and
+     the LineupAggregates of the users changed are recomputed from their
+     starting elevens, at most eleven rows each, instead of one
+     lineup_delta() per position.
+   The version of every user changed is bumped and their cached profile
+   document dropped, to be rebuilt on its next read.
+
+After each commit the number of input rows done is written to the checkpoint
+file, atomically by renaming a temporary file. Run again with the same
+checkpoint, an interrupted import skips these rows and resumes with the next
+batch. A batch committed but not checkpointed is simply loaded again: its
+players and favorites exist by then and are skipped.
+
+Every batch is reported on stdout as one JSON line; a batch that fails is
+rolled back and ends the import, its checkpoint still at the batch's start.
+
+    python importer.py favorites.csv.gz --checkpoint favorites.checkpoint.json
+    python importer.py lineups.ndjson --kind lineups
+"""
+import argparse
+import csv
+import gc
+import gzip
+import io
+import itertools
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+
+from images import allowed, image_key
+from leaderboard import DIMENSIONS
+from player_values import LINEUP_AGGREGATE_COLUMNS, LINEUP_AGGREGATE_VALUES, TYPED_COLUMNS, typed_values
+
+try:
+    import orjson
+except ImportError:  # orjson is optional
+    orjson = None
+
+# Players columns read from the input; the typed columns are computed, player IDs of the source ignored
+TEXT_COLUMNS = ('name', 'position', 'team', 'market_value', 'nationality', 'height', 'img',
+                'birthDate', 'wage', 'potential', 'rating', 'description', 'foot', 'source_uri')
+FORMATS = ('csv', 'ndjson')
+# What an input holds: the columns every row needs, and the report key of the rows added
+KINDS = {
+    'favorites': (('username', 'name'), 'favorites_added'),
+    'lineups': (('username', 'name', 'lineup_position'), 'positions_set'),
+}
+BATCH_SIZE = 50_000
+# Rejected rows listed in a batch report; the others are only counted
+ERROR_SAMPLE = 10
+# SQLite's default limit of host parameters is 32766; stay well below it
+IN_BATCH = 500
+# The UserPlayers insert triggers (see init_db) whose updates _insert_favorites() makes itself
+INSERT_TRIGGERS = ('userplayers_insert_count', 'userplayers_insert_groups')
+# Player IDs by key (see player_key()): the source URI, or name, team and birth date of players without one
+PLAYERS_BY_SOURCE_URI = 'SELECT source_uri, player_id FROM Players WHERE source_uri IN ({keys})'
+PLAYERS_BY_NAME = '''
+    SELECT name, team, birthDate, MIN(player_id) FROM Players
+    WHERE name IN ({keys}) AND source_uri IS NULL
+    GROUP BY name, team, birthDate
+'''
+
+
+def input_format(path):
+    """
+    The format of an input file from its name, e.g. 'csv' for favorites.csv.gz.
+    """
+    name = path[:-3] if path.endswith('.gz') else path
+    return 'csv' if name.endswith('.csv') else 'ndjson'
+
+
+def open_input(path):
+    """
+    Open an input file, or stdin for '-', in binary mode; gzip is detected from its magic number.
+    """
+    binary = sys.stdin.buffer if path == '-' else open(path, 'rb')
+    if binary.peek(2)[:2] == b'\x1f\x8b':
+        binary = gzip.GzipFile(fileobj=binary)
+    return binary
+
+
+def parse(binary, file_format, kind='favorites'):
+    """
+    Parse the rows of an input stream.
+
+    Args:
+        binary (io.BufferedIOBase): The input.
+        file_format (str): 'csv' or 'ndjson'.
+        kind (str): 'favorites' or 'lineups'.
+
+    Yields:
+        tuple: (username, player name, lineup position, record) per row, the lineup position
+        None for favorites and the record being the dict of the row's columns, or for CSV a
+        (header, values) pair (see player_row()); or a str describing why the row cannot be parsed.
+
+    Raises:
+        ValueError: If a CSV header has no username, name or, for lineups, lineup_position column.
+    """
+    keys = KINDS[kind][0]
+    if file_format == 'csv':
+        reader = csv.reader(io.TextIOWrapper(binary, encoding='utf-8', newline=''))
+        header = next(reader, [])
+        missing = [column for column in keys if column not in header]
+        if missing:
+            raise ValueError(f'the CSV header has no {" or ".join(missing)} column')
+        indexes = [header.index(column) for column in keys]
+        for values in reader:
+            if len(values) != len(header):
+                yield f'{len(values)} fields, the header has {len(header)}'
+                continue
+            # CSV cannot tell an empty string from NULL; the export writes NULL as an empty field
+            username, name, *position = (values[index] or None for index in indexes)
+            yield username, name, position[0] if position else None, (header, values)
+        return
+    # orjson parses bytes; decoding every line to str first would double the parsing time
+    loads = orjson.loads if orjson is not None else json.loads
+    for line in binary:
+        try:
+            record = loads(line)
+        except ValueError as e:
+            yield f'invalid JSON: {e}'
+            continue
+        if not isinstance(record, dict):
+            yield 'not a JSON object'
+            continue
+        username, name, *position = (None if record.get(column) is None else str(record[column]) for column in keys)
+        yield username, name, position[0] if position else None, record
+
+
+def player_row(record):
+    """
+    The Players row of a new player: the values of its TEXT_COLUMNS and TYPED_COLUMNS.
+
+    Args:
+        record (dict or tuple): A record as yielded by parse().
+    """
+    if isinstance(record, tuple):
+        record = dict(zip(*record))
+    player = {column: text_value(record, column) for column in TEXT_COLUMNS}
+    return (*player.values(), *typed_values(player))
+
+
+def player_key(record):
+    """
+    The identity of the player of a record, as stored by player_row(): its source URI, or
+    (name, team, birthDate) if it has none.
+
+    Args:
+        record (dict or tuple): A record as yielded by parse().
+    """
+    if isinstance(record, tuple):
+        record = dict(zip(*record))
+    source_uri = text_value(record, 'source_uri')
+    if source_uri is not None:
+        return source_uri
+    return text_value(record, 'name'), text_value(record, 'team'), text_value(record, 'birthDate')
+
+
+def text_value(record, column):
+    """
+    The stored value of a text column of a record: None if missing or empty.
+    """
+    value = record.get(column)
+    return None if value in (None, '') else str(value)
+
+
+def find_players(cursor, keys):
+    """
+    Look up the players of keys as returned by player_key().
+
+    Returns:
+        dict: The player ID of each key found.
+    """
+    source_uris = [key for key in keys if isinstance(key, str)]
+    names = {key[0] for key in keys if not isinstance(key, str)}
+    players = dict(select_in(cursor, PLAYERS_BY_SOURCE_URI, source_uris))
+    players.update(((name, team, birth_date), player_id)
+                   for name, team, birth_date, player_id in select_in(cursor, PLAYERS_BY_NAME, names))
+    return players
+
+
+def select_in(cursor, query, keys):
+    """
+    Run a query for keys in batches of `IN (...)` lists.
+
+    Args:
+        cursor (sqlite3.Cursor): The cursor to run the query on.
+        query (str): The query, with a `{keys}` placeholder for the list of parameters.
+        keys (iterable): The keys to look up.
+
+    Returns:
+        list: The rows of all batches.
+    """
+    keys = list(keys)
+    rows = []
+    for start in range(0, len(keys), IN_BATCH):
+        batch = keys[start:start + IN_BATCH]
+        cursor.execute(query.format(keys=', '.join('?' * len(batch))), batch)
+        rows += cursor.fetchall()
+    return rows
+
+
+class Importer:
+    """
+    Load batches of favorites or lineup positions into the database, one transaction per batch.
+
+    Args:
+        conn (sqlite3.Connection): A connection in autocommit mode (isolation_level=None).
+        kind (str): 'favorites' or 'lineups'.
+        image_hosts (iterable): Lower-case hosts whose images are registered; empty registers none.
+    """
+
+    def __init__(self, conn, kind='favorites', image_hosts=()):
+        self.conn = conn
+        self.kind = kind
+        self.image_hosts = frozenset(image_hosts)
+        conn.execute('PRAGMA temp_store = MEMORY')
+        conn.execute('''
+            CREATE TEMP TABLE IF NOT EXISTS ImportFavorites (
+                user_id INTEGER,
+                player_id INTEGER,
+                PRIMARY KEY (user_id, player_id)
+            ) WITHOUT ROWID
+        ''')
+        conn.execute('''
+            CREATE TEMP TABLE IF NOT EXISTS ImportCounts (
+                player_id INTEGER PRIMARY KEY,
+                favorites INTEGER NOT NULL
+            )
+        ''')
+        conn.execute('''
+            CREATE TEMP TABLE IF NOT EXISTS ImportLineups (
+                user_id INTEGER,
+                position TEXT,
+                player_id INTEGER,
+                PRIMARY KEY (user_id, position)
+            ) WITHOUT ROWID
+        ''')
+
+    def load(self, first_row, rows):
+        """
+        Load one batch of rows in a write transaction.
+
+        Args:
+            first_row (int): The row number of the first row of the batch in the input.
+            rows (list): Rows as yielded by parse().
+
+        Returns:
+            dict: The batch report: row counts and a sample of the rejected rows.
+        """
+        errors = []
+        valid = []
+        usernames, keys = set(), set()
+        for number, row in enumerate(rows, first_row):
+            if isinstance(row, str):
+                errors.append((number, row))
+            elif row[0] is None:
+                errors.append((number, 'missing username'))
+            elif row[1] is None:
+                errors.append((number, 'missing player name'))
+            elif self.kind == 'lineups' and row[2] is None:
+                errors.append((number, 'missing lineup position'))
+            else:
+                key = player_key(row[3])
+                valid.append((number, row[0], key, row[2], row[3]))
+                usernames.add(row[0])
+                keys.add(key)
+
+        cursor = self.conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            users = dict(select_in(cursor, 'SELECT username, user_id FROM Users WHERE username IN ({keys})', usernames))
+            players = find_players(cursor, keys)
+            accepted = []
+            new_players = {}
+            for number, username, key, position, record in valid:
+                user_id = users.get(username)
+                if user_id is None:
+                    errors.append((number, f'unknown user {username!r}'))
+                    continue
+                accepted.append((user_id, position, key))
+                if key not in players:
+                    # The attributes of a new player are those of its first row
+                    new_players.setdefault(key, record)
+            if new_players:
+                self._insert_players(cursor, new_players.values())
+                players.update(find_players(cursor, new_players))
+            # In primary-key order, so every insert appends to the b-trees of the staging and target tables
+            if self.kind == 'lineups':
+                # Built in input order: the last row of a user and position wins, as in add_to_starting_eleven
+                lineup = {(user_id, position): players[key] for user_id, position, key in accepted}
+                added, users_changed = self._insert_lineups(cursor, sorted(lineup.items()))
+            else:
+                favorites = {(user_id, players[key]) for user_id, _, key in accepted}
+                added, users_changed = self._insert_favorites(cursor, sorted(favorites))
+            cursor.execute('COMMIT')
+        except BaseException:
+            cursor.execute('ROLLBACK')
+            raise
+
+        errors.sort()
+        unchanged = 'already_favorites' if self.kind == 'favorites' else 'positions_unchanged'
+        return {
+            'rows': len(rows),
+            'first_row': first_row,
+            KINDS[self.kind][1]: added,
+            unchanged: len(accepted) - added,
+            'players_added': len(new_players),
+            'users': users_changed,
+            'rejected': len(errors),
+            'errors': [{'row': number, 'error': error} for number, error in errors[:ERROR_SAMPLE]],
+        }
+
+    def _insert_players(self, cursor, records):
+        """
+        Insert new players, with their typed values, and register their images on allowed hosts.
+
+        Args:
+            cursor (sqlite3.Cursor): The cursor of the open write transaction.
+            records (iterable): The record of each new player.
+        """
+        columns = (*TEXT_COLUMNS, *(column for column, _, _ in TYPED_COLUMNS))
+        rows = [player_row(record) for record in records]
+        cursor.executemany(f'INSERT INTO Players ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))})', rows)
+        urls = {row[TEXT_COLUMNS.index('img')] for row in rows}
+        cursor.executemany('INSERT OR IGNORE INTO Images (image_key, url) VALUES (?, ?)',
+                           ((image_key(url), url) for url in urls if allowed(url, self.image_hosts)))
+
+    def _insert_favorites(self, cursor, favorites):
+        """
+        Insert the favorites the users do not have yet, and update what the
+        UserPlayers insert triggers maintain, and the user versions.
+
+        The per-row triggers listed in INSERT_TRIGGERS are dropped for the
+        insert and recreated before the commit, so other connections never
+        see UserPlayers without them; what they maintain is updated once per
+        player and per group instead.
+
+        Args:
+            cursor (sqlite3.Cursor): The cursor of the open write transaction.
+            favorites (list): Distinct (user_id, player_id) pairs, sorted.
+
+        Returns:
+            tuple: (favorites inserted, users whose favorites changed).
+        """
+        cursor.executemany('INSERT INTO temp.ImportFavorites (user_id, player_id) VALUES (?, ?)', favorites)
+        cursor.execute('''
+            DELETE FROM temp.ImportFavorites
+            WHERE EXISTS (SELECT 1 FROM UserPlayers
+                          WHERE UserPlayers.user_id = ImportFavorites.user_id AND UserPlayers.player_id = ImportFavorites.player_id)
+        ''')
+        cursor.execute(f"SELECT name, sql FROM sqlite_master WHERE type = 'trigger' "
+                       f"AND name IN ({', '.join('?' * len(INSERT_TRIGGERS))})", INSERT_TRIGGERS)
+        triggers = cursor.fetchall()
+        for name, _ in triggers:
+            cursor.execute(f'DROP TRIGGER {name}')
+        # One statement, in primary-key order; executemany would pay a statement per row
+        cursor.execute('INSERT INTO UserPlayers (user_id, player_id) SELECT user_id, player_id FROM temp.ImportFavorites')
+        added = cursor.rowcount
+        for _, sql in triggers:
+            cursor.execute(sql)
+
+        cursor.execute('''
+            INSERT INTO temp.ImportCounts (player_id, favorites)
+            SELECT player_id, COUNT(*) FROM temp.ImportFavorites GROUP BY player_id
+        ''')
+        cursor.execute('''
+            UPDATE Players SET favorite_count = favorite_count + ImportCounts.favorites, orphaned_at = NULL
+            FROM temp.ImportCounts WHERE Players.player_id = ImportCounts.player_id
+        ''')
+        for dimension in DIMENSIONS:
+            cursor.execute(f'''
+                INSERT INTO FavoriteCounts (dimension, value, favorites)
+                SELECT '{dimension}', COALESCE(Players.{dimension}, 'Unknown'), SUM(ImportCounts.favorites)
+                FROM temp.ImportCounts JOIN Players ON Players.player_id = ImportCounts.player_id
+                GROUP BY 2
+                ON CONFLICT (dimension, value) DO UPDATE SET favorites = favorites + excluded.favorites
+            ''')
+        # A new version invalidates the users' ETags. Their UserProfile documents are out of date:
+        # they are dropped, to be rebuilt from the joins on the next read
+        cursor.execute('''
+            INSERT INTO UserVersions (user_id, version)
+            SELECT DISTINCT user_id, 1 FROM temp.ImportFavorites WHERE true
+            ON CONFLICT(user_id) DO UPDATE SET version = version + 1
+        ''')
+        users = cursor.rowcount
+        cursor.execute('DELETE FROM UserProfile WHERE user_id IN (SELECT user_id FROM temp.ImportFavorites)')
+        cursor.execute('DELETE FROM temp.ImportFavorites')
+        cursor.execute('DELETE FROM temp.ImportCounts')
+        return added, users
+
+    def _insert_lineups(self, cursor, positions):
+        """
+        Set the lineup positions the users do not have yet, recompute the
+        LineupAggregates of the users changed, and bump their versions.
+
+        Args:
+            cursor (sqlite3.Cursor): The cursor of the open write transaction.
+            positions (list): ((user_id, position), player_id) pairs, sorted, one per user and position.
+
+        Returns:
+            tuple: (positions set, users whose starting eleven changed).
+        """
+        cursor.executemany('INSERT INTO temp.ImportLineups (user_id, position, player_id) VALUES (?, ?, ?)',
+                           ((user_id, position, player_id) for (user_id, position), player_id in positions))
+        cursor.execute('''
+            DELETE FROM temp.ImportLineups
+            WHERE EXISTS (SELECT 1 FROM StartingEleven
+                          WHERE StartingEleven.user_id = ImportLineups.user_id
+                          AND StartingEleven.position = ImportLineups.position
+                          AND StartingEleven.player_id = ImportLineups.player_id)
+        ''')
+        cursor.execute('''
+            INSERT INTO StartingEleven (user_id, position, player_id)
+            SELECT user_id, position, player_id FROM temp.ImportLineups WHERE true
+            ON CONFLICT (user_id, position) DO UPDATE SET player_id = excluded.player_id
+        ''')
+        added = cursor.rowcount
+        # As recompute_lineup_aggregates() in app.py, for the users changed only
+        cursor.execute('DELETE FROM LineupAggregates WHERE user_id IN (SELECT user_id FROM temp.ImportLineups)')
+        cursor.execute(f'''
+            INSERT INTO LineupAggregates (user_id, players, {LINEUP_AGGREGATE_COLUMNS})
+            SELECT StartingEleven.user_id, COUNT(*), {LINEUP_AGGREGATE_VALUES}
+            FROM StartingEleven
+            JOIN Players ON Players.player_id = StartingEleven.player_id
+            WHERE StartingEleven.user_id IN (SELECT user_id FROM temp.ImportLineups)
+            GROUP BY StartingEleven.user_id
+        ''')
+        cursor.execute('''
+            INSERT INTO UserVersions (user_id, version)
+            SELECT DISTINCT user_id, 1 FROM temp.ImportLineups WHERE true
+            ON CONFLICT(user_id) DO UPDATE SET version = version + 1
+        ''')
+        users = cursor.rowcount
+        cursor.execute('DELETE FROM UserProfile WHERE user_id IN (SELECT user_id FROM temp.ImportLineups)')
+        cursor.execute('DELETE FROM temp.ImportLineups')
+        return added, users
+
+
+def read_checkpoint(path, source, kind='favorites'):
+    """
+    The progress of an import according to its checkpoint file.
+
+    Args:
+        path (str or None): The checkpoint file, None for an import without checkpoints.
+        source (str): The absolute path of the input, or '-' for stdin.
+        kind (str): 'favorites' or 'lineups'.
+
+    Returns:
+        dict: {input, kind, rows, batches, favorites_added or positions_set, players_added,
+        rejected}; rows is the number of input rows already imported, 0 if there is no
+        checkpoint yet.
+
+    Raises:
+        ValueError: If the checkpoint was written for another input or kind.
+    """
+    if path is None or not os.path.exists(path):
+        return {'input': source, 'kind': kind, 'rows': 0, 'batches': 0, KINDS[kind][1]: 0,
+                'players_added': 0, 'rejected': 0}
+    with open(path) as file:
+        checkpoint = json.load(file)
+    if checkpoint['input'] != source:
+        raise ValueError(f'{path} is the checkpoint of {checkpoint["input"]}, not of {source}')
+    # Checkpoints written before lineups could be imported have no kind
+    if checkpoint.get('kind', 'favorites') != kind:
+        raise ValueError(f'{path} is the checkpoint of an import of {checkpoint.get("kind", "favorites")}, not {kind}')
+    checkpoint['kind'] = kind
+    return checkpoint
+
+
+def write_checkpoint(path, checkpoint):
+    """
+    Replace a checkpoint file atomically, so an interruption leaves either the old or the new one.
+    """
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix='.checkpoint-')
+    try:
+        with os.fdopen(fd, 'w') as file:
+            json.dump(checkpoint, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def run(conn, binary, file_format, batch_size=BATCH_SIZE, skip=0, kind='favorites', image_hosts=()):
+    """
+    Import a stream of favorites or lineup positions.
+
+    Args:
+        conn (sqlite3.Connection): A connection in autocommit mode (isolation_level=None).
+        binary (io.BufferedIOBase): The input, as opened by open_input().
+        file_format (str): 'csv' or 'ndjson'.
+        batch_size (int): Rows per transaction.
+        skip (int): Input rows to skip, already imported.
+        kind (str): 'favorites' or 'lineups'.
+        image_hosts (iterable): Lower-case hosts whose images are registered (see Importer).
+
+    Yields:
+        tuple: (input rows done, batch report) after each committed batch.
+    """
+    importer = Importer(conn, kind, image_hosts)
+    rows = parse(binary, file_format, kind)
+    for _ in itertools.islice(rows, skip):
+        pass
+    done = skip
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            return
+        report = importer.load(done + 1, batch)
+        done += len(batch)
+        yield done, report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Import users\' favorites or lineups, e.g. as written by export.py.')
+    parser.add_argument('input', help='the input file, NDJSON or CSV, optionally gzipped; - for stdin')
+    parser.add_argument('--kind', choices=KINDS, default='favorites', help='what the input holds (default favorites)')
+    parser.add_argument('--format', choices=FORMATS, help='the input format (default from the file name)')
+    parser.add_argument('--image-hosts', default=os.getenv('IMAGE_HOSTS', ''),
+                        help='comma-separated hosts whose player images are registered (default IMAGE_HOSTS)')
+    parser.add_argument('--checkpoint', help='resume from, and record the progress in, this file')
+    parser.add_argument('--database', default=os.getenv('DATABASE_PATH', 'database.db'))
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--cache-mb', type=int, default=64, help='SQLite page cache during the import')
+    args = parser.parse_args()
+
+    source = os.path.abspath(args.input) if args.input != '-' else '-'
+    try:
+        progress = read_checkpoint(args.checkpoint, source, args.kind)
+    except ValueError as e:
+        parser.error(str(e))
+    skip = progress['rows']
+    image_hosts = [host.strip().lower() for host in args.image_hosts.split(',') if host.strip()]
+
+    # The rows of a batch create no reference cycles, but their allocation keeps triggering the
+    # cyclic garbage collector, which then walks every row of the batch: a third of the run time
+    gc.disable()
+    conn = sqlite3.connect(args.database, timeout=30, isolation_level=None)
+    conn.execute(f'PRAGMA cache_size = -{args.cache_mb * 1024}')
+    try:
+        with open_input(args.input) as binary:
+            for done, report in run(conn, binary, args.format or input_format(args.input), args.batch_size, skip,
+                                    args.kind, image_hosts):
+                progress['rows'] = done
+                progress['batches'] += 1
+                for key in (KINDS[args.kind][1], 'players_added', 'rejected'):
+                    progress[key] += report[key]
+                if args.checkpoint:
+                    write_checkpoint(args.checkpoint, progress)
+                print(json.dumps({'batch': progress['batches'], **report}), flush=True)
+    except (sqlite3.Error, ValueError) as e:
+        print(json.dumps({'batch': progress['batches'] + 1, 'error': str(e)}), flush=True)
+        sys.exit(1)
+    finally:
+        conn.close()
+    print(json.dumps({'done': True, 'skipped': skip, **progress}), flush=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""
+Fast JSON provider for the Flask application.
+
+Uses orjson when it is installed and falls back to the standard library
+json module otherwise. Query results can be passed to jsonify() as a RowList,
+which keeps the rows as plain tuples and pairs them with the column names
+only while serializing.
+"""
+import json
+
+from flask.json.provider import DefaultJSONProvider
+
+from metrics import SERIALIZE_DURATION
+
+try:
+    import orjson
+except ImportError:  # orjson is optional
+    orjson = None
+
+
+class RowList:
+    """
+    The rows of a query result as plain tuples, with precomputed column names.
+    """
+
+    __slots__ = ('columns', 'rows')
+
+    def __init__(self, columns, rows):
+        self.columns = columns
+        self.rows = rows
+
+    @classmethod
+    def fetch(cls, cursor, sql, params=()):
+        """
+        Run a query and fetch all rows as tuples, bypassing sqlite3.Row.
+
+        Args:
+            cursor (sqlite3.Cursor): The cursor to run the query on.
+            sql (str): The SQL statement.
+            params (tuple): The statement parameters.
+
+        Returns:
+            RowList: The fetched rows.
+        """
+        row_factory = cursor.row_factory
+        cursor.row_factory = None
+        try:
+            cursor.execute(sql, params)
+            columns = tuple(column[0] for column in cursor.description)
+            return cls(columns, cursor.fetchall())
+        finally:
+            cursor.row_factory = row_factory
+
+    def __len__(self):
+        return len(self.rows)
+
+    def to_json(self):
+        """
+        Convert the rows to a JSON-serializable list of objects.
+
+        Returns:
+            list: One dict per row, keyed by column name.
+        """
+        columns = self.columns
+        return [dict(zip(columns, row)) for row in self.rows]
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    JSON provider backed by orjson, with the standard library as fallback.
+    """
+
+    # Keep the column order of query results instead of sorting keys
+    sort_keys = False
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, RowList):
+            return o.to_json()
+        return DefaultJSONProvider.default(o)
+
+    def dumpb(self, obj, indent=False):
+        """
+        Serialize data as UTF-8 encoded JSON bytes.
+
+        Args:
+            obj: The data to serialize.
+            indent (bool): Pretty-print the output with two-space indentation.
+
+        Returns:
+            bytes: The JSON document.
+        """
+        if orjson is not None:
+            option = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+            if indent:
+                option |= orjson.OPT_INDENT_2
+            if self.sort_keys:
+                option |= orjson.OPT_SORT_KEYS
+            return orjson.dumps(obj, default=self.default, option=option)
+        if indent:
+            return super().dumps(obj, indent=2).encode('utf-8')
+        return super().dumps(obj, separators=(',', ':')).encode('utf-8')
+
+    def dumps(self, obj, **kwargs):
+        if orjson is not None and not kwargs:
+            return self.dumpb(obj).decode('utf-8')
+        return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return json.loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        with SERIALIZE_DURATION.time():
+            body = self.dumpb(obj, indent=indent)
+        return self._app.response_class(body + b'\n', mimetype=self.mimetype)
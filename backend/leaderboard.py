@@ -0,0 +1,191 @@
+"""
+In-memory leaderboards of the most favorited players.
+
+The counters are maintained in SQLite by triggers on UserPlayers:
+Players.favorite_count per player, and FavoriteCounts per position, team
+and nationality. A Leaderboard keeps a snapshot of the top players overall
+and within every position, team and nationality, plus the ranking of the
+groups themselves, built from those counters. Reads are dictionary
+lookups. The first read after the snapshot is older than the TTL starts a
+rebuild on a background thread, and requests keep reading the previous
+snapshot until it is done.
+
+A build reads the overall top-k with a LIMIT on the idx_players_favorites
+index (see init_db). The rankings within the groups need every favorited
+player, but only its ID and groups, walked in rank order from the same
+index without a sort; the players in the top-k of some group are then read
+in full by ID. That walk still grows with the favorited players, so app.py
+builds the leaderboards from the read-only replica when one is configured
+(REPLICA_MAX_STALENESS).
+"""
+import logging
+import threading
+import time
+
+from metrics import CACHE_REQUESTS, SQL_DURATION
+
+logger = logging.getLogger('leaderboard')
+
+DIMENSIONS = ('position', 'team', 'nationality')
+# Player IDs per `IN (...)` list; SQLite's default limit of host parameters is 32766
+IN_BATCH = 500
+
+
+class Leaderboard:
+    """
+    Top-k players overall and per group, refreshed from the counter columns.
+
+    Args:
+        connect (callable): Returns a new database connection with sqlite3.Row rows.
+        player_select (str): The player columns to return, e.g. 'Players.player_id, Players.name'.
+        size (int): Players kept per leaderboard.
+        ttl (float): Seconds a snapshot is served before it is rebuilt.
+        as_of (callable): Returns the time the data of the next connection is from,
+            e.g. Replica.data_time when connect reads a replica. Defaults to now.
+    """
+
+    def __init__(self, connect, player_select, size=100, ttl=10.0, as_of=time.time):
+        self.connect = connect
+        self.as_of = as_of
+        self.player_select = player_select
+        self.size = size
+        self.ttl = ttl
+        self._snapshot = None
+        self._built_at = 0.0
+        self._lock = threading.Lock()
+
+    def players(self, dimension=None, value=None, limit=10):
+        """
+        The most favorited players, overall or among those with the given value.
+
+        Args:
+            dimension (str, optional): 'position', 'team' or 'nationality'.
+            value (str, optional): The value of the dimension, e.g. 'Striker'.
+            limit (int): The number of players to return, at most size.
+
+        Returns:
+            list: Player dicts with a favorites field, most favorited first.
+        """
+        key = None if dimension is None else (dimension, value)
+        return self._current()['players'].get(key, [])[:limit]
+
+    def groups(self, dimension, limit=10):
+        """
+        The positions, teams or nationalities with the most favorites.
+
+        Args:
+            dimension (str): 'position', 'team' or 'nationality'.
+            limit (int): The number of groups to return, at most size.
+
+        Returns:
+            list: {value, favorites} dicts, most favorited first.
+        """
+        return self._current()['groups'].get(dimension, [])[:limit]
+
+    def staleness(self):
+        """
+        Seconds since the data of the snapshot being served was read, or 0 before the first build.
+        """
+        snapshot = self._snapshot
+        return 0.0 if snapshot is None else max(time.time() - snapshot['as_of'], 0.0)
+
+    def _current(self):
+        snapshot = self._snapshot
+        if snapshot is None:
+            # First request: build synchronously
+            with self._lock:
+                if self._snapshot is None:
+                    CACHE_REQUESTS.inc('leaderboard', 'miss')
+                    self._refresh()
+                return self._snapshot
+        CACHE_REQUESTS.inc('leaderboard', 'hit')
+        if time.monotonic() - self._built_at >= self.ttl and self._lock.acquire(blocking=False):
+            # Stale: rebuild in the background and keep serving the old snapshot meanwhile
+            threading.Thread(target=self._refresh_and_release, name='leaderboard-refresh', daemon=True).start()
+        return snapshot
+
+    def _refresh(self):
+        self._snapshot = self._build()
+        self._built_at = time.monotonic()
+
+    def _refresh_and_release(self):
+        try:
+            self._refresh()
+        except Exception:
+            logger.exception("Leaderboard refresh failed")
+        finally:
+            self._lock.release()
+
+    def _build(self):
+        as_of = self.as_of()
+        conn = self.connect()
+        try:
+            cursor = conn.cursor()
+            # One read transaction, so the players read by ID still exist and match their ranks
+            cursor.execute('BEGIN')
+            try:
+                with SQL_DURATION.time('leaderboard_top'):
+                    cursor.execute(f'''
+                        SELECT {self.player_select}, Players.favorite_count AS favorites
+                        FROM Players
+                        WHERE Players.favorite_count > 0
+                        ORDER BY Players.favorite_count DESC, Players.player_id
+                        LIMIT ?
+                    ''', (self.size,))
+                    players = {None: [dict(row) for row in cursor.fetchall()]}
+
+                # Rank within the groups on narrow rows, read in rank order from the index: only the
+                # players in the top-k of some group are read in full
+                with SQL_DURATION.time('leaderboard_ranks'):
+                    cursor.execute(f'''
+                        SELECT player_id, {', '.join(DIMENSIONS)}
+                        FROM Players
+                        WHERE favorite_count > 0
+                        ORDER BY favorite_count DESC, player_id
+                    ''')
+                    rows = cursor.fetchall()
+                group_sizes = {}
+                selected = []
+                for row in rows:
+                    # Same default as the FavoriteCounts triggers
+                    keys = [(dimension, 'Unknown' if row[dimension] is None else row[dimension])
+                            for dimension in DIMENSIONS]
+                    keys = [key for key in keys if group_sizes.get(key, 0) < self.size]
+                    for key in keys:
+                        group_sizes[key] = group_sizes.get(key, 0) + 1
+                    if keys:
+                        selected.append((row['player_id'], keys))
+                by_id = {}
+                ids = [player_id for player_id, _ in selected]
+                with SQL_DURATION.time('leaderboard_players'):
+                    for start in range(0, len(ids), IN_BATCH):
+                        batch = ids[start:start + IN_BATCH]
+                        cursor.execute(f'''
+                            SELECT {self.player_select}, Players.favorite_count AS favorites
+                            FROM Players
+                            WHERE Players.player_id IN ({', '.join('?' * len(batch))})
+                        ''', batch)
+                        by_id.update((row['player_id'], dict(row)) for row in cursor.fetchall())
+
+                with SQL_DURATION.time('leaderboard_groups'):
+                    cursor.execute('''
+                        SELECT dimension, value, favorites FROM FavoriteCounts
+                        WHERE favorites > 0
+                        ORDER BY dimension, favorites DESC, value
+                    ''')
+                    group_rows = cursor.fetchall()
+            finally:
+                conn.rollback()
+
+            # Selected in rank order, so each list fills up in order
+            for player_id, keys in selected:
+                for key in keys:
+                    players.setdefault(key, []).append(by_id[player_id])
+            groups = {}
+            for row in group_rows:
+                ranked = groups.setdefault(row['dimension'], [])
+                if len(ranked) < self.size:
+                    ranked.append({'value': row['value'], 'favorites': row['favorites']})
+            return {'players': players, 'groups': groups, 'as_of': as_of}
+        finally:
+            conn.close()
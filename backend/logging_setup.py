@@ -0,0 +1,163 @@
+"""
+Logging configuration for the backend.
+
+Records are put on an in-memory queue by a QueueHandler and written by a
+QueueListener thread, so request threads never block on log I/O. Levels are
+set per logger, DEBUG records can be sampled, and the output is one JSON
+object per line.
+
+Environment variables:
+    LOG_LEVEL: Level of the root logger (default INFO).
+    LOG_LEVELS: Per-logger levels, e.g. "app=DEBUG,werkzeug=WARNING".
+    LOG_DEBUG_SAMPLE_RATE: Fraction of DEBUG records to keep (default 1.0).
+    LOG_FORMAT: "json" (default) or "text".
+    LOG_QUEUE_SIZE: Maximum number of queued records (default 10000).
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+
+# The listener started by configure_logging, if any
+_listener = None
+
+# Attributes every LogRecord has; anything else was passed through `extra`
+STANDARD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JSONFormatter(logging.Formatter):
+    """
+    Format records as single-line JSON objects, including `extra` fields.
+    """
+
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 6),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in STANDARD_ATTRS:
+                entry[key] = value
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        elif record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep only a fraction of DEBUG records; other levels always pass.
+
+    Args:
+        rate (float): The fraction of DEBUG records to keep, between 0 and 1.
+    """
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno > logging.DEBUG or random.random() < self.rate
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that drops records instead of blocking when the queue is full,
+    and leaves the formatting of the output to the listener thread.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record):
+        # Resolve the message now, since the arguments may change after the call
+        # returns, but do not run the (JSON) formatter on the request thread.
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def parse_levels(spec):
+    """
+    Parse a per-logger level specification.
+
+    Args:
+        spec (str): Comma-separated name=LEVEL pairs.
+
+    Returns:
+        dict: Logger name to level name.
+    """
+    levels = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        name, _, level = item.partition('=')
+        levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def stop_logging():
+    """
+    Stop the listener thread after flushing the queued records.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def configure_logging(stream=None):
+    """
+    Install the queue-based logging pipeline on the root logger, replacing
+    any previous configuration.
+
+    Args:
+        stream (file, optional): Where the listener writes records. Defaults to stderr.
+
+    Returns:
+        logging.handlers.QueueListener: The started listener.
+    """
+    global _listener
+    stop_logging()
+    log_queue = queue.Queue(maxsize=int(os.getenv('LOG_QUEUE_SIZE', 10000)))
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    if os.getenv('LOG_FORMAT', 'json') == 'text':
+        output.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+    else:
+        output.setFormatter(JSONFormatter())
+
+    handler = NonBlockingQueueHandler(log_queue)
+    handler.addFilter(SamplingFilter(float(os.getenv('LOG_DEBUG_SAMPLE_RATE', 1.0))))
+
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+    for name, level in parse_levels(os.getenv('LOG_LEVELS', '')).items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+atexit.register(stop_logging)
+
@@ -0,0 +1,134 @@
+"""
+Read-through cache of player rows by ID.
+
+Players are looked up by ID for detail pages, multi-gets and the pages of
+structured search and recommendations. The cache keeps the most recently
+used rows in an LRU; the rows that are missing are fetched with one
+`player_id IN (...)` query on a pooled connection.
+
+Rows are invalidated through the change log the Players triggers write
+(CatalogueChanges, see recommender.py). Every lookup first reads the
+catalogue version, a single row of sqlite_sequence; when it moved, the
+players changed since the cache's version are evicted, or the whole cache
+when the log was pruned past that version or too many players changed.
+The log is pruned in the background but keeps its last PLAYER_CACHE_SIZE
+entries (see prune_catalogue_changes in app.py), so a cache only finds its
+version pruned after more changes than it holds.
+Rows read at an older version than the cache's are returned but not
+cached, so a concurrent invalidation can never be undone by a slow reader.
+"""
+import threading
+from collections import OrderedDict
+
+from metrics import CACHE_REQUESTS, SQL_DURATION
+from recommender import catalogue_version
+
+# SQLite's default limit of host parameters is 32766; stay well below it
+IN_BATCH = 500
+
+
+class PlayerCache:
+    """
+    Bounded read-through cache of player dicts, invalidated on player changes.
+
+    Args:
+        pool (ConnectionPool): The pool to read from; rows must be sqlite3.Row.
+        player_select (str): The player columns to return, e.g. 'Players.player_id, Players.name'.
+        size (int): Players kept in the cache.
+    """
+
+    def __init__(self, pool, player_select, size=10_000):
+        self.pool = pool
+        self.player_select = player_select
+        self.size = size
+        self.rows = OrderedDict()
+        self.version = None
+        self.lock = threading.Lock()
+
+    def get(self, player_id):
+        """
+        A player by ID.
+
+        Returns:
+            dict or None: The player, or None if there is no such player.
+        """
+        players = self.get_many([player_id])
+        return players[0] if players else None
+
+    def get_many(self, player_ids):
+        """
+        Players by ID, in the given order. Unknown IDs are skipped.
+
+        Args:
+            player_ids (list): The player IDs.
+
+        Returns:
+            list: Player dicts.
+        """
+        if not player_ids:
+            return []
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            version = self._invalidate(cursor)
+            found = {}
+            with self.lock:
+                for player_id in player_ids:
+                    row = self.rows.get(player_id)
+                    if row is not None:
+                        self.rows.move_to_end(player_id)
+                        found[player_id] = row
+            missing = list(dict.fromkeys(player_id for player_id in player_ids if player_id not in found))
+            CACHE_REQUESTS.inc('player', 'hit', amount=len(found))
+            if missing:
+                CACHE_REQUESTS.inc('player', 'miss', amount=len(missing))
+                fetched = self._fetch(cursor, missing)
+                found.update(fetched)
+                with self.lock:
+                    if self.version == version:
+                        self.rows.update(fetched)
+                        while len(self.rows) > self.size:
+                            self.rows.popitem(last=False)
+        return [dict(found[player_id]) for player_id in player_ids if player_id in found]
+
+    def _fetch(self, cursor, player_ids):
+        rows = {}
+        with SQL_DURATION.time('players_by_id'):
+            for start in range(0, len(player_ids), IN_BATCH):
+                batch = player_ids[start:start + IN_BATCH]
+                cursor.execute(f'SELECT {self.player_select} FROM Players '
+                               f'WHERE player_id IN ({", ".join("?" * len(batch))})', batch)
+                rows.update((row['player_id'], dict(row)) for row in cursor.fetchall())
+        return rows
+
+    def _invalidate(self, cursor):
+        """
+        Evict the players changed since the cache's version.
+
+        Returns:
+            int: The catalogue version the caller's reads are at least as new as.
+        """
+        with SQL_DURATION.time('player_cache_version'):
+            version = catalogue_version(cursor)
+        with self.lock:
+            cached = self.version
+        if cached is not None and version <= cached:
+            return version
+
+        changed = None
+        if cached is not None:
+            with SQL_DURATION.time('player_cache_changes'):
+                cursor.execute('SELECT MIN(seq) FROM CatalogueChanges')
+                oldest = cursor.fetchone()[0]
+                if oldest is not None and oldest <= cached + 1:
+                    cursor.execute('SELECT DISTINCT player_id FROM CatalogueChanges WHERE seq > ? AND seq <= ? LIMIT ?',
+                                   (cached, version, self.size + 1))
+                    changed = [row[0] for row in cursor.fetchall()]
+        with self.lock:
+            if self.version is None or version > self.version:
+                if changed is None or len(changed) > self.size or self.version != cached:
+                    self.rows.clear()
+                else:
+                    for player_id in changed:
+                        self.rows.pop(player_id, None)
+                self.version = version
+        return version
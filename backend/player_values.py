@@ -0,0 +1,126 @@
+"""
+Typed numeric values of the free-text player attributes.
+
+Players stores the attributes as the SPARQL endpoint returns them
+('€85M', '€350K', '1.85 m', '1999-04-12'...). The parsers below turn them
+into integers once, when a player is inserted, into the typed columns
+listed in TYPED_COLUMNS. Unparseable values become NULL.
+"""
+import datetime
+import re
+
+NUMBER = re.compile(r'(\d+(?:[.,]\d+)?)\s*([kmb])?', re.IGNORECASE)
+DECIMAL = re.compile(r'(\d+(?:[.,]\d+)?)')
+MULTIPLIERS = {None: 1, 'k': 1_000, 'm': 1_000_000, 'b': 1_000_000_000}
+EPOCH = datetime.date(1970, 1, 1)
+
+
+def _number(value):
+    if value is None:
+        return None
+    match = NUMBER.search(str(value).replace(' ', '').replace("'", ''))
+    if match is None:
+        return None
+    digits, suffix = match.groups()
+    if ',' in digits and (suffix or len(digits.split(',')[1]) != 3):
+        digits = digits.replace(',', '.')  # decimal comma, as in '€1,5M'
+    return float(digits.replace(',', '')), (suffix or '').lower() or None
+
+
+def parse_money(value):
+    """
+    Parse an amount such as '€85M', '€1.5M', '€350K' or '€12,000'.
+
+    Returns:
+        int or None: The amount in euros.
+    """
+    parsed = _number(value)
+    if parsed is None:
+        return None
+    number, suffix = parsed
+    return int(round(number * MULTIPLIERS[suffix]))
+
+
+def parse_score(value):
+    """
+    Parse a rating or potential such as '85'.
+
+    Returns:
+        int or None: The score, if between 0 and 100.
+    """
+    parsed = _number(value)
+    if parsed is None or parsed[1] is not None:
+        return None
+    score = int(round(parsed[0]))
+    return score if 0 <= score <= 100 else None
+
+
+def parse_height_cm(value):
+    """
+    Parse a height such as '185cm', '185' or '1.85 m'.
+
+    Returns:
+        int or None: The height in centimetres.
+    """
+    match = DECIMAL.search(str(value)) if value is not None else None
+    if match is None:
+        return None
+    number = float(match.group(1).replace(',', '.'))
+    if number < 3:
+        number *= 100  # metres
+    return int(round(number)) if 100 <= number <= 250 else None
+
+
+def parse_birth_day(value):
+    """
+    Parse a birth date such as '1999-04-12' or '1999-04-12T00:00:00Z'.
+
+    Returns:
+        int or None: Days since 1970-01-01.
+    """
+    if not value:
+        return None
+    try:
+        return (datetime.date.fromisoformat(str(value)[:10]) - EPOCH).days
+    except ValueError:
+        return None
+
+
+def today_day():
+    """
+    Returns:
+        int: Today's date in days since 1970-01-01.
+    """
+    return (datetime.date.today() - EPOCH).days
+
+
+# (typed column, source column, parser)
+TYPED_COLUMNS = (
+    ('rating_value', 'rating', parse_score),
+    ('potential_value', 'potential', parse_score),
+    ('market_value_eur', 'market_value', parse_money),
+    ('wage_eur', 'wage', parse_money),
+    ('height_cm', 'height', parse_height_cm),
+    ('birth_day', 'birthDate', parse_birth_day),
+)
+
+# Lineup aggregates: (metric, typed Players column). LineupAggregates keeps a
+# count of known values and their sum per metric (see app.lineup_delta()).
+LINEUP_METRICS = (('rating', 'rating_value'), ('potential', 'potential_value'),
+                  ('market_value', 'market_value_eur'), ('wage', 'wage_eur'),
+                  ('height', 'height_cm'), ('birth_day', 'birth_day'))
+LINEUP_AGGREGATE_COLUMNS = ', '.join(f'{metric}_count, {metric}_sum' for metric, _ in LINEUP_METRICS)
+LINEUP_AGGREGATE_VALUES = ', '.join(f'COUNT({column}), COALESCE(SUM({column}), 0)' for _, column in LINEUP_METRICS)
+
+
+def typed_values(player):
+    """
+    Compute the typed columns of a player.
+
+    Args:
+        player (dict): The source columns of the player.
+
+    Returns:
+        tuple: The values of the TYPED_COLUMNS, in order.
+    """
+    return tuple(parser(player.get(source)) for _, source, parser in TYPED_COLUMNS)
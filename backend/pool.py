@@ -0,0 +1,70 @@
+"""
+A bounded pool of SQLite connections for short reads.
+
+Opening a connection costs more than a primary-key lookup, so hot read
+paths borrow an idle connection instead of opening their own. Connections
+are created on demand up to the pool size; further borrowers wait for a
+connection to be returned. Connections are shared across threads (so they
+must be opened with check_same_thread=False) and returned outside any
+transaction. A forked worker discards the connections of its parent.
+"""
+import os
+import queue
+import threading
+from contextlib import contextmanager
+
+from metrics import CACHE_REQUESTS
+
+
+class ConnectionPool:
+    """
+    Idle connections kept for reuse, at most size connections in use at once.
+
+    Args:
+        connect (callable): Returns a new connection usable from any thread.
+        size (int): The maximum number of connections.
+    """
+
+    def __init__(self, connect, size=8):
+        self.connect = connect
+        self.size = size
+        self.slots = threading.BoundedSemaphore(size)
+        self.idle = queue.LifoQueue()
+        self.pid = os.getpid()
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrow a connection for the duration of a with block.
+
+        Yields:
+            sqlite3.Connection: A connection, not in a transaction.
+        """
+        if self.pid != os.getpid():
+            self.idle = queue.LifoQueue()
+            self.pid = os.getpid()
+        with self.slots:
+            try:
+                conn = self.idle.get_nowait()
+                CACHE_REQUESTS.inc('connection_pool', 'hit')
+            except queue.Empty:
+                CACHE_REQUESTS.inc('connection_pool', 'miss')
+                conn = self.connect()
+            try:
+                yield conn
+            except BaseException:
+                conn.close()
+                raise
+            if conn.in_transaction:
+                conn.rollback()
+            self.idle.put(conn)
+
+    def close(self):
+        """
+        Close the idle connections.
+        """
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                return
@@ -0,0 +1,166 @@
+"""
+Opt-in per-request profiler.
+
+A request is profiled when it carries an X-Profile header holding the
+HMAC-SHA256 of its path under PROFILE_SECRET, or when it is picked at random
+with probability PROFILE_SAMPLE_RATE. The profiled request runs under
+cProfile; the stats are written to PROFILE_DIR (keeping the newest
+PROFILE_KEEP files) and the response gets a Server-Timing header with the
+time spent in the database, upstream calls and JSON serialization.
+
+When neither a secret nor a sample rate is configured, no hooks are
+registered at all.
+
+Sign a path for the header with: python profiler.py /search
+"""
+import cProfile
+import hashlib
+import hmac
+import os
+import random
+import sys
+import threading
+import time
+
+from flask import request
+
+from metrics import SERIALIZE_DURATION, SQL_DURATION, UPSTREAM_DURATION
+
+PROFILE_HEADER = 'X-Profile'
+
+
+def sign(secret, path):
+    """
+    Compute the X-Profile header value for a request path.
+
+    Args:
+        secret (str): The PROFILE_SECRET of the server.
+        path (str): The request path, e.g. "/search".
+
+    Returns:
+        str: The hex HMAC-SHA256 signature.
+    """
+    return hmac.new(secret.encode('utf-8'), path.encode('utf-8'), hashlib.sha256).hexdigest()
+
+
+class RequestProfiler:
+    """
+    before_request/after_request hooks that profile selected requests.
+
+    Args:
+        app (Flask, optional): The application to register the hooks on.
+        secret (str, optional): Key for signed X-Profile headers.
+        sample_rate (float): Fraction of requests to profile at random.
+        directory (str): Where profile files are written.
+        keep (int): The number of profile files to keep.
+    """
+
+    def __init__(self, app=None, secret=None, sample_rate=0.0, directory='profiles', keep=50):
+        self.secret = secret
+        self.sample_rate = sample_rate
+        self.directory = directory
+        self.keep = keep
+        self._local = threading.local()
+        if app is not None:
+            self.init_app(app)
+
+    @property
+    def enabled(self):
+        return bool(self.secret) or self.sample_rate > 0
+
+    def init_app(self, app):
+        if not self.enabled:
+            return
+        SQL_DURATION.observers.append(self._phase_observer('db'))
+        UPSTREAM_DURATION.observers.append(self._phase_observer('upstream'))
+        SERIALIZE_DURATION.observers.append(self._phase_observer('serialize'))
+        app.before_request(self.start)
+        app.after_request(self.finish)
+        app.teardown_request(self.teardown)
+
+    def _phase_observer(self, phase):
+        local = self._local
+
+        def observe(value, labels):
+            phases = getattr(local, 'phases', None)
+            if phases is not None:
+                phases[phase] += value
+        return observe
+
+    def requested(self):
+        """
+        Decide whether the current request is profiled.
+
+        Returns:
+            bool: True for a valid signed header or a sampled request.
+        """
+        signature = request.headers.get(PROFILE_HEADER)
+        if signature and self.secret:
+            return hmac.compare_digest(signature, sign(self.secret, request.path))
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def start(self):
+        if not self.requested():
+            return
+        self._local.phases = {'db': 0.0, 'upstream': 0.0, 'serialize': 0.0}
+        self._local.started = time.perf_counter()
+        self._local.profile = cProfile.Profile()
+        self._local.profile.enable()
+
+    def finish(self, response):
+        profile = getattr(self._local, 'profile', None)
+        if profile is None:
+            return response
+        profile.disable()
+        total = time.perf_counter() - self._local.started
+        phases = self._local.phases
+        self._clear()
+
+        path = self.write(profile)
+        timings = [f'{phase};dur={seconds * 1000:.3f}' for phase, seconds in phases.items()]
+        timings.append(f'app;dur={max(total - sum(phases.values()), 0) * 1000:.3f}')
+        timings.append(f'total;dur={total * 1000:.3f}')
+        response.headers['Server-Timing'] = ', '.join(timings)
+        response.headers['X-Profile-File'] = os.path.basename(path)
+        return response
+
+    def teardown(self, exc):
+        profile = getattr(self._local, 'profile', None)
+        if profile is not None:
+            profile.disable()
+            self._clear()
+
+    def _clear(self):
+        self._local.profile = None
+        self._local.phases = None
+
+    def write(self, profile):
+        """
+        Write the stats of a profile and drop the oldest files beyond `keep`.
+
+        Args:
+            profile (cProfile.Profile): The finished profile.
+
+        Returns:
+            str: Path of the written file.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        endpoint = request.endpoint or 'unmatched'
+        name = f'{time.strftime("%Y%m%d-%H%M%S")}-{endpoint}-{os.getpid()}-{random.getrandbits(32):08x}.prof'
+        path = os.path.join(self.directory, name)
+        profile.dump_stats(path)
+
+        files = sorted((entry for entry in os.scandir(self.directory) if entry.name.endswith('.prof')),
+                       key=lambda entry: entry.stat().st_mtime)
+        for entry in files[:-self.keep]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+        return path
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2 or not os.getenv('PROFILE_SECRET'):
+        sys.exit('usage: PROFILE_SECRET=... python profiler.py <path>')
+    print(sign(os.environ['PROFILE_SECRET'], sys.argv[1]))
@@ -0,0 +1,450 @@
+"""
+Similar-player recommendations over a memory-mapped feature matrix.
+
+Every player is a row of float32 features: rating, potential, market value,
+wage (both log-scaled), height and birth date, standardized with the
+catalogue's mean and deviation, plus one-hot position line and foot. Rows
+are L2-normalized, so the cosine similarity of two players is the dot
+product of their rows. The neighbours of a query vector are scored with a
+matrix-vector product per batch of rows; the matrix is stored column-major
+so each product streams contiguous memory. Only the rows scoring at least
+the k-th best score of a 1/64 sample are sorted.
+
+The matrix lives in files next to the database and is memory-mapped, so all
+workers of a deployment share one copy in the page cache:
+
+    features.json              header: generation, rows in use, statistics, catalogue version
+    features-<generation>.f32  the features, column-major (DIM x capacity float32)
+    features-<generation>.ids  the player ID of each row (int64, ascending)
+
+Triggers log every insert, delete and change of Players in CatalogueChanges
+(which player_cache.py reads too). A sync applies the logged changes in
+place: changed rows are rewritten with the stored statistics, new players
+are appended into spare capacity and deleted players become NaN rows, which
+never rank. A full rebuild, written under a new generation, happens when
+there is no matrix yet, the capacity is exhausted, too many rows changed
+since the statistics were computed, or the log was pruned past the matrix's
+version. Syncs are serialized across processes with a lock file; readers
+reopen the matrix when the header changes.
+
+Syncs only read the database. The log is pruned by prune(), from a
+background task, below the version of its slowest reader: the matrix, and
+the player caches, which are given the last keep_changes entries.
+"""
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+import numpy as np
+
+from metrics import CACHE_REQUESTS, SQL_DURATION
+from solver import position_line
+
+try:
+    import fcntl
+except ImportError:  # Windows: syncs are only serialized within the process
+    fcntl = None
+
+logger = logging.getLogger('recommender')
+
+# (typed Players column, log-scaled)
+NUMERIC_FEATURES = (('rating_value', False), ('potential_value', False), ('market_value_eur', True),
+                    ('wage_eur', True), ('height_cm', False), ('birth_day', False))
+LINES = 5  # goalkeeper, defense, midfield, forward, unknown (see solver.position_line)
+FEET = ('left', 'right')
+DIM = len(NUMERIC_FEATURES) + LINES + len(FEET)
+
+# Every SAMPLE_STRIDE-th score is sampled to find a threshold for the top-k candidates
+SAMPLE_STRIDE = 64
+
+# Relative weight of the feature groups in the similarity
+NUMERIC_WEIGHT = 1.0
+LINE_WEIGHT = 1.5
+FOOT_WEIGHT = 0.5
+
+FEATURE_SELECT = ', '.join(['player_id', 'position', 'foot'] + [column for column, _ in NUMERIC_FEATURES])
+
+
+def catalogue_version(cursor):
+    """
+    The sequence number of the last change logged in CatalogueChanges.
+    """
+    cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'CatalogueChanges'")
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+def featurize(rows, mean=None, std=None):
+    """
+    Compute the feature rows of players.
+
+    Args:
+        rows (list): (player_id, position, foot, *numeric features) tuples, as selected by FEATURE_SELECT.
+        mean (numpy.ndarray, optional): Means of the numeric features; computed from the rows if omitted.
+        std (numpy.ndarray, optional): Standard deviations of the numeric features.
+
+    Returns:
+        tuple: (player IDs, L2-normalized float32 feature rows, mean, std).
+    """
+    count = len(rows)
+    columns = list(zip(*rows)) if rows else [()] * (3 + len(NUMERIC_FEATURES))
+    ids = np.array(columns[0], dtype=np.int64)
+    numeric = np.array(columns[3:], dtype=np.float64).reshape(len(NUMERIC_FEATURES), count).T
+    for i, (_, logarithmic) in enumerate(NUMERIC_FEATURES):
+        if logarithmic:
+            numeric[:, i] = np.log1p(np.maximum(numeric[:, i], 0))
+    if mean is None:
+        # Over the known values only; a column without any (or no rows at all) gets mean 0 and
+        # deviation 1. nanmean/nanstd would warn about the empty columns, which errstate cannot silence
+        known = ~np.isnan(numeric)
+        counts = known.sum(axis=0)
+        values = np.where(known, numeric, 0.0)
+        mean = np.divide(values.sum(axis=0), counts, out=np.zeros(len(NUMERIC_FEATURES)), where=counts > 0)
+        deviations = np.where(known, numeric - mean, 0.0)
+        std = np.sqrt(np.divide((deviations ** 2).sum(axis=0), counts, out=np.zeros(len(NUMERIC_FEATURES)),
+                                where=counts > 0))
+        std[std == 0] = 1.0
+
+    features = np.zeros((count, DIM), dtype=np.float32)
+    # Unknown values sit at the mean
+    features[:, :len(NUMERIC_FEATURES)] = np.nan_to_num((numeric - mean) / std) * NUMERIC_WEIGHT
+    lines = {position: position_line(position) for position in set(columns[1])}
+    line = np.array([lines[position] for position in columns[1]], dtype=np.intp)
+    features[np.arange(count), len(NUMERIC_FEATURES) + line] = LINE_WEIGHT
+    for i, foot in enumerate(FEET):
+        is_foot = np.array([(value or '').lower() == foot for value in columns[2]], dtype=bool)
+        features[is_foot, len(NUMERIC_FEATURES) + LINES + i] = FOOT_WEIGHT
+    norms = np.linalg.norm(features, axis=1, keepdims=True)
+    features /= np.where(norms > 0, norms, 1)
+    return ids, features, mean, std
+
+
+class Matrix:
+    """
+    An opened feature matrix: its header and the memory maps of its files.
+
+    Args:
+        header (dict): The header (see features.json).
+        mtime (int): The modification time of the header file, in nanoseconds.
+        ids (numpy.memmap): The player ID of each row.
+        rows (numpy.memmap): The features, DIM x capacity.
+    """
+
+    def __init__(self, header, mtime, ids, rows):
+        self.header = header
+        self.mtime = mtime
+        self.ids = ids
+        self.rows = rows
+
+
+class SimilarityIndex:
+    """
+    Nearest neighbours of players by cosine similarity of their features.
+
+    Args:
+        connect (callable): Returns a new database connection.
+        directory (str): Directory of the matrix files.
+        sync_ttl (float): Seconds between checks of the catalogue version.
+        batch_rows (int): Rows scored per matrix-vector product.
+        rebuild_fraction (float): Full rebuild when more than this share of the rows changed
+            since the statistics were computed.
+    """
+
+    def __init__(self, connect, directory, sync_ttl=5.0, batch_rows=65536, rebuild_fraction=0.2):
+        self.connect = connect
+        self.directory = directory
+        self.sync_ttl = sync_ttl
+        self.batch_rows = batch_rows
+        self.rebuild_fraction = rebuild_fraction
+        self.header_path = os.path.join(directory, 'features.json')
+        self._matrix = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    # Queries
+
+    def similar(self, player_id, limit=20):
+        """
+        The players most similar to a player.
+
+        Args:
+            player_id (int): The player.
+            limit (int): The number of players to return.
+
+        Returns:
+            list or None: (player_id, similarity) tuples, most similar first; None if the player is unknown.
+        """
+        ids, rows, count = self._current()
+        vector = self._vector(ids, rows, count, [player_id])
+        if vector is None:
+            return None
+        return self._nearest(ids, rows, count, vector, limit, {player_id})
+
+    def recommend(self, player_ids, limit=20):
+        """
+        The players most similar to the average of a set of players, excluding them.
+
+        Args:
+            player_ids (list): The players, e.g. a user's favorites.
+            limit (int): The number of players to return.
+
+        Returns:
+            list: (player_id, similarity) tuples, most similar first.
+        """
+        ids, rows, count = self._current()
+        vector = self._vector(ids, rows, count, player_ids)
+        if vector is None:
+            return []
+        return self._nearest(ids, rows, count, vector, limit, set(player_ids))
+
+    def _vector(self, ids, rows, count, player_ids):
+        positions = self._positions(ids, count, player_ids)
+        vectors = rows[:, positions[positions >= 0]].T
+        vectors = vectors[~np.isnan(vectors).any(axis=1)]
+        if not len(vectors):
+            return None
+        vector = vectors.mean(axis=0)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else None
+
+    @staticmethod
+    def _positions(ids, count, player_ids):
+        """
+        The row of each player ID, -1 for IDs not in the matrix.
+        """
+        query = np.asarray(player_ids, dtype=np.int64)
+        positions = np.searchsorted(ids[:count], query)
+        found = positions < count
+        found[found] = ids[positions[found]] == query[found]
+        return np.where(found, positions, -1)
+
+    def _nearest(self, ids, rows, count, vector, limit, exclude):
+        wanted = limit + len(exclude)
+        scores = np.empty(count, dtype=np.float32)
+        for start in range(0, count, self.batch_rows):
+            stop = min(start + self.batch_rows, count)
+            np.matmul(vector, rows[:, start:stop], out=scores[start:stop])
+        sample = scores[::SAMPLE_STRIDE]
+        if len(sample) > wanted:
+            # The wanted-th best score of a sample is at most the wanted-th best overall, so every
+            # row of the top ranks at or above it. NaN rows (deleted players) never compare true.
+            threshold = np.partition(np.nan_to_num(sample, nan=-np.inf), len(sample) - wanted)[len(sample) - wanted]
+            candidates = np.flatnonzero(scores >= threshold)
+        else:
+            candidates = np.flatnonzero(~np.isnan(scores))
+        order = candidates[np.argsort(-scores[candidates], kind='stable')]
+        result = []
+        for position in order:
+            player_id = int(ids[position])
+            if player_id in exclude:
+                continue
+            result.append((player_id, round(float(scores[position]), 4)))
+            if len(result) == limit:
+                break
+        return result
+
+    # Loading and syncing
+
+    def _current(self):
+        now = time.monotonic()
+        # One read of self._matrix: the IDs, rows and count always belong together
+        matrix = self._matrix
+        if matrix is None or now - self._checked_at >= self.sync_ttl:
+            with self._lock:
+                if self._matrix is None or time.monotonic() - self._checked_at >= self.sync_ttl:
+                    self._checked_at = time.monotonic()
+                    CACHE_REQUESTS.inc('similarity_index', 'miss')
+                    try:
+                        self.sync()
+                    except Exception:
+                        if self._matrix is None:
+                            raise
+                        logger.exception("Feature matrix sync failed; serving the current matrix")
+                    self._reload()
+                matrix = self._matrix
+                return matrix.ids, matrix.rows, matrix.header['count']
+        CACHE_REQUESTS.inc('similarity_index', 'hit')
+        return matrix.ids, matrix.rows, matrix.header['count']
+
+    def _reload(self):
+        """
+        Reopen the matrix if another process or a sync changed the header.
+        The new state replaces the current one in a single assignment.
+        """
+        current = self._matrix
+        mtime = os.stat(self.header_path).st_mtime_ns
+        if current is not None and mtime == current.mtime:
+            return
+        header = self._read_header()
+        if current is None or header['generation'] != current.header['generation']:
+            ids = np.memmap(self._path(header, 'ids'), dtype=np.int64, mode='r', shape=(header['capacity'],))
+            rows = np.memmap(self._path(header, 'f32'), dtype=np.float32, mode='r', shape=(DIM, header['capacity']))
+        else:
+            # Same files, synced in place: only the count of rows in use changed
+            ids, rows = current.ids, current.rows
+        self._matrix = Matrix(header, mtime, ids, rows)
+
+    def _read_header(self):
+        try:
+            with open(self.header_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_header(self, header):
+        tmp = f'{self.header_path}.{os.getpid()}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(header, f)
+        os.replace(tmp, self.header_path)
+
+    def _path(self, header, kind):
+        return os.path.join(self.directory, f"features-{header['generation']}.{kind}")
+
+    def sync(self):
+        """
+        Bring the matrix files up to date with the catalogue.
+
+        Returns:
+            dict: What was done ('unchanged', 'updated' or 'rebuilt') and the number of rows written.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, 'features.lock'), 'a') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            conn = self.connect()
+            try:
+                return self._sync(conn)
+            finally:
+                conn.close()
+
+    def _sync(self, conn):
+        cursor = conn.cursor()
+        header = self._read_header()
+        cursor.execute("SELECT value FROM Meta WHERE key = 'catalogue_id'")
+        catalogue_id = cursor.fetchone()[0]
+        if header is None or header['catalogue_id'] != catalogue_id:
+            return self._rebuild(conn, header, catalogue_id)
+
+        version = catalogue_version(cursor)
+        if version == header['version']:
+            return {'action': 'unchanged', 'rows': 0}
+        with SQL_DURATION.time('catalogue_changes'):
+            cursor.execute('SELECT MIN(seq) FROM CatalogueChanges')
+            oldest = cursor.fetchone()[0]
+            if oldest is None or oldest > header['version'] + 1:
+                # Changes the matrix has not applied were pruned
+                return self._rebuild(conn, header, catalogue_id)
+            cursor.execute('SELECT DISTINCT player_id FROM CatalogueChanges WHERE seq > ? AND seq <= ?',
+                           (header['version'], version))
+            changed = sorted(row[0] for row in cursor.fetchall())
+        if header['changed'] + len(changed) > self.rebuild_fraction * max(header['count'], 1):
+            return self._rebuild(conn, header, catalogue_id)
+
+        ids = np.memmap(self._path(header, 'ids'), dtype=np.int64, mode='r+', shape=(header['capacity'],))
+        count = header['count']
+        positions = self._positions(ids, count, changed)
+        existing = positions >= 0
+        appended = [player_id for player_id, known in zip(changed, existing) if not known]
+        last = int(ids[count - 1]) if count else 0
+        if count + len(appended) > header['capacity'] or (appended and appended[0] <= last):
+            # AUTOINCREMENT IDs only grow, so new players append in order unless the capacity is exhausted
+            return self._rebuild(conn, header, catalogue_id)
+
+        rows = self._fetch(cursor, changed)
+        fetched_ids, features, _, _ = featurize(rows, np.array(header['mean']), np.array(header['std']))
+        by_id = dict(zip(fetched_ids.tolist(), features))
+        matrix = np.memmap(self._path(header, 'f32'), dtype=np.float32, mode='r+', shape=(DIM, header['capacity']))
+        for player_id, position, known in zip(changed, positions, existing):
+            if known:
+                matrix[:, position] = by_id.get(player_id, np.nan)
+        for offset, player_id in enumerate(appended):
+            matrix[:, count + offset] = by_id.get(player_id, np.nan)
+            ids[count + offset] = player_id
+        matrix.flush()
+        ids.flush()
+        header.update(count=count + len(appended), version=version, changed=header['changed'] + len(changed))
+        self._write_header(header)
+        return {'action': 'updated', 'rows': len(changed)}
+
+    def _fetch(self, cursor, player_ids):
+        rows = []
+        with SQL_DURATION.time('feature_rows'):
+            for start in range(0, len(player_ids), 500):
+                batch = player_ids[start:start + 500]
+                cursor.execute(f'SELECT {FEATURE_SELECT} FROM Players WHERE player_id IN ({", ".join("?" * len(batch))})',
+                               batch)
+                rows.extend(tuple(row) for row in cursor.fetchall())
+        return rows
+
+    def _rebuild(self, conn, old_header, catalogue_id):
+        start = time.perf_counter()
+        cursor = conn.cursor()
+        # One read transaction, so the rows match the version
+        cursor.execute('BEGIN')
+        try:
+            version = catalogue_version(cursor)
+            with SQL_DURATION.time('feature_rows'):
+                cursor.execute(f'SELECT {FEATURE_SELECT} FROM Players ORDER BY player_id')
+                rows = [tuple(row) for row in cursor.fetchall()]
+        finally:
+            conn.rollback()
+        ids, features, mean, std = featurize(rows)
+
+        count = len(ids)
+        header = {
+            'generation': uuid.uuid4().hex, 'catalogue_id': catalogue_id, 'version': version,
+            'count': count, 'capacity': max(1024, count + count // 4), 'changed': 0,
+            'mean': mean.tolist(), 'std': std.tolist(), 'dim': DIM,
+        }
+        ids_file = np.memmap(self._path(header, 'ids'), dtype=np.int64, mode='w+', shape=(header['capacity'],))
+        ids_file[:count] = ids
+        ids_file.flush()
+        matrix = np.memmap(self._path(header, 'f32'), dtype=np.float32, mode='w+', shape=(DIM, header['capacity']))
+        matrix[:, :count] = features.T
+        matrix.flush()
+        del ids_file, matrix
+        self._write_header(header)
+        if old_header is not None:
+            # Processes that still map the old files keep them until they reopen
+            for kind in ('ids', 'f32'):
+                try:
+                    os.remove(self._path(old_header, kind))
+                except OSError:
+                    pass
+        logger.info("Rebuilt the feature matrix: %d players in %.0f ms", count, (time.perf_counter() - start) * 1000)
+        return {'action': 'rebuilt', 'rows': count}
+
+    def prune(self, keep_changes=0):
+        """
+        Delete the CatalogueChanges entries that no reader needs any more: the
+        ones the matrix applied, but for the last keep_changes entries. A
+        matrix behind the catalogue is synced first, so the log stays short
+        when nobody asks for recommendations. Without a matrix, nothing needs
+        the log for it: the first sync builds from Players.
+
+        Args:
+            keep_changes (int): Latest entries kept for the other readers of the log.
+
+        Returns:
+            int: The number of entries deleted.
+        """
+        header = self._read_header()
+        if header is not None:
+            self.sync()
+            header = self._read_header()
+        conn = self.connect()
+        try:
+            cursor = conn.cursor()
+            bound = catalogue_version(cursor) - keep_changes
+            if header is not None:
+                bound = min(bound, header['version'])
+            with SQL_DURATION.time('prune_catalogue_changes'):
+                cursor.execute('DELETE FROM CatalogueChanges WHERE seq <= ?', (bound,))
+                deleted = cursor.rowcount
+                conn.commit()
+        finally:
+            conn.close()
+        return deleted
@@ -0,0 +1,207 @@
+"""
+Read-only replica of the database for heavy reads.
+
+Leaderboard rebuilds, exports and ad-hoc analytics scan large parts of the
+database. On the primary, a statement holds the shared lock for as long as
+it runs, and with the rollback journal no writer can commit until it is
+released: one analytics query over the favorites stalls every request that
+writes. Heavy reads go to a replica instead, a copy of the database
+refreshed periodically and opened with mode=ro&immutable=1. SQLite never
+locks an immutable database nor checks it for changes, so reads of the
+replica neither wait for writers nor make them wait.
+
+A refresh copies the primary with the online backup API (backup.copy_file(),
+in the same paced steps as the backups) into a temporary file and renames
+it over the replica. Connections already open keep reading the file they
+opened, which never changes; new connections get the new copy. The
+replica's modification time is set to the moment the copy completed, when
+its data was the primary's, so its staleness is the age of the file.
+
+A Replica routes connections to the replica while it is at most
+max_staleness seconds old and to the primary otherwise (replica mode off,
+no replica yet, or refreshes failing), so data older than the configured
+bound is never served. Refreshes are serialized across processes with a
+lock file next to the replica, and a scheduled refresh is skipped if
+another worker has just made one.
+
+From the command line:
+
+    python replica.py refresh
+    python replica.py status
+    python replica.py query "SELECT nationality, COUNT(*) FROM Players GROUP BY nationality"
+"""
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+import backup
+from metrics import REPLICA_READS
+
+try:
+    import fcntl
+except ImportError:  # Windows: refreshes are not serialized across processes
+    fcntl = None
+
+
+def default_path(database):
+    """
+    The replica of a database when REPLICA_PATH is not set: replica.db next to it.
+    """
+    return os.path.join(os.path.dirname(os.path.abspath(database)), 'replica.db')
+
+
+def age(path):
+    """
+    Seconds since a replica was refreshed, or None if there is none.
+    """
+    try:
+        return time.time() - os.stat(path).st_mtime
+    except FileNotFoundError:
+        return None
+
+
+def refresh(database, path, pages=backup.STEP_PAGES, sleep=backup.STEP_SLEEP, min_age=0):
+    """
+    Replace the replica with a fresh copy of the database.
+
+    Args:
+        database (str): The path of the primary database.
+        path (str): The path of the replica.
+        pages (int): Pages copied per step at first (see backup.copy()).
+        sleep (float): Seconds between steps.
+        min_age (float): Skip the refresh if the replica is younger than this many seconds.
+
+    Returns:
+        dict: The copy statistics, or None if skipped because another refresh is running or
+        the replica is recent.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    with open(path + '.lock', 'a') as lock:
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return None
+        current = age(path)
+        if current is not None and current < min_age:
+            return None
+
+        fd, temporary = tempfile.mkstemp(dir=directory, prefix=f'.{os.path.basename(path)}-', suffix='.tmp')
+        os.close(fd)
+        try:
+            stats = backup.copy_file(database, temporary, pages, sleep)
+            # The copy holds the primary's data as of the end of the copy
+            as_of = time.time()
+            os.utime(temporary, (as_of, as_of))
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+    return {'path': path, 'bytes': os.path.getsize(path), **stats}
+
+
+class Replica:
+    """
+    Routes heavy reads to the replica while it is fresh enough.
+
+    Args:
+        path (str): The path of the replica.
+        max_staleness (float): Seconds the replica may lag behind; 0 disables replica mode.
+        connect_primary (callable): Returns a new connection to the primary.
+        factory (type): The connection class of replica connections.
+    """
+
+    def __init__(self, path, max_staleness, connect_primary, factory=sqlite3.Connection):
+        self.path = path
+        self.max_staleness = max_staleness
+        self.connect_primary = connect_primary
+        self.factory = factory
+
+    def as_of(self):
+        """
+        The time the replica's data is from, or None if reads go to the primary.
+        """
+        if self.max_staleness <= 0:
+            return None
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            return None
+        return mtime if time.time() - mtime <= self.max_staleness else None
+
+    def data_time(self):
+        """
+        The time the data read by the next connection is from at the latest: the
+        replica's, or now for the primary. Read it before connecting, so that a
+        refresh in between can only make the data newer.
+        """
+        as_of = self.as_of()
+        return time.time() if as_of is None else as_of
+
+    def connect(self):
+        """
+        A new connection to the replica with sqlite3.Row rows, or to the primary if
+        the replica is missing or too old.
+
+        Returns:
+            sqlite3.Connection: A read-only connection to the replica, or a primary connection.
+        """
+        if self.as_of() is None:
+            REPLICA_READS.inc('primary')
+            return self.connect_primary()
+        REPLICA_READS.inc('replica')
+        conn = sqlite3.connect(f'file:{self.path}?mode=ro&immutable=1', uri=True, factory=self.factory)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Refresh or query the read-only replica of the database.')
+    parser.add_argument('--database', default=os.getenv('DATABASE_PATH', 'database.db'))
+    parser.add_argument('--replica', help='the replica (default REPLICA_PATH, or replica.db next to the database)')
+    parser.add_argument('--max-staleness', type=float, default=float(os.getenv('REPLICA_MAX_STALENESS', 0)),
+                        help='seconds the replica may lag behind, otherwise the primary is queried')
+    commands = parser.add_subparsers(dest='command', required=True)
+    refresh_parser = commands.add_parser('refresh', help='copy the database into the replica now')
+    refresh_parser.add_argument('--pages', type=int, default=backup.STEP_PAGES, help='pages copied per step')
+    refresh_parser.add_argument('--sleep', type=float, default=backup.STEP_SLEEP, help='seconds between steps')
+    commands.add_parser('status', help='show the age of the replica')
+    commands.add_parser('query', help='run a read-only query and print the rows as CSV').add_argument('sql')
+    args = parser.parse_args()
+    path = args.replica or os.getenv('REPLICA_PATH') or default_path(args.database)
+
+    try:
+        if args.command == 'refresh':
+            result = refresh(args.database, path, args.pages, args.sleep)
+            print(json.dumps(result if result is not None else {'skipped': 'another refresh is running'}, indent=2))
+        elif args.command == 'status':
+            seconds = age(path)
+            print(json.dumps({'path': path, 'age': None if seconds is None else round(seconds, 1),
+                              'used': Replica(path, args.max_staleness, None).as_of() is not None}, indent=2))
+        else:
+            replica = Replica(path, args.max_staleness,
+                              lambda: sqlite3.connect(f'file:{args.database}?mode=ro', uri=True, timeout=30))
+            data_time = replica.data_time()
+            conn = replica.connect()
+            try:
+                cursor = conn.execute(args.sql)
+                print(f'Data as of {round(time.time() - data_time, 1)} s ago', file=sys.stderr)
+                writer = csv.writer(sys.stdout, lineterminator='\n')
+                writer.writerow([column[0] for column in cursor.description or ()])
+                for rows in iter(lambda: cursor.fetchmany(1000), []):
+                    writer.writerows(rows)
+            finally:
+                conn.close()
+    except (sqlite3.Error, OSError) as e:
+        print(json.dumps({'error': str(e)}))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Periodic background tasks.
+
+A PeriodicTask runs a function on a daemon thread every interval seconds,
+with some jitter so the workers of a gunicorn deployment do not all run it
+at the same moment. Failures are logged and counted; the task keeps running.
+
+Tasks run in every process that starts them. They must be safe to run
+concurrently from several workers, e.g. by doing their work in short
+transactions that re-check their conditions.
+"""
+import logging
+import random
+import threading
+import time
+
+from metrics import BACKGROUND_TASK_DURATION, BACKGROUND_TASK_ERRORS
+
+logger = logging.getLogger('scheduler')
+
+
+class PeriodicTask:
+    """
+    Run a function periodically on a daemon thread.
+
+    Args:
+        name (str): The task name, used in logs and metrics.
+        interval (float): Seconds between runs; 0 or less disables start().
+        func (callable): The zero-argument function to run.
+        jitter (float): Each wait is randomized by up to this fraction of the interval.
+    """
+
+    def __init__(self, name, interval, func, jitter=0.1):
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self.jitter = jitter
+        self.last_run = None
+        self.last_result = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """
+        Start the background thread, unless the task is disabled or already running.
+
+        Returns:
+            PeriodicTask: The task itself.
+        """
+        if self.interval > 0 and not self.running:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name=f'task-{self.name}', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def run_once(self):
+        """
+        Run the task now in the calling thread. Runs of the same task never overlap.
+
+        Returns:
+            The return value of the function.
+        """
+        with self._lock:
+            start = time.perf_counter()
+            try:
+                self.last_result = self.func()
+                return self.last_result
+            except Exception:
+                BACKGROUND_TASK_ERRORS.inc(self.name)
+                raise
+            finally:
+                self.last_run = time.time()
+                BACKGROUND_TASK_DURATION.observe(time.perf_counter() - start, self.name)
+
+    def _loop(self):
+        while not self._stop.wait(self.interval * (1 + random.uniform(-self.jitter, self.jitter))):
+            try:
+                result = self.run_once()
+                logger.debug("Task %s finished: %s", self.name, result)
+            except Exception:
+                logger.exception("Task %s failed", self.name)
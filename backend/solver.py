@@ -0,0 +1,448 @@
+"""
+Starting-eleven solver: assigns a user's favorites to the positions of a
+formation so the total rating is maximal.
+
+Every (slot, player) pair is scored as the player's rating times how well
+the player's position fits the slot's line (FIT). Scoring and candidate
+pruning are vectorized over all favorites with numpy. Since there are only
+eleven slots, an optimal assignment only ever uses one of the eleven best
+candidates of each line, so the Hungarian algorithm runs on at most 11 x 44
+candidates however long the favorites list is.
+
+Budgets (wage bill, market value) are handled by Lagrangian relaxation:
+the cost times a multiplier is subtracted from each score and the
+multiplier is bisected to the smallest one whose assignment fits the
+budget. The per-team cap is repaired afterwards by the cheapest single
+swaps, and a final pass of improving swaps spends any budget left over.
+The result is optimal without constraints and near-optimal with them.
+"""
+import re
+
+import numpy as np
+
+GOALKEEPER, DEFENSE, MIDFIELD, FORWARD, UNKNOWN = range(5)
+
+# FIT[slot line][player line]: share of the rating a player contributes in a slot
+FIT = np.array([
+    # GK   DEF   MID   FWD   unknown
+    [1.00, 0.20, 0.20, 0.20, 0.20],  # goalkeeper slot
+    [0.10, 1.00, 0.85, 0.70, 0.80],  # defense slot
+    [0.10, 0.85, 1.00, 0.85, 0.80],  # midfield slot
+    [0.10, 0.70, 0.85, 1.00, 0.80],  # forward slot
+])
+
+# Score of leaving a slot empty; below any real player's
+EMPTY_SCORE = -1.0
+
+BISECTION_STEPS = 12
+MAX_SWAPS = 100
+
+FORMATION = re.compile(r'^\d(-\d){2,3}$')
+
+# Abbreviated positions, as in squad lists and game data ('GK', 'CDM', 'RW'...), by line
+ABBREVIATIONS = {
+    **dict.fromkeys(('gk', 'g'), GOALKEEPER),
+    **dict.fromkeys(('cb', 'lcb', 'rcb', 'lb', 'rb', 'lwb', 'rwb', 'fb', 'wb', 'sw', 'df', 'd'), DEFENSE),
+    **dict.fromkeys(('cdm', 'dm', 'ldm', 'rdm', 'cm', 'lcm', 'rcm', 'cam', 'am', 'lam', 'ram', 'lm', 'rm',
+                     'mf', 'm'), MIDFIELD),
+    **dict.fromkeys(('st', 'cf', 'lw', 'rw', 'lf', 'rf', 'ss', 'fw', 'f', 'ls', 'rs'), FORWARD),
+}
+
+
+class SolverError(ValueError):
+    """
+    The request cannot be solved, e.g. an invalid formation or unsatisfiable constraints.
+    """
+
+
+def formation_slots(formation):
+    """
+    List the lineup positions of a formation such as '4-3-3' or '4-2-3-1'.
+
+    Positions are named like the frontend's: goalkeeper, defense1..n,
+    midfield1..n and forward1..n. The lines between the first and the last
+    count as midfield.
+
+    Args:
+        formation (str): Outfield players per line, from defense to attack, summing to 10.
+
+    Returns:
+        list: (position, line) tuples, goalkeeper first.
+    """
+    if not FORMATION.match(formation or ''):
+        raise SolverError(f'Invalid formation: {formation!r}')
+    lines = [int(count) for count in formation.split('-')]
+    if sum(lines) != 10:
+        raise SolverError('A formation must have 10 outfield players')
+    defense, forward, midfield = lines[0], lines[-1], sum(lines[1:-1])
+    slots = [('goalkeeper', GOALKEEPER)]
+    for name, line, count in (('defense', DEFENSE, defense), ('midfield', MIDFIELD, midfield),
+                              ('forward', FORWARD, forward)):
+        slots.extend((f'{name}{i}', line) for i in range(1, count + 1))
+    return slots
+
+
+def position_line(position):
+    """
+    Classify a free-text position ('Goalkeeper', 'CentreBack', 'AttackingMidfield'...)
+    or an abbreviated one ('GK', 'CB', 'CDM', 'ST'...; the first of a list such as 'RW, ST').
+
+    Returns:
+        int: GOALKEEPER, DEFENSE, MIDFIELD, FORWARD or UNKNOWN.
+    """
+    text = (position or '').lower()
+    # Abbreviations first: the substring rules below match none of them
+    line = ABBREVIATIONS.get(re.split(r'[\s,/;|]+', text.strip())[0])
+    if line is not None:
+        return line
+    if 'goal' in text or 'keeper' in text:
+        return GOALKEEPER
+    if 'mid' in text:
+        return MIDFIELD
+    if 'back' in text or 'defen' in text or 'sweeper' in text:
+        return DEFENSE
+    if 'forward' in text or 'striker' in text or 'wing' in text or 'attack' in text:
+        return FORWARD
+    return UNKNOWN
+
+
+class Candidates:
+    """
+    Column arrays of the players to choose from.
+
+    Args:
+        columns (list): Column names of the rows; must include player_id, position,
+            team, rating_value, wage_eur and market_value_eur.
+        rows (list): Row tuples, e.g. from RowList.
+    """
+
+    def __init__(self, columns, rows):
+        self.columns = list(columns)
+        self.rows = rows
+        # Transposed in C: one tuple per column
+        data = dict(zip(self.columns, zip(*rows))) if rows else dict.fromkeys(self.columns, ())
+
+        def numbers(name):
+            return np.nan_to_num(np.array(data[name], dtype=float), nan=0.0)
+
+        self.rating = numbers('rating_value')
+        self.wage = numbers('wage_eur')
+        self.market_value = numbers('market_value_eur')
+        # Positions and teams repeat a lot: classify and number each distinct value once
+        lines = {position: position_line(position) for position in set(data['position'])}
+        self.line = np.array([lines[position] for position in data['position']], dtype=np.intp)
+        teams = {}
+        self.team = np.array([teams.setdefault(team or '', len(teams)) for team in data['team']], dtype=np.intp)
+        self.team_names = list(teams)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def player(self, i):
+        return dict(zip(self.columns, self.rows[i]))
+
+
+def hungarian(scores):
+    """
+    Maximum-score assignment of rows to distinct columns (rows <= columns).
+
+    Args:
+        scores (list): Row lists of scores.
+
+    Returns:
+        list: The column assigned to each row.
+    """
+    n, m = len(scores), len(scores[0])
+    inf = float('inf')
+    u = [0.0] * (n + 1)
+    v = [0.0] * (m + 1)
+    owner = [0] * (m + 1)  # 1-based row owning each column, 0 if free
+    way = [0] * (m + 1)
+    for i in range(1, n + 1):
+        owner[0] = i
+        j0 = 0
+        minv = [inf] * (m + 1)
+        used = [False] * (m + 1)
+        while True:
+            used[j0] = True
+            row = scores[owner[j0] - 1]
+            ui = u[owner[j0]]
+            delta, j1 = inf, 0
+            for j in range(1, m + 1):
+                if not used[j]:
+                    # Minimizing the negated scores
+                    reduced = -row[j - 1] - ui - v[j]
+                    if reduced < minv[j]:
+                        minv[j] = reduced
+                        way[j] = j0
+                    if minv[j] < delta:
+                        delta, j1 = minv[j], j
+            for j in range(m + 1):
+                if used[j]:
+                    u[owner[j]] += delta
+                    v[j] -= delta
+                else:
+                    minv[j] -= delta
+            j0 = j1
+            if owner[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            owner[j0] = owner[j1]
+            j0 = j1
+    assignment = [0] * n
+    for j in range(1, m + 1):
+        if owner[j]:
+            assignment[owner[j] - 1] = j - 1
+    return assignment
+
+
+class Problem:
+    """
+    One solver run: a formation, the candidates and the constraints.
+    """
+
+    def __init__(self, candidates, formation, max_wage=None, max_market_value=None, max_per_team=None):
+        self.candidates = candidates
+        self.slots = formation_slots(formation)
+        self.slot_lines = np.array([line for _, line in self.slots], dtype=np.intp)
+        self.lines = np.unique(self.slot_lines)
+        self.max_wage = max_wage
+        self.max_market_value = max_market_value
+        self.max_per_team = max_per_team
+        if max_per_team is not None and max_per_team < 1:
+            raise SolverError('max_per_team must be at least 1')
+
+        # Scores of every player in each of the four slot lines: shape (4, players)
+        self.line_scores = FIT[:, candidates.line] * candidates.rating
+        # Budget usage as a fraction of each budget, for the Lagrangian term
+        self.cost = np.zeros(len(candidates))
+        if max_wage is not None:
+            self.cost += candidates.wage / max(max_wage, 1)
+        if max_market_value is not None:
+            self.cost += candidates.market_value / max(max_market_value, 1)
+
+    def assign(self, penalty):
+        """
+        Optimal assignment for the scores minus penalty times the cost, ignoring the team cap.
+
+        Returns:
+            list: The player index of each slot, or -1 for an empty slot.
+        """
+        adjusted = self.line_scores - penalty * self.cost
+        n = len(self.slots)
+        columns = []
+        for line in self.lines:
+            scores = adjusted[line]
+            if len(scores) > n:
+                top = np.argpartition(-scores, n - 1)[:n]
+            else:
+                top = np.arange(len(scores))
+            columns.extend(top.tolist())
+        columns = sorted(set(columns))
+        # n empty columns so every slot can stay empty
+        matrix = [adjusted[line, columns].tolist() + [EMPTY_SCORE] * n for line in self.slot_lines]
+        chosen = hungarian(matrix)
+        return [columns[c] if c < len(columns) else -1 for c in chosen]
+
+    def score(self, lineup):
+        return sum(self.line_scores[line, i] if i >= 0 else EMPTY_SCORE
+                   for line, i in zip(self.slot_lines, lineup))
+
+    def totals(self, lineup):
+        chosen = [i for i in lineup if i >= 0]
+        return self.candidates.wage[chosen].sum(), self.candidates.market_value[chosen].sum()
+
+    def within_budget(self, lineup):
+        wage, market_value = self.totals(lineup)
+        return ((self.max_wage is None or wage <= self.max_wage)
+                and (self.max_market_value is None or market_value <= self.max_market_value))
+
+    def team_counts(self, lineup):
+        return np.bincount(self.candidates.team[[i for i in lineup if i >= 0]],
+                           minlength=len(self.candidates.team_names))
+
+    def budget_lineups(self):
+        """
+        The distinct assignments that fit the budget met while bisecting the multiplier.
+
+        Returns:
+            list: Lineups, the unconstrained optimum alone if it fits the budget.
+        """
+        lineup = self.assign(0.0)
+        if self.within_budget(lineup):
+            return [lineup]
+        low, high = 0.0, 1.0
+        feasible = []
+        for _ in range(64):
+            candidate = self.assign(high)
+            if self.within_budget(candidate):
+                feasible.append(candidate)
+                break
+            low, high = high, high * 2
+        if not feasible:
+            raise SolverError('No lineup fits the budget')
+        for _ in range(BISECTION_STEPS):
+            middle = (low + high) / 2
+            candidate = self.assign(middle)
+            if self.within_budget(candidate):
+                high = middle
+                if candidate not in feasible:
+                    feasible.append(candidate)
+            else:
+                low = middle
+        return feasible
+
+    def allowed(self, lineup, slot, counts, wage, market_value):
+        """
+        Mask of the unused players that may replace the player of a slot within the constraints.
+        """
+        candidates = self.candidates
+        current = lineup[slot]
+        allowed = np.ones(len(candidates), dtype=bool)
+        allowed[[i for i in lineup if i >= 0]] = False
+        outgoing_wage = candidates.wage[current] if current >= 0 else 0.0
+        outgoing_value = candidates.market_value[current] if current >= 0 else 0.0
+        if self.max_wage is not None:
+            allowed &= wage - outgoing_wage + candidates.wage <= self.max_wage
+        if self.max_market_value is not None:
+            allowed &= market_value - outgoing_value + candidates.market_value <= self.max_market_value
+        if self.max_per_team is not None:
+            after = counts[candidates.team] + 1
+            if current >= 0:
+                after -= candidates.team == candidates.team[current]
+            allowed &= after <= self.max_per_team
+        return allowed
+
+    def best_swap(self, lineup, slots):
+        """
+        The best move that drops the player of one of the given slots: either a new
+        player takes the slot, or a new player takes another slot whose player moves
+        into the freed one.
+
+        Returns:
+            tuple: (score gain, dropped slot, slot the new player takes, new player).
+        """
+        counts = self.team_counts(lineup)
+        wage, market_value = self.totals(lineup)
+        scores = self.line_scores
+        best = (-np.inf, None, None, None)
+        for dropped in slots:
+            allowed = self.allowed(lineup, dropped, counts, wage, market_value)
+            if not allowed.any():
+                continue
+            line = self.slot_lines[dropped]
+            loss = scores[line, lineup[dropped]] if lineup[dropped] >= 0 else EMPTY_SCORE
+            # Best slot of each line for the new player: the one whose player gains most by moving
+            shifts = {}
+            for slot, moved in enumerate(lineup):
+                shift_line = self.slot_lines[slot]
+                if slot == dropped:
+                    shift = 0.0
+                elif moved >= 0:
+                    shift = scores[line, moved] - scores[shift_line, moved]
+                else:
+                    continue
+                if shift > shifts.get(shift_line, (-np.inf, None))[0]:
+                    shifts[shift_line] = (shift, slot)
+            for shift_line, (shift, slot) in shifts.items():
+                gains = np.where(allowed, scores[shift_line], -np.inf)
+                player = int(np.argmax(gains))
+                gain = gains[player] + shift - loss
+                if gain > best[0]:
+                    best = (gain, dropped, slot, player)
+        return best
+
+    def apply(self, lineup, dropped, slot, player):
+        lineup = list(lineup)
+        if slot != dropped:
+            lineup[dropped] = lineup[slot]
+        lineup[slot] = player
+        return lineup
+
+    def repair_teams(self, lineup):
+        if self.max_per_team is None:
+            return lineup
+        for _ in range(MAX_SWAPS):
+            counts = self.team_counts(lineup)
+            over = np.flatnonzero(counts > self.max_per_team)
+            if not len(over):
+                return lineup
+            slots = [slot for slot, i in enumerate(lineup) if i >= 0 and self.candidates.team[i] == over[0]]
+            gain, dropped, slot, player = self.best_swap(lineup, slots)
+            if dropped is None:
+                # Leave the cheapest slot of the team empty
+                dropped = slot = min(slots, key=lambda s: self.line_scores[self.slot_lines[s], lineup[s]])
+                player = -1
+            lineup = self.apply(lineup, dropped, slot, player)
+        raise SolverError('No lineup satisfies the team limit')
+
+    def reassign(self, lineup):
+        """
+        Optimal slots for the players of a lineup; the set of players, and so the constraints, stay the same.
+        """
+        chosen = [i for i in lineup if i >= 0]
+        n = len(self.slots)
+        matrix = [self.line_scores[line, chosen].tolist() + [EMPTY_SCORE] * n for line in self.slot_lines]
+        return [chosen[c] if c < len(chosen) else -1 for c in hungarian(matrix)]
+
+    def improve(self, lineup):
+        for _ in range(MAX_SWAPS):
+            gain, dropped, slot, player = self.best_swap(lineup, range(len(lineup)))
+            if dropped is None or not gain > 1e-9:
+                reassigned = self.reassign(lineup)
+                if not self.score(reassigned) > self.score(lineup) + 1e-9:
+                    break
+                lineup = reassigned
+                continue
+            lineup = self.apply(lineup, dropped, slot, player)
+        return lineup
+
+    def solve(self):
+        constrained = self.cost.any() or self.max_per_team is not None
+        best = None
+        # The relaxation's duality gap is closed by local search from each of its feasible lineups
+        for lineup in self.budget_lineups():
+            lineup = self.repair_teams(lineup)
+            if constrained:
+                lineup = self.improve(lineup)
+            if best is None or self.score(lineup) > self.score(best):
+                best = lineup
+        return best
+
+def solve(candidates, formation='4-3-3', max_wage=None, max_market_value=None, max_per_team=None):
+    """
+    Find the starting eleven with the highest total rating.
+
+    Args:
+        candidates (Candidates): The players to choose from.
+        formation (str): The formation, e.g. '4-3-3'.
+        max_wage (int, optional): Maximum total wage in euros.
+        max_market_value (int, optional): Maximum total market value in euros.
+        max_per_team (int, optional): Maximum number of players from one team.
+
+    Returns:
+        dict: The lineup (position, player and the share of the rating the player's
+        position fit contributes) and its totals. Slots nobody fits are left out.
+    """
+    problem = Problem(candidates, formation, max_wage, max_market_value, max_per_team)
+    lineup = problem.solve() if len(candidates) else [-1] * len(problem.slots)
+    wage, market_value = problem.totals(lineup)
+    entries = []
+    for (position, line), i in zip(problem.slots, lineup):
+        if i < 0:
+            continue
+        entries.append({
+            'position': position,
+            'player': candidates.player(i),
+            'fit': float(FIT[line, candidates.line[i]]),
+            'score': round(float(problem.line_scores[line, i]), 2),
+        })
+    return {
+        'formation': formation,
+        'lineup': entries,
+        'empty_positions': [position for (position, _), i in zip(problem.slots, lineup) if i < 0],
+        'total_score': round(sum(entry['score'] for entry in entries), 2),
+        'total_wage_eur': int(wage),
+        'total_market_value_eur': int(market_value),
+    }
@@ -0,0 +1,294 @@
+"""
+Statement-level timing for SQLite connections.
+
+get_db_connection() opens its connections with TracedConnection, whose
+cursors, and the cursors of its execute() shortcuts, time every statement
+from execute() until its rows have been fetched. Statements are aggregated by their normalized text (literals and
+parameters stripped) with counts, total time and p50/p99 over the most recent
+executions. Statements slower than the threshold are logged together with
+their EXPLAIN QUERY PLAN.
+"""
+import logging
+import re
+import sqlite3
+import threading
+import time
+import weakref
+from collections import deque
+from functools import lru_cache
+
+logger = logging.getLogger('sqltrace')
+
+# Statements that have a query plan worth logging
+EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE', 'WITH')
+
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+IN_LIST = re.compile(r'IN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)', re.IGNORECASE)
+WHITESPACE = re.compile(r'\s+')
+COMMENT = re.compile(r'--[^\n]*')
+
+
+@lru_cache(maxsize=2048)
+def normalize(sql):
+    """
+    Normalize a statement so executions with different literals aggregate together.
+
+    Args:
+        sql (str): The statement text.
+
+    Returns:
+        str: The statement with comments removed, literals replaced by ?, IN lists
+             collapsed and whitespace collapsed.
+    """
+    sql = COMMENT.sub(' ', sql)
+    sql = STRING_LITERAL.sub('?', sql)
+    sql = NUMBER_LITERAL.sub('?', sql)
+    sql = IN_LIST.sub('IN (?)', sql)
+    return WHITESPACE.sub(' ', sql).strip()
+
+
+class StatementStats:
+    """
+    Aggregated timings of one normalized statement.
+
+    Args:
+        sample_size (int): The number of recent durations kept for percentiles.
+    """
+
+    __slots__ = ('count', 'total', 'max', 'samples')
+
+    def __init__(self, sample_size):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = deque(maxlen=sample_size)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.samples.append(seconds)
+
+    def percentile(self, fraction):
+        samples = sorted(self.samples)
+        if not samples:
+            return 0.0
+        return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+class QueryTracer:
+    """
+    Collects statement timings and writes the slow-query log.
+
+    Args:
+        slow_threshold_ms (float): Statements slower than this are logged.
+        sample_size (int): Recent durations kept per statement for p50/p99.
+    """
+
+    def __init__(self, slow_threshold_ms=100.0, sample_size=1024):
+        self.slow_threshold_ms = slow_threshold_ms
+        self.sample_size = sample_size
+        self.stats = {}
+        self.plans = {}
+        self.lock = threading.Lock()
+
+    def record(self, sql, seconds, connection=None, parameters=None):
+        """
+        Record one execution of a statement.
+
+        Args:
+            sql (str): The statement text as executed.
+            seconds (float): The duration of the execution including fetching.
+            connection (sqlite3.Connection, optional): Used to explain slow statements.
+            parameters (tuple or dict, optional): Bound parameters, used only for EXPLAIN.
+        """
+        statement = normalize(sql)
+        with self.lock:
+            stats = self.stats.get(statement)
+            if stats is None:
+                stats = self.stats[statement] = StatementStats(self.sample_size)
+            stats.add(seconds)
+        if seconds * 1000 >= self.slow_threshold_ms:
+            self.log_slow(statement, sql, seconds, connection, parameters)
+
+    def log_slow(self, statement, sql, seconds, connection, parameters):
+        plan = self.plans.get(statement)
+        if plan is None and connection is not None and statement.upper().startswith(EXPLAINABLE):
+            try:
+                # A plain sqlite3.Cursor, so the EXPLAIN itself is not traced
+                cursor = sqlite3.Cursor(connection)
+                cursor.row_factory = None
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql, parameters or ())
+                plan = self.plans[statement] = [row[-1] for row in cursor.fetchall()]
+                cursor.close()
+            except sqlite3.Error as e:
+                plan = [f'unavailable: {e}']
+        logger.warning("Slow SQL statement (%.1f ms): %s", seconds * 1000, statement,
+                       extra={'statement': statement, 'duration_ms': round(seconds * 1000, 3), 'plan': plan})
+
+    def top(self, limit=20, order='total'):
+        """
+        List the statements with the highest total, p99, max or count.
+
+        Args:
+            limit (int): The number of statements to return.
+            order (str): 'total', 'p99', 'max' or 'count'.
+
+        Returns:
+            list: One dict per statement.
+        """
+        with self.lock:
+            items = list(self.stats.items())
+        rows = []
+        for statement, stats in items:
+            rows.append({
+                'statement': statement,
+                'count': stats.count,
+                'total_ms': round(stats.total * 1000, 3),
+                'mean_ms': round(stats.total / stats.count * 1000, 3) if stats.count else 0.0,
+                'p50_ms': round(stats.percentile(0.50) * 1000, 3),
+                'p99_ms': round(stats.percentile(0.99) * 1000, 3),
+                'max_ms': round(stats.max * 1000, 3),
+                'plan': self.plans.get(statement),
+            })
+        key = {'total': 'total_ms', 'p99': 'p99_ms', 'max': 'max_ms', 'count': 'count'}.get(order, 'total_ms')
+        rows.sort(key=lambda row: row[key], reverse=True)
+        return rows[:limit]
+
+    def reset(self):
+        with self.lock:
+            self.stats.clear()
+            self.plans.clear()
+
+
+TRACER = QueryTracer()
+
+
+class TracedCursor(sqlite3.Cursor):
+    """
+    Cursor that times each statement from execute() until its rows are
+    fetched, the next statement starts or the cursor is closed.
+    """
+
+    _pending = None
+
+    def _start(self, sql, parameters):
+        self._finish()
+        self._pending = [sql, parameters, 0.0]
+
+    def _add(self, seconds):
+        if self._pending is not None:
+            self._pending[2] += seconds
+
+    def _finish(self):
+        pending = self._pending
+        if pending is not None:
+            self._pending = None
+            TRACER.record(pending[0], pending[2], self.connection, pending[1])
+
+    def execute(self, sql, parameters=()):
+        self._start(sql, parameters)
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._add(time.perf_counter() - start)
+            if self.description is None:
+                # No result rows to fetch (INSERT, UPDATE, DDL...)
+                self._finish()
+
+    def executemany(self, sql, seq_of_parameters):
+        self._start(sql, None)
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._add(time.perf_counter() - start)
+            self._finish()
+
+    def executescript(self, sql_script):
+        # Timed as one statement: the script's text
+        self._start(sql_script, None)
+        start = time.perf_counter()
+        try:
+            return super().executescript(sql_script)
+        finally:
+            self._add(time.perf_counter() - start)
+            self._finish()
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._add(time.perf_counter() - start)
+        if row is None:
+            self._finish()
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._add(time.perf_counter() - start)
+        if len(rows) < (self.arraysize if size is None else size):
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._add(time.perf_counter() - start)
+        self._finish()
+        return rows
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        # A cursor dropped before its rows ran out, e.g. conn.execute(...).fetchone()
+        self._finish()
+
+
+class TracedConnection(sqlite3.Connection):
+    """
+    Connection whose cursors are TracedCursors, including the cursors of the
+    execute(), executemany() and executescript() shortcuts. Commits are
+    recorded as the COMMIT statement, and statements still pending when the
+    connection is committed or closed are finished then.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cursors = weakref.WeakSet()
+
+    def cursor(self, factory=TracedCursor):
+        cursor = super().cursor(factory)
+        if isinstance(cursor, TracedCursor):
+            self._cursors.add(cursor)
+        return cursor
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+    def _finish_cursors(self):
+        for cursor in list(self._cursors):
+            cursor._finish()
+
+    def commit(self):
+        self._finish_cursors()
+        start = time.perf_counter()
+        try:
+            super().commit()
+        finally:
+            TRACER.record('COMMIT', time.perf_counter() - start)
+
+    def close(self):
+        self._finish_cursors()
+        super().close()
@@ -0,0 +1,55 @@
+import os
+import sys
+import uuid
+
+import pytest
+
+# The backend modules are imported as top-level modules, as app.py does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='session')
+def backend(tmp_path_factory):
+    """
+    The app module, on a fresh database with the background tasks off.
+
+    app.py reads its configuration when imported, so it is imported once per
+    session; tests share the database and keep apart with unique names.
+    """
+    directory = tmp_path_factory.mktemp('backend')
+    os.environ.update(
+        DATABASE_PATH=str(directory / 'database.db'),
+        LOG_LEVEL='ERROR',
+        ORPHAN_SWEEP_INTERVAL='0',
+        BACKUP_INTERVAL='0',
+        MAINTENANCE_INTERVAL='0',
+        CATALOGUE_PRUNE_INTERVAL='0',
+        IMAGE_HOSTS='img.example.org',
+        ADMIN_TOKEN='test-token',
+    )
+    import app
+    return app
+
+
+@pytest.fixture
+def client(backend):
+    return backend.app.test_client()
+
+
+@pytest.fixture
+def unique():
+    """
+    Returns the given name with a suffix unique to the test, e.g. for usernames and player URIs.
+    """
+    suffix = uuid.uuid4().hex[:8]
+    return lambda name: f'{name}-{suffix}'
+
+
+@pytest.fixture
+def user(client, unique):
+    """
+    The name of a newly registered user.
+    """
+    username = unique('user')
+    assert client.post('/api/register', json={'username': username, 'password': 'pw'}).status_code == 200
+    return username
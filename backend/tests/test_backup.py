@@ -0,0 +1,98 @@
+import os
+import sqlite3
+import time
+
+import pytest
+
+import backup
+
+
+@pytest.fixture
+def database(tmp_path):
+    path = str(tmp_path / 'players.db')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE Players (player_id INTEGER PRIMARY KEY, name TEXT)')
+    conn.executemany('INSERT INTO Players (name) VALUES (?)', [(f'Player {index}',) for index in range(2000)])
+    conn.commit()
+    conn.close()
+    return path
+
+
+def names(path):
+    conn = sqlite3.connect(path)
+    try:
+        return [name for name, in conn.execute('SELECT name FROM Players ORDER BY player_id')]
+    finally:
+        conn.close()
+
+
+def fake_snapshot(directory, created):
+    """
+    An older snapshot file, named as create() names them.
+    """
+    path = os.path.join(directory, f'players-{created}.db')
+    with open(path, 'w') as file:
+        file.write('old')
+    with open(path + '.sha256', 'w') as sidecar:
+        sidecar.write(f'{backup.checksum(path)}  {os.path.basename(path)}\n')
+    return path
+
+
+def test_backup_and_restore(database, tmp_path):
+    directory = str(tmp_path / 'backups')
+    original = names(database)
+    result = backup.create(database, directory, pages=100, sleep=0)
+    assert os.path.basename(result['path']).startswith('players-') and result['deleted'] == []
+    assert backup.verify(result['path']) == result['sha256']
+    assert [snapshot['path'] for snapshot in backup.snapshots(directory, database)] == [result['path']]
+
+    conn = sqlite3.connect(database)
+    conn.execute("UPDATE Players SET name = 'changed' WHERE player_id <= 10")
+    conn.execute('DELETE FROM Players WHERE player_id > 1000')
+    conn.commit()
+    conn.close()
+
+    backup.restore(result['path'], database)
+    assert names(database) == original
+    assert sqlite3.connect(database).execute('PRAGMA integrity_check').fetchall() == [('ok',)]
+
+
+def test_corrupt_snapshot_is_not_restored(database, tmp_path):
+    directory = str(tmp_path / 'backups')
+    path = backup.create(database, directory, sleep=0)['path']
+    with open(path, 'r+b') as file:
+        file.seek(4096)
+        file.write(b'\x00' * 16)
+    with pytest.raises(ValueError, match='corrupt'):
+        backup.restore(path, database)
+
+    os.unlink(path + '.sha256')
+    with pytest.raises(ValueError, match='no checksum'):
+        backup.verify(path)
+
+
+def test_rotation(database, tmp_path):
+    directory = str(tmp_path / 'backups')
+    os.makedirs(directory)
+    old = [fake_snapshot(directory, created) for created in ('20240101T000000Z', '20240102T000000Z', '20240103T000000Z')]
+    # Files that are not snapshots of this database are left alone
+    unrelated = [fake_snapshot(directory, 'latest'), os.path.join(directory, 'other-20240101T000000Z.db')]
+    open(unrelated[1], 'w').close()
+
+    result = backup.create(database, directory, keep=2, sleep=0)
+    assert sorted(result['deleted']) == old[:2]
+    assert [snapshot['path'] for snapshot in backup.snapshots(directory, database)] == [result['path'], old[2]]
+    assert not any(os.path.exists(path + '.sha256') for path in old[:2])
+    assert all(os.path.exists(path) for path in unrelated)
+
+
+def test_recent_snapshot_skips_the_backup(database, tmp_path):
+    directory = str(tmp_path / 'backups')
+    first = backup.create(database, directory, sleep=0)
+    assert backup.create(database, directory, sleep=0, min_age=3600) is None
+    assert len(backup.snapshots(directory, database)) == 1
+
+    # Snapshots are named to the second
+    time.sleep(1.1)
+    second = backup.create(database, directory, sleep=0, min_age=0.5)
+    assert second is not None and second['path'] != first['path']
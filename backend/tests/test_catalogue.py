@@ -0,0 +1,133 @@
+import random
+
+import pytest
+
+from catalogue import CATEGORICAL, NUMERIC, Equals, NameContains, Range, Snapshot
+
+VALUES = {
+    'position': ['Striker', 'Goalkeeper', 'Defender', None],
+    'team': ['Reds', 'Blues', 'reds', None],
+    'nationality': ['Spain', 'Italy', 'Unknown', None],
+    'foot': ['Left', 'Right'],
+}
+
+
+@pytest.fixture(scope='module')
+def rows():
+    rng = random.Random(7)
+    result = []
+    for player_id in range(1, 401):
+        numbers = [None if rng.random() < 0.1 else rng.randint(lower, lower + 20)
+                   for lower in (60, 65, 1_000_000, 10_000, 170)]
+        result.append((player_id * 3, rng.choice(['Alpha', 'Beta', 'Gamma', None]),
+                       *(rng.choice(VALUES[attribute]) for attribute in CATEGORICAL), *numbers))
+    return result
+
+
+@pytest.fixture(scope='module')
+def snapshot(rows):
+    return Snapshot(rows, version=1)
+
+
+def value_of(row, attribute):
+    if attribute in CATEGORICAL:
+        return row[2 + CATEGORICAL.index(attribute)]
+    return row[2 + len(CATEGORICAL) + [name for name, _ in NUMERIC].index(attribute)]
+
+
+def category(value):
+    return ('Unknown' if value is None else value).lower()
+
+
+def matches(row, predicate):
+    if isinstance(predicate, Equals):
+        return category(value_of(row, predicate.attribute)) == predicate.value.lower()
+    if isinstance(predicate, Range):
+        value = value_of(row, predicate.attribute)
+        return value is not None and (predicate.low is None or value >= predicate.low) \
+            and (predicate.high is None or value <= predicate.high)
+    return predicate.text in (row[1] or '').lower()
+
+
+QUERIES = [
+    [],
+    [Equals('team', 'REDS')],
+    [Equals('nationality', 'unknown')],
+    [Equals('position', 'Striker'), Range('rating', 70, 75)],
+    [Range('wage', low=10_015), Range('height', high=175), Equals('foot', 'Left')],
+    [NameContains('ALP'), Equals('team', 'Blues')],
+    [Equals('team', 'Nobody')],
+]
+
+
+@pytest.mark.parametrize('predicates', QUERIES, ids=lambda predicates: ', '.join(map(str, predicates)) or 'all')
+def test_match(snapshot, rows, predicates):
+    found, plan = snapshot.match(predicates)
+    expected = [row[0] for row in rows if all(matches(row, predicate) for predicate in predicates)]
+    assert (snapshot.ids.tolist() if found is None else snapshot.ids[found].tolist()) == expected
+    assert [estimate for _, estimate in plan] == sorted(estimate for _, estimate in plan)
+
+
+@pytest.mark.parametrize('predicates', QUERIES[:5], ids=lambda predicates: ', '.join(map(str, predicates)) or 'all')
+@pytest.mark.parametrize('sort', ['rating', 'market_value'])
+@pytest.mark.parametrize('descending', [True, False])
+def test_rank(snapshot, rows, predicates, sort, descending):
+    found, _ = snapshot.match(predicates)
+    matching = [row for row in rows if all(matches(row, predicate) for predicate in predicates)]
+    # Unknown values last, ties by player_id
+    matching.sort(key=lambda row: (value_of(row, sort) is None,
+                                   0 if value_of(row, sort) is None else
+                                   -value_of(row, sort) if descending else value_of(row, sort), row[0]))
+    for offset, limit in ((0, 10), (5, 20), (len(matching) - 3, 10)):
+        page = snapshot.rank(found, sort, descending, offset, limit)
+        assert snapshot.ids[page].tolist() == [row[0] for row in matching[offset:offset + limit]]
+
+
+def test_facet_counts(snapshot, rows):
+    predicates = [Equals('team', 'Reds'), Range('rating', high=72)]
+    found, _ = snapshot.match(predicates)
+    facets = snapshot.facet_counts(predicates, found, ['team', 'foot'], limit=2)
+
+    def expected(attribute, others):
+        counts = {}
+        for row in rows:
+            if all(matches(row, predicate) for predicate in others):
+                value = value_of(row, attribute)
+                counts[category(value)] = counts.get(category(value), 0) + 1
+        return sorted(counts.values(), reverse=True)[:2]
+
+    # The filtered facet is counted without its own filter, so the other teams keep their counts
+    assert [facet['count'] for facet in facets['team']] == expected('team', predicates[1:])
+    assert [facet['count'] for facet in facets['foot']] == expected('foot', predicates)
+    # Values differing in case are one facet value
+    assert len({facet['value'].lower() for facet in facets['team']}) == len(facets['team'])
+
+
+def test_percentiles(snapshot, rows):
+    ratings = sorted(value_of(row, 'rating') for row in rows if value_of(row, 'rating') is not None)
+    strikers = sorted(value_of(row, 'rating') for row in rows
+                      if value_of(row, 'rating') is not None and value_of(row, 'position') == 'Striker')
+    value = ratings[len(ratings) // 2]
+
+    def mid_rank(values):
+        below = sum(1 for other in values if other < value)
+        equal = sum(1 for other in values if other == value)
+        return round(100 * (below + equal / 2) / len(values), 1)
+
+    result = snapshot.percentiles({'rating': value, 'height': None}, 'Striker')
+    assert result['players'] == {'overall': len(rows),
+                                 'position': sum(1 for row in rows if value_of(row, 'position') == 'Striker')}
+    assert result['percentiles']['rating'] == {'value': value, 'overall': mid_rank(ratings), 'position': mid_rank(strikers)}
+    assert result['percentiles']['height'] == {'value': None, 'overall': None, 'position': None}
+    # Players without a position are compared with the 'Unknown' group; an unknown position with nobody
+    assert snapshot.percentiles({'rating': value}, None)['players']['position'] == \
+        sum(1 for row in rows if value_of(row, 'position') is None)
+    assert snapshot.percentiles({'rating': value}, 'Coach')['percentiles']['rating']['position'] is None
+
+
+def test_empty_catalogue():
+    snapshot = Snapshot([], version=0)
+    found, _ = snapshot.match([Equals('team', 'Reds')])
+    assert len(found) == 0 and snapshot.rank(None, 'rating', True, 0, 10).tolist() == []
+    assert snapshot.percentiles({'rating': 80}, 'Striker')['percentiles']['rating'] == \
+        {'value': 80, 'overall': None, 'position': None}
@@ -0,0 +1,64 @@
+import gzip
+import json
+
+import pytest
+
+from compression import encoded_etags
+
+USER_RESOURCES = ['/api/users/{}/profile', '/api/users/{}/players', '/api/startingeleven/{}']
+
+
+def add_favorites(client, username, unique, count):
+    for index in range(count):
+        response = client.post(f'/api/users/{username}/favorite_players', json={
+            'name': f'Player {index}', 'player': unique(f'http://data.example.org/player/{index}'),
+            'team': 'Reds', 'position': 'Striker', 'description': 'A long description. ' * 10,
+        })
+        assert response.status_code == 200
+
+
+def test_encoded_etags():
+    assert encoded_etags('u1-v2') == ('u1-v2', 'u1-v2-gzip', 'u1-v2-br')
+
+
+@pytest.mark.parametrize('resource', USER_RESOURCES)
+def test_if_none_match(client, user, unique, resource):
+    add_favorites(client, user, unique, 1)
+    url = resource.format(user)
+    response = client.get(url)
+    etag, weak = response.get_etag()
+    assert response.status_code == 200 and not weak and etag.startswith('u')
+
+    for header in (f'"{etag}"', f'W/"{etag}"', f'"{etag}-gzip"', f'"{etag}-br"', f'"other", "{etag}-gzip"'):
+        response = client.get(url, headers={'If-None-Match': header})
+        assert response.status_code == 304, header
+        assert response.get_etag() == (etag, False) and response.data == b''
+    for header in ('"other"', f'"{etag}-deflate"', f'"{etag}0"'):
+        assert client.get(url, headers={'If-None-Match': header}).status_code == 200, header
+
+
+@pytest.mark.parametrize('resource', USER_RESOURCES)
+def test_writes_change_the_etag(client, user, unique, resource):
+    url = resource.format(user)
+    etag, _ = client.get(url).get_etag()
+    add_favorites(client, user, unique, 1)
+    response = client.get(url, headers={'If-None-Match': f'"{etag}"'})
+    assert response.status_code == 200 and response.get_etag()[0] != etag
+
+
+def test_compressed_etag(client, user, unique):
+    add_favorites(client, user, unique, 10)
+    url = f'/api/users/{user}/profile'
+    plain = client.get(url)
+    assert 'Content-Encoding' not in plain.headers and len(plain.data) > 1024
+    etag, _ = plain.get_etag()
+
+    compressed = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in compressed.headers['Vary']
+    assert compressed.get_etag() == (f'{etag}-gzip', False)
+    assert json.loads(gzip.decompress(compressed.data)) == plain.get_json()
+
+    # A client revalidates with the tag of the representation it has
+    response = client.get(url, headers={'Accept-Encoding': 'gzip', 'If-None-Match': f'"{etag}-gzip"'})
+    assert response.status_code == 304
@@ -0,0 +1,84 @@
+import sqlite3
+import time
+
+import pytest
+
+
+@pytest.fixture
+def db(backend):
+    conn = sqlite3.connect(backend.DATABASE)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def users(client, unique):
+    names = [unique(f'fan{index}') for index in range(2)]
+    for name in names:
+        client.post('/api/register', json={'username': name, 'password': 'pw'})
+    return names
+
+
+@pytest.fixture
+def player(unique):
+    return {'name': 'Alpha', 'player': unique('http://data.example.org/alpha'), 'team': unique('Reds'),
+            'position': 'Striker'}
+
+
+def counters(db, player):
+    count, orphaned_at = db.execute('SELECT favorite_count, orphaned_at FROM Players WHERE source_uri = ?',
+                                    (player['player'],)).fetchone()
+    team = db.execute("SELECT favorites FROM FavoriteCounts WHERE dimension = 'team' AND value = ?",
+                      (player['team'],)).fetchone()
+    return count, orphaned_at, 0 if team is None else team[0]
+
+
+def player_id(db, player):
+    return db.execute('SELECT player_id FROM Players WHERE source_uri = ?', (player['player'],)).fetchone()[0]
+
+
+def test_triggers_count_favorites(client, db, users, player):
+    for username in users:
+        assert client.post(f'/api/users/{username}/favorite_players', json=player).status_code == 200
+    assert counters(db, player) == (2, None, 2)
+    assert client.post(f'/api/users/{users[0]}/favorite_players', json=player).status_code == 400
+    assert counters(db, player) == (2, None, 2)
+
+    for username in users:
+        assert client.delete(f'/api/users/{username}/favorite_players', json={'player': player['player']}).status_code == 200
+    count, orphaned_at, team = counters(db, player)
+    assert (count, team) == (0, 0) and orphaned_at == pytest.approx(time.time(), abs=5)
+
+    # Favorited again before the sweep: the same row, no longer orphaned
+    client.post(f'/api/users/{users[1]}/favorite_players', json=player)
+    assert counters(db, player) == (1, None, 1)
+
+
+def test_players_sharing_a_name_are_distinct(client, db, users, player, unique):
+    namesake = {**player, 'player': unique('http://data.example.org/alpha-2'), 'team': unique('Blues')}
+    for username, favorite in zip(users, (player, namesake)):
+        assert client.post(f'/api/users/{username}/favorite_players', json=favorite).status_code == 200
+    assert player_id(db, player) != player_id(db, namesake)
+    assert counters(db, player)[0] == counters(db, namesake)[0] == 1
+    # By name, only the user's own favorite is removed
+    assert client.delete(f'/api/users/{users[1]}/favorite_players', json={'name': 'Alpha'}).status_code == 200
+    assert counters(db, player)[0] == 1 and counters(db, namesake)[0] == 0
+
+
+def test_orphan_sweep(backend, client, db, users, unique):
+    players = {name: {'name': name, 'player': unique(f'http://data.example.org/{name}'), 'team': 'Reds'}
+               for name in ('old', 'recent', 'favorited', 'in_lineup')}
+    for player in players.values():
+        client.post(f'/api/users/{users[0]}/favorite_players', json=player)
+    client.post(f'/api/startingeleven/{users[1]}', json={'position': 'forward1',
+                                                         'player_id': player_id(db, players['in_lineup'])})
+    for name in ('old', 'recent', 'in_lineup'):
+        client.delete(f'/api/users/{users[0]}/favorite_players', json={'player': players[name]['player']})
+    db.execute('UPDATE Players SET orphaned_at = orphaned_at - 3600 WHERE source_uri IN (?, ?)',
+               (players['old']['player'], players['in_lineup']['player']))
+    db.commit()
+
+    backend.sweep_orphan_players(grace_period=600)
+    remaining = {name for name, player in players.items()
+                 if db.execute('SELECT 1 FROM Players WHERE source_uri = ?', (player['player'],)).fetchone()}
+    assert remaining == {'recent', 'favorited', 'in_lineup'}
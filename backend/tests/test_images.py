@@ -0,0 +1,167 @@
+import hashlib
+import io
+import socket
+
+import pytest
+
+import images
+from images import MAX_REDIRECTS, ImageError, ImageProxy, allowed
+
+HOSTS = {'img.example.org', 'cdn.example.org'}
+PUBLIC = '93.184.216.34'
+
+
+class FakeResponse:
+    def __init__(self, location=None, body=b''):
+        self.is_redirect = location is not None
+        self.headers = {'Location': location} if location else {}
+        self.body = body
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.body), chunk_size):
+            yield self.body[start:start + chunk_size]
+
+
+@pytest.fixture
+def addresses(monkeypatch):
+    """
+    Host name -> the addresses it resolves to.
+    """
+    resolved = {'img.example.org': [PUBLIC], 'cdn.example.org': [PUBLIC]}
+
+    def getaddrinfo(host, port, *args, **kwargs):
+        if host not in resolved:
+            raise socket.gaierror(socket.EAI_NONAME, 'Name or service not known')
+        return [(socket.AF_INET6 if ':' in address else socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP, '',
+                 (address, port)) for address in resolved[host]]
+
+    monkeypatch.setattr(images.socket, 'getaddrinfo', getaddrinfo)
+    return resolved
+
+
+@pytest.fixture
+def proxy(tmp_path):
+    return ImageProxy(connect=None, directory=str(tmp_path), allowed_hosts=HOSTS, max_bytes=1000)
+
+
+@pytest.mark.parametrize('url, expected', [
+    ('https://img.example.org/a.png', True),
+    ('http://IMG.Example.org:8080/a.png', True),
+    ('ftp://img.example.org/a.png', False),
+    ('file:///etc/passwd', False),
+    ('https://img.example.org.evil.test/a.png', False),
+    ('https://img.example.org@evil.test/a.png', False),
+    ('https://evil.test/img.example.org/a.png', False),
+    ('//img.example.org/a.png', False),
+    ('', False),
+    (None, False),
+])
+def test_allowed(url, expected):
+    assert allowed(url, HOSTS) is expected
+
+
+def test_no_hosts_allows_none():
+    assert not allowed('https://img.example.org/a.png', set())
+
+
+@pytest.mark.parametrize('address', ['127.0.0.1', '10.1.2.3', '192.168.0.1', '169.254.169.254', '100.64.0.1',
+                                     '0.0.0.0', '224.0.0.1', '::1', 'fe80::1%eth0', 'fc00::1', '::ffff:127.0.0.1'])
+def test_non_public_addresses_are_refused(proxy, addresses, address):
+    addresses['img.example.org'] = [PUBLIC, address]
+    with pytest.raises(ImageError, match='non-public') as error:
+        proxy._check_address('https://img.example.org/a.png')
+    assert error.value.status == 502
+
+
+def test_public_and_private_hosts(proxy, addresses, tmp_path):
+    proxy._check_address('https://img.example.org/a.png')
+    addresses['img.example.org'] = ['2606:2800:220:1:248:1893:25c8:1946']
+    proxy._check_address('https://img.example.org/a.png')
+    with pytest.raises(ImageError, match='not allowed'):
+        proxy._check_address('https://evil.test/a.png')
+    unresolved = ImageProxy(None, str(tmp_path), allowed_hosts={'missing.example.org'})
+    with pytest.raises(ImageError, match='does not resolve'):
+        unresolved._check_address('https://missing.example.org/a.png')
+
+    # Explicitly allowed, e.g. an image host on the internal network
+    addresses['img.example.org'] = ['10.0.0.5']
+    ImageProxy(None, str(tmp_path), allowed_hosts=HOSTS, allow_private=True)._check_address('https://img.example.org/a.png')
+
+
+def test_download_follows_checked_redirects(proxy, addresses, monkeypatch):
+    body = b'x' * 300
+    hops = {'https://img.example.org/a.png': FakeResponse('/b.png'),
+            'https://img.example.org/b.png': FakeResponse('https://cdn.example.org/c.png'),
+            'https://cdn.example.org/c.png': FakeResponse(body=body)}
+    requested = []
+
+    def get(url, **kwargs):
+        assert kwargs['allow_redirects'] is False
+        requested.append(url)
+        return hops[url]
+
+    monkeypatch.setattr(images.requests, 'get', get)
+    file = io.BytesIO()
+    assert proxy._download('https://img.example.org/a.png', file) == hashlib.sha256(body).hexdigest()
+    assert file.getvalue() == body and requested == list(hops)
+    assert all(response.closed for response in hops.values())
+
+
+@pytest.mark.parametrize('location, message', [
+    ('http://169.254.169.254/latest/meta-data/', 'not allowed'),
+    ('https://cdn.example.org/internal.png', 'non-public'),
+])
+def test_redirect_to_internal_host_is_not_fetched(proxy, addresses, monkeypatch, location, message):
+    addresses['cdn.example.org'] = ['127.0.0.1']
+    requested = []
+
+    def get(url, **kwargs):
+        requested.append(url)
+        return FakeResponse(location)
+
+    monkeypatch.setattr(images.requests, 'get', get)
+    with pytest.raises(ImageError, match=message):
+        proxy._download('https://img.example.org/a.png', io.BytesIO())
+    assert requested == ['https://img.example.org/a.png']
+
+
+def test_too_many_redirects(proxy, addresses, monkeypatch):
+    requested = []
+
+    def get(url, **kwargs):
+        requested.append(url)
+        return FakeResponse(f'/{len(requested)}.png')
+
+    monkeypatch.setattr(images.requests, 'get', get)
+    with pytest.raises(ImageError, match='redirects'):
+        proxy._download('https://img.example.org/a.png', io.BytesIO())
+    assert len(requested) == MAX_REDIRECTS + 1
+
+
+def test_oversized_image(proxy, addresses, monkeypatch):
+    monkeypatch.setattr(images.requests, 'get', lambda url, **kwargs: FakeResponse(body=b'x' * 1001))
+    with pytest.raises(ImageError, match='larger'):
+        proxy._download('https://img.example.org/a.png', io.BytesIO())
+
+
+@pytest.mark.parametrize('key', ['0' * 32, 'not-a-key', 'A' * 32])
+def test_unknown_key(client, key):
+    response = client.get(f'/img/{key}')
+    assert response.status_code == 404 and response.get_json() == {'message': 'Image not found'}
+
+
+def test_image_size(client):
+    assert client.get(f'/img/{"0" * 32}?size=large').status_code == 400
@@ -0,0 +1,183 @@
+import io
+import json
+import sqlite3
+
+import pytest
+
+import importer
+from leaderboard import DIMENSIONS
+
+
+PLAYERS = [
+    {'name': 'Alpha', 'position': 'Striker', 'team': 'Reds', 'nationality': 'Spain', 'rating': '81'},
+    {'name': 'Beta', 'position': 'Goalkeeper', 'team': 'Blues', 'nationality': 'Italy', 'rating': '77'},
+    # Shares a name with the first: a distinct player
+    {'name': 'Alpha', 'position': 'Defender', 'team': 'Greens', 'rating': '70'},
+]
+
+
+def ndjson(rows):
+    return io.BufferedReader(io.BytesIO(b''.join(json.dumps(row).encode() + b'\n' for row in rows)))
+
+
+def run_import(backend, rows, batch_size=importer.BATCH_SIZE, skip=0, kind='favorites'):
+    conn = sqlite3.connect(backend.DATABASE, timeout=30, isolation_level=None)
+    try:
+        return list(importer.run(conn, ndjson(rows), 'ndjson', batch_size, skip, kind))
+    finally:
+        conn.close()
+
+
+def counters(backend, source_uris):
+    """
+    favorite_count of the players and FavoriteCounts of their groups.
+    """
+    conn = sqlite3.connect(backend.DATABASE)
+    try:
+        counts = dict(conn.execute(f'''
+            SELECT source_uri, favorite_count FROM Players
+            WHERE source_uri IN ({', '.join('?' * len(source_uris))})
+        ''', source_uris).fetchall())
+        groups = {}
+        for dimension in DIMENSIONS:
+            values = {player.get(dimension) or 'Unknown' for player in PLAYERS}
+            groups.update(((dimension, value), favorites) for value, favorites in conn.execute(f'''
+                SELECT value, favorites FROM FavoriteCounts
+                WHERE dimension = ? AND value IN ({', '.join('?' * len(values))})
+            ''', (dimension, *values)))
+        return counts, groups
+    finally:
+        conn.close()
+
+
+def insert_triggers(backend):
+    conn = sqlite3.connect(backend.DATABASE)
+    try:
+        return conn.execute(f'''
+            SELECT name, sql FROM sqlite_master
+            WHERE type = 'trigger' AND name IN ({', '.join('?' * len(importer.INSERT_TRIGGERS))})
+            ORDER BY name
+        ''', importer.INSERT_TRIGGERS).fetchall()
+    finally:
+        conn.close()
+
+
+def favorite_uris(client, username):
+    return sorted(player['source_uri'] for player in client.get(f'/api/users/{username}/players').get_json())
+
+
+@pytest.fixture
+def players(unique):
+    return [{**player, 'source_uri': unique(f'http://data.example.org/player/{index}')}
+            for index, player in enumerate(PLAYERS)]
+
+
+@pytest.fixture
+def users(client, unique):
+    names = [unique(name) for name in ('api1', 'api2', 'import1', 'import2')]
+    for name in names:
+        assert client.post('/api/register', json={'username': name, 'password': 'pw'}).status_code == 200
+    return names
+
+
+def test_import_matches_the_api(backend, client, players, users):
+    api_users, import_users = users[:2], users[2:]
+    favorites = [(0, [0, 1, 2]), (1, [0, 2])]
+    uris = [player['source_uri'] for player in players]
+    triggers = insert_triggers(backend)
+    etags = [client.get(f'/api/users/{username}/profile').headers['ETag'] for username in import_users]
+
+    # The importer first, so it creates the players; the API then finds them by source URI
+    before, before_groups = counters(backend, uris)
+    reports = run_import(backend, [{'username': import_users[user], **players[index]}
+                                   for user, indexes in favorites for index in indexes])
+    imported, imported_groups = counters(backend, uris)
+    assert reports[-1][1]['favorites_added'] == 5 and reports[-1][1]['players_added'] == 3
+    assert insert_triggers(backend) == triggers
+
+    for user, indexes in favorites:
+        for index in indexes:
+            response = client.post(f'/api/users/{api_users[user]}/favorite_players',
+                                   json={**players[index], 'player': players[index]['source_uri']})
+            assert response.status_code == 200
+    posted, posted_groups = counters(backend, uris)
+
+    assert {uri: imported[uri] - before.get(uri, 0) for uri in uris} == \
+        {uri: posted[uri] - imported[uri] for uri in uris} == {uris[0]: 2, uris[1]: 1, uris[2]: 2}
+    assert {key: imported_groups[key] - before_groups.get(key, 0) for key in imported_groups} == \
+        {key: posted_groups[key] - imported_groups[key] for key in imported_groups}
+    for api_user, import_user, etag in zip(api_users, import_users, etags):
+        assert favorite_uris(client, import_user) == favorite_uris(client, api_user)
+        # The import moved the user to a new version: the old ETag misses, the profile is rebuilt
+        response = client.get(f'/api/users/{import_user}/profile', headers={'If-None-Match': etag})
+        assert response.status_code == 200 and response.headers['ETag'] != etag
+        assert sorted(player['source_uri'] for player in response.get_json()['favorites']) == \
+            favorite_uris(client, import_user)
+
+
+def test_duplicates_and_unknown_users(backend, client, players, users, unique):
+    username = users[2]
+    client.post(f'/api/users/{username}/favorite_players', json={**players[0], 'player': players[0]['source_uri']})
+    uris = [player['source_uri'] for player in players]
+    before, _ = counters(backend, uris)
+    ghost = {**players[1], 'source_uri': unique('http://data.example.org/ghost')}
+    reports = run_import(backend, [
+        {'username': username, **players[0]},  # already a favorite
+        {'username': username, **players[1]},
+        {'username': username, **players[1]},  # duplicate row
+        {'username': unique('nobody'), **ghost},
+        {'username': username},
+    ])
+    report = reports[-1][1]
+    assert (report['favorites_added'], report['already_favorites'], report['players_added']) == (1, 2, 1)
+    assert [error['error'] for error in report['errors']] == [f"unknown user {unique('nobody')!r}", 'missing player name']
+    after, _ = counters(backend, uris + [ghost['source_uri']])
+    assert after == {uris[0]: before[uris[0]], uris[1]: 1}
+    assert favorite_uris(client, username) == sorted(uris[:2])
+
+
+def test_resume_from_checkpoint(backend, client, players, users, tmp_path):
+    rows = [{'username': username, **player} for username in users[2:] for player in players]
+    checkpoint = str(tmp_path / 'checkpoint.json')
+    source = str(tmp_path / 'favorites.ndjson')
+
+    # Interrupted after the first batch, with its checkpoint written
+    progress = importer.read_checkpoint(checkpoint, source)
+    conn = sqlite3.connect(backend.DATABASE, isolation_level=None)
+    done, report = next(importer.run(conn, ndjson(rows), 'ndjson', batch_size=4))
+    conn.close()
+    importer.write_checkpoint(checkpoint, {**progress, 'rows': done, 'batches': 1,
+                                           'favorites_added': report['favorites_added']})
+    progress = importer.read_checkpoint(checkpoint, source)
+    assert progress['rows'] == 4
+    with pytest.raises(ValueError):
+        importer.read_checkpoint(checkpoint, source, kind='lineups')
+
+    reports = run_import(backend, rows, batch_size=4, skip=progress['rows'])
+    assert sum(report['favorites_added'] for _, report in reports) == 2
+    # A batch committed but not checkpointed is loaded again and skipped
+    reports = run_import(backend, rows, batch_size=4)
+    assert sum(report['favorites_added'] for _, report in reports) == 0
+    counts, _ = counters(backend, [player['source_uri'] for player in players])
+    assert set(counts.values()) == {2}
+    for username in users[2:]:
+        assert len(favorite_uris(client, username)) == 3
+
+
+def test_lineups_match_the_api(backend, client, players, users):
+    api_user, import_user = users[0], users[2]
+    run_import(backend, [{'username': import_user, **players[0], 'lineup_position': 'forward1'},
+                         {'username': import_user, **players[1], 'lineup_position': 'goalkeeper'}], kind='lineups')
+    conn = sqlite3.connect(backend.DATABASE)
+    player_ids = dict(conn.execute('SELECT source_uri, player_id FROM Players').fetchall())
+    for player, position in ((players[0], 'forward1'), (players[1], 'goalkeeper')):
+        response = client.post(f'/api/startingeleven/{api_user}',
+                               json={'position': position, 'player_id': player_ids[player['source_uri']]})
+        assert response.status_code == 200
+    aggregates = [conn.execute('''
+        SELECT LineupAggregates.* FROM LineupAggregates JOIN Users USING (user_id) WHERE username = ?
+    ''', (username,)).fetchone()[1:] for username in (api_user, import_user)]
+    conn.close()
+    assert aggregates[0] == aggregates[1]
+    assert client.get(f'/api/startingeleven/{api_user}/summary').get_json() == \
+        client.get(f'/api/startingeleven/{import_user}/summary').get_json()
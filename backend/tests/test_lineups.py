@@ -0,0 +1,73 @@
+import sqlite3
+
+import pytest
+
+PLAYERS = {
+    'Alpha': {'rating': '80', 'market_value': '€10M', 'height': '1.80 m'},
+    'Beta': {'rating': '70', 'market_value': '€5M', 'height': '1.90 m'},
+    'Gamma': {'rating': 'Not Available', 'market_value': 'Not Available', 'height': 'Not Available'},
+}
+
+
+@pytest.fixture
+def player_ids(client, user, unique):
+    for name, attributes in PLAYERS.items():
+        response = client.post(f'/api/users/{user}/favorite_players',
+                               json={'name': name, 'player': unique(f'http://data.example.org/{name}'), **attributes})
+        assert response.status_code == 200
+    return {player['name']: player['player_id'] for player in client.get(f'/api/users/{user}/players').get_json()}
+
+
+def set_position(client, username, position, player_id):
+    assert client.post(f'/api/startingeleven/{username}', json={'position': position, 'player_id': player_id}).status_code == 200
+
+
+def summary(client, username):
+    return client.get(f'/api/startingeleven/{username}/summary').get_json()
+
+
+def assert_aggregates_match_recount(backend, username):
+    conn = sqlite3.connect(backend.DATABASE, isolation_level=None)
+    try:
+        query = 'SELECT LineupAggregates.* FROM LineupAggregates JOIN Users USING (user_id) WHERE username = ?'
+        maintained = conn.execute(query, (username,)).fetchone()
+        conn.execute('BEGIN')
+        backend.recompute_lineup_aggregates(conn.cursor())
+        recounted = conn.execute(query, (username,)).fetchone()
+        conn.execute('ROLLBACK')
+    finally:
+        conn.close()
+    # An emptied lineup keeps a row of zeros
+    assert maintained == recounted or (recounted is None and not any(maintained[1:]))
+
+
+def test_summary_follows_the_lineup(backend, client, user, player_ids):
+    set_position(client, user, 'forward1', player_ids['Alpha'])
+    set_position(client, user, 'forward2', player_ids['Beta'])
+    result = summary(client, user)
+    assert (result['players'], result['average_rating'], result['total_market_value_eur'], result['average_height_cm']) \
+        == (2, 75.0, 15_000_000, 185.0)
+    assert_aggregates_match_recount(backend, user)
+
+    # Replacing a position takes the old player's values out
+    set_position(client, user, 'forward2', player_ids['Gamma'])
+    result = summary(client, user)
+    assert (result['players'], result['average_rating'], result['known']['rating']) == (2, 80.0, 1)
+    assert_aggregates_match_recount(backend, user)
+
+    assert client.delete(f'/api/startingeleven/{user}/forward1').status_code == 200
+    result = summary(client, user)
+    assert (result['players'], result['average_rating'], result['total_market_value_eur']) == (1, None, None)
+    assert_aggregates_match_recount(backend, user)
+
+    assert client.delete(f'/api/startingeleven/{user}/forward2').status_code == 200
+    assert summary(client, user)['players'] == 0
+    assert_aggregates_match_recount(backend, user)
+
+
+def test_summary_etag(client, user, player_ids):
+    response = client.get(f'/api/startingeleven/{user}/summary')
+    etag, _ = response.get_etag()
+    assert client.get(f'/api/startingeleven/{user}/summary', headers={'If-None-Match': f'"{etag}"'}).status_code == 304
+    set_position(client, user, 'goalkeeper', player_ids['Beta'])
+    assert client.get(f'/api/startingeleven/{user}/summary', headers={'If-None-Match': f'"{etag}"'}).status_code == 200
@@ -0,0 +1,88 @@
+import json
+import sqlite3
+
+import pytest
+
+
+@pytest.fixture
+def db(backend):
+    conn = sqlite3.connect(backend.DATABASE)
+    yield conn
+    conn.close()
+
+
+def add_favorite(client, username, unique, name):
+    response = client.post(f'/api/users/{username}/favorite_players',
+                           json={'name': name, 'player': unique(f'http://data.example.org/{name}'), 'team': 'Reds'})
+    assert response.status_code == 200
+
+
+def player_ids(client, username):
+    return {player['name']: player['player_id'] for player in client.get(f'/api/users/{username}/players').get_json()}
+
+
+def assert_matches_joins(client, username):
+    profile = client.get(f'/api/users/{username}/profile').get_json()
+    assert sorted(profile['favorites'], key=lambda player: player['player_id']) == \
+        sorted(client.get(f'/api/users/{username}/players').get_json(), key=lambda player: player['player_id'])
+    assert profile['starting_eleven'] == client.get(f'/api/startingeleven/{username}').get_json()
+
+
+def stored_document(db, username):
+    return db.execute('''
+        SELECT UserProfile.version, UserProfile.favorites FROM UserProfile JOIN Users USING (user_id)
+        WHERE username = ?
+    ''', (username,)).fetchone()
+
+
+def test_profile_follows_every_write(client, user, unique):
+    for name in ('Alpha', 'Beta', 'Gamma'):
+        add_favorite(client, user, unique, name)
+        assert_matches_joins(client, user)
+    ids = player_ids(client, user)
+    assert client.post(f'/api/startingeleven/{user}', json={'position': 'forward1', 'player_id': ids['Beta']}).status_code == 200
+    assert_matches_joins(client, user)
+    assert client.delete(f'/api/users/{user}/favorite_players', json={'player_id': ids['Alpha']}).status_code == 200
+    assert_matches_joins(client, user)
+    assert client.delete(f'/api/startingeleven/{user}/forward1').status_code == 200
+    assert_matches_joins(client, user)
+
+
+def test_writes_patch_the_stored_document(client, db, user, unique):
+    add_favorite(client, user, unique, 'Alpha')
+    version, favorites = stored_document(db, user)
+    # A marker in the stored bytes survives only if the writes patch them instead of rebuilding
+    marker = {'player_id': 0, 'name': 'marker'}
+    db.execute('UPDATE UserProfile SET favorites = ? WHERE version = ? AND favorites = ?',
+               (json.dumps([marker, *json.loads(favorites)]).encode(), version, favorites))
+    db.commit()
+
+    add_favorite(client, user, unique, 'Beta')
+    ids = player_ids(client, user)
+    client.post(f'/api/startingeleven/{user}', json={'position': 'goalkeeper', 'player_id': ids['Beta']})
+    client.delete(f'/api/users/{user}/favorite_players', json={'player_id': ids['Alpha']})
+    favorites = client.get(f'/api/users/{user}/profile').get_json()['favorites']
+    assert [player['name'] for player in favorites] == ['marker', 'Beta']
+
+
+def test_document_without_delta_is_rebuilt(client, db, user, unique):
+    add_favorite(client, user, unique, 'Alpha')
+    client.get(f'/api/users/{user}/profile')
+    # A document one version behind, written outside the request handlers, is not patched
+    db.execute("UPDATE UserProfile SET favorites = CAST('[]' AS BLOB) WHERE user_id = (SELECT user_id FROM Users WHERE username = ?)", (user,))
+    db.execute("UPDATE UserVersions SET version = version + 1 WHERE user_id = (SELECT user_id FROM Users WHERE username = ?)", (user,))
+    db.commit()
+    assert [player['name'] for player in client.get(f'/api/users/{user}/profile').get_json()['favorites']] == ['Alpha']
+
+
+def test_format_change_drops_the_documents(backend, client, db, user, unique):
+    add_favorite(client, user, unique, 'Alpha')
+    etag, _ = client.get(f'/api/users/{user}/profile').get_etag()
+    db.execute("UPDATE Meta SET value = ? WHERE key = 'user_document_format'", (str(backend.USER_DOCUMENT_FORMAT - 1),))
+    db.commit()
+
+    backend.init_db()
+    assert stored_document(db, user) is None
+    response = client.get(f'/api/users/{user}/profile', headers={'If-None-Match': f'"{etag}"'})
+    assert response.status_code == 200 and response.get_etag()[0] != etag
+    assert_matches_joins(client, user)
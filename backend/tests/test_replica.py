@@ -0,0 +1,119 @@
+import json
+import os
+import sqlite3
+import time
+
+import pytest
+
+import replica
+
+
+@pytest.fixture
+def database(tmp_path):
+    path = str(tmp_path / 'players.db')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE Players (player_id INTEGER PRIMARY KEY, name TEXT)')
+    conn.execute("INSERT INTO Players (name) VALUES ('Alpha')")
+    conn.commit()
+    conn.close()
+    return path
+
+
+def primary(database):
+    def connect():
+        conn = sqlite3.connect(database)
+        conn.row_factory = sqlite3.Row
+        return conn
+    return connect
+
+
+def read_names(conn):
+    try:
+        return [row['name'] for row in conn.execute('SELECT name FROM Players ORDER BY player_id')]
+    finally:
+        conn.close()
+
+
+def add_player(database, name):
+    conn = sqlite3.connect(database)
+    conn.execute('INSERT INTO Players (name) VALUES (?)', (name,))
+    conn.commit()
+    conn.close()
+
+
+def test_reads_go_to_a_fresh_replica(database, tmp_path):
+    path = str(tmp_path / 'replica.db')
+    reads = replica.Replica(path, max_staleness=60, connect_primary=primary(database))
+    # No replica yet
+    assert reads.as_of() is None and read_names(reads.connect()) == ['Alpha']
+
+    assert replica.refresh(database, path, sleep=0)['path'] == path
+    add_player(database, 'Beta')
+    assert reads.as_of() == pytest.approx(time.time(), abs=5)
+    assert read_names(reads.connect()) == ['Alpha']
+    conn = reads.connect()
+    with pytest.raises(sqlite3.OperationalError, match='readonly'):
+        conn.execute("INSERT INTO Players (name) VALUES ('Gamma')")
+    conn.close()
+
+    # Too old: back to the primary
+    stale = time.time() - 61
+    os.utime(path, (stale, stale))
+    assert reads.as_of() is None and read_names(reads.connect()) == ['Alpha', 'Beta']
+    assert reads.data_time() == pytest.approx(time.time(), abs=5)
+
+    replica.refresh(database, path, sleep=0)
+    assert read_names(reads.connect()) == ['Alpha', 'Beta']
+
+
+def test_disabled(database, tmp_path):
+    path = str(tmp_path / 'replica.db')
+    replica.refresh(database, path, sleep=0)
+    add_player(database, 'Beta')
+    reads = replica.Replica(path, max_staleness=0, connect_primary=primary(database))
+    assert reads.as_of() is None and read_names(reads.connect()) == ['Alpha', 'Beta']
+
+
+def test_data_time_is_the_refresh_time(database, tmp_path):
+    path = str(tmp_path / 'replica.db')
+    replica.refresh(database, path, sleep=0)
+    refreshed = time.time() - 30
+    os.utime(path, (refreshed, refreshed))
+    reads = replica.Replica(path, max_staleness=60, connect_primary=primary(database))
+    assert reads.data_time() == pytest.approx(refreshed) and replica.age(path) == pytest.approx(30, abs=5)
+
+
+def test_recent_replica_skips_the_refresh(database, tmp_path):
+    path = str(tmp_path / 'replica.db')
+    assert replica.age(path) is None
+    replica.refresh(database, path, sleep=0)
+    add_player(database, 'Beta')
+    assert replica.refresh(database, path, sleep=0, min_age=3600) is None
+    assert read_names(primary(path)()) == ['Alpha']
+    assert replica.refresh(database, path, sleep=0, min_age=0) is not None
+    assert read_names(primary(path)()) == ['Alpha', 'Beta']
+
+
+def test_export_reports_staleness(backend, client, user, unique, monkeypatch, tmp_path):
+    path = str(tmp_path / 'replica.db')
+    monkeypatch.setattr(backend.read_replica, 'path', path)
+    monkeypatch.setattr(backend.read_replica, 'max_staleness', 60)
+    headers = {'X-Admin-Token': 'test-token'}
+
+    def exported_players():
+        response = client.get('/api/admin/export/favorites', headers=headers)
+        assert response.status_code == 200
+        rows = [json.loads(line) for line in response.data.decode().splitlines()]
+        return {row['player_id'] for row in rows if row['username'] == user}, float(response.headers['X-Data-Staleness'])
+
+    client.post(f'/api/users/{user}/favorite_players', json={'name': 'Alpha', 'player': unique('http://data.example.org/a')})
+    replica.refresh(backend.DATABASE, path, sleep=0)
+    refreshed = time.time() - 20
+    os.utime(path, (refreshed, refreshed))
+    client.post(f'/api/users/{user}/favorite_players', json={'name': 'Beta', 'player': unique('http://data.example.org/b')})
+
+    players, staleness = exported_players()
+    assert len(players) == 1 and staleness == pytest.approx(20, abs=5)
+    monkeypatch.setattr(backend.read_replica, 'max_staleness', 10)
+    players, staleness = exported_players()
+    assert len(players) == 2 and staleness < 5
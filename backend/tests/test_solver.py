@@ -0,0 +1,38 @@
+import pytest
+
+from solver import DEFENSE, FORWARD, GOALKEEPER, MIDFIELD, UNKNOWN, position_line
+
+
+@pytest.mark.parametrize('position, line', [
+    ('Goalkeeper', GOALKEEPER),
+    ('CentreBack', DEFENSE),
+    ('DefensiveMidfield', MIDFIELD),
+    ('AttackingMidfield', MIDFIELD),
+    ('LeftWinger', FORWARD),
+    ('Centre-Forward', FORWARD),
+    ('defense2', DEFENSE),
+])
+def test_full_names(position, line):
+    assert position_line(position) == line
+
+
+@pytest.mark.parametrize('position, line', [
+    ('GK', GOALKEEPER),
+    ('CB', DEFENSE), ('LB', DEFENSE), ('RB', DEFENSE), ('LWB', DEFENSE), ('RWB', DEFENSE),
+    ('CDM', MIDFIELD), ('CM', MIDFIELD), ('CAM', MIDFIELD), ('LM', MIDFIELD), ('RM', MIDFIELD),
+    ('ST', FORWARD), ('CF', FORWARD), ('LW', FORWARD), ('RW', FORWARD),
+    ('gk', GOALKEEPER), (' cdm ', MIDFIELD),
+])
+def test_abbreviations(position, line):
+    assert position_line(position) == line
+
+
+def test_first_of_a_list():
+    assert position_line('RW, ST') == FORWARD
+    assert position_line('CB/RB') == DEFENSE
+    assert position_line('CAM / CM') == MIDFIELD
+
+
+@pytest.mark.parametrize('position', [None, '', 'Coach', 'XYZ'])
+def test_unknown(position):
+    assert position_line(position) == UNKNOWN
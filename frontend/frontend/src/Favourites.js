@@ -24,7 +24,7 @@ const Favourites = ({ user, setSelectedPlayer, startingEleven }) => {
   // Function to handle navigation to more details page
   const handleMoreDetails = (player) => {
     setSelectedPlayer(player);
-    navigate(`/player/${player.name}`, { state: { player, from: 'favourites' } });
+    navigate(`/player/${player.player_id}`, { state: { player, from: 'favourites' } });
   };
 
   // Function to add player to starting eleven
@@ -56,17 +56,17 @@ const Favourites = ({ user, setSelectedPlayer, startingEleven }) => {
   };
 
   // Function to remove player from favorites
-  const handleRemoveFromFavorites = async (name) => {
+  const handleRemoveFromFavorites = async (player_id) => {
     if (!user) {
       alert("Please log in to remove players from favorites");
       return;
     }
-    setFavorites(prevFavorites => prevFavorites.filter(player => player.name !== name));
+    setFavorites(prevFavorites => prevFavorites.filter(player => player.player_id !== player_id));
     try {
       const response = await fetch(`http://127.0.0.1:5000/api/users/${user.username}/favorite_players`, {
         method: 'DELETE',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ name })
+        body: JSON.stringify({ player_id })
       });
       if (response.ok) {
         console.log('Player removed from favorites');
@@ -94,7 +94,7 @@ const Favourites = ({ user, setSelectedPlayer, startingEleven }) => {
         {hasFavorites && favorites.map((player) => (
           <div key={player.name} className="card">
             <IconButton>
-              <DeleteIcon className="remove-from-favorites" onClick={() => handleRemoveFromFavorites(player.name)} />
+              <DeleteIcon className="remove-from-favorites" onClick={() => handleRemoveFromFavorites(player.player_id)} />
             </IconButton>
             <div className="card-content">
               <h3>{player.name}</h3>
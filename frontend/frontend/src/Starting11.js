@@ -34,6 +34,23 @@ const Starting11 = ({ user }) => {
     }
   }, [user]);
 
+  /**
+   * Returns the image URL of a player in the lineup, the cached thumbnail when the backend proxies it.
+   * @param {Object} player - The player of a lineup slot.
+   */
+  const pictureUrl = (player) => player.thumbnail ? `http://127.0.0.1:5000${player.thumbnail}` : player.picture;
+
+  /**
+   * Falls back to the original picture when the thumbnail cannot be loaded, once.
+   * @param {Object} player - The player of a lineup slot.
+   */
+  const handlePictureError = (player) => (event) => {
+    const image = event.currentTarget;
+    if (image.dataset.fallback || !player.picture) return;
+    image.dataset.fallback = 'true';
+    image.src = player.picture;
+  };
+
   /**
    * Navigates to the favorites page to add a player to favorites.
    * @param {string} position - The position of the player.
@@ -89,7 +106,7 @@ const Starting11 = ({ user }) => {
               <div key={position} className={position === 'forward2' ? 'middle-attacker' : 'card2'}>
                 {startingEleven[position] ? (
                   <div className="display-card">
-                    <img className="player-image" src={startingEleven[position].picture} alt={startingEleven[position].name} width="100" />
+                    <img className="player-image" src={pictureUrl(startingEleven[position])} onError={handlePictureError(startingEleven[position])} alt={startingEleven[position].name} width="100" />
                     <p className="player-name1">{startingEleven[position].name}</p>
                     <p><strong>{positionAbbreviations[position]}</strong></p>
                     <button className = "delete-button" onClick={() => handleRemovePlayer(position)}><DeleteIcon /></button>
@@ -108,7 +125,7 @@ const Starting11 = ({ user }) => {
               <div key={position} className={position === 'midfield2' ? 'middle-midfielder' : 'card2'}>
                 {startingEleven[position] ? (
                   <div className="display-card">
-                    <img className="player-image" src={startingEleven[position].picture} alt={startingEleven[position].name} width="100" />
+                    <img className="player-image" src={pictureUrl(startingEleven[position])} onError={handlePictureError(startingEleven[position])} alt={startingEleven[position].name} width="100" />
                     <p className="player-name1">{startingEleven[position].name}</p>
                     <p><strong>{positionAbbreviations[position]}</strong></p>
                     <button className = "delete-button" onClick={() => handleRemovePlayer(position)}><DeleteIcon /></button>
@@ -127,7 +144,7 @@ const Starting11 = ({ user }) => {
               <div key={position} className="card2">
                 {startingEleven[position] ? (
                   <div className="display-card">
-                    <img className="player-image" src={startingEleven[position].picture} alt={startingEleven[position].name} width="100" />
+                    <img className="player-image" src={pictureUrl(startingEleven[position])} onError={handlePictureError(startingEleven[position])} alt={startingEleven[position].name} width="100" />
                     <p className="player-name1">{startingEleven[position].name}</p>
                     <p><strong>{positionAbbreviations[position]}</strong></p>
                     <button className = "delete-button" onClick={() => handleRemovePlayer(position)}><DeleteIcon /></button>
@@ -146,7 +163,7 @@ const Starting11 = ({ user }) => {
               {startingEleven['goalkeeper'] ? (
                 <div className="display-card">
                  
-                  <img className="player-image" src={startingEleven['goalkeeper'].picture} alt={startingEleven['goalkeeper'].name} width="100" />
+                  <img className="player-image" src={pictureUrl(startingEleven['goalkeeper'])} onError={handlePictureError(startingEleven['goalkeeper'])} alt={startingEleven['goalkeeper'].name} width="100" />
                   <p className="player-name1">{startingEleven['goalkeeper'].name}</p>
                   <p><strong>{positionAbbreviations["goalkeeper"]}</strong></p>
                   <button className = "delete-button" onClick={() => handleRemovePlayer('goalkeeper')}><DeleteIcon /></button>
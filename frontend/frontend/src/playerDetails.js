@@ -1,11 +1,45 @@
-import React from 'react';
+import React, { useEffect, useState } from 'react';
 import './playerDetails.css';
-import { useLocation } from 'react-router-dom';
+import { useLocation, useParams } from 'react-router-dom';
 import { differenceInYears } from 'date-fns';
 
 const PlayerDetails = () => {
   const location = useLocation();
-  const player = location.state?.player || null;  // Get the player from state
+  const { playerId } = useParams();
+  const [loadedPlayer, setLoadedPlayer] = useState(null);
+  const player = location.state?.player || loadedPlayer;  // Get the player from state
+  const [percentiles, setPercentiles] = useState(null);
+
+  // Without router state (e.g. after a refresh), load players of the local catalogue by ID
+  useEffect(() => {
+    if (location.state?.player || !/^\d+$/.test(playerId)) return;
+    fetch(`http://127.0.0.1:5000/api/players/${playerId}`)
+      .then(response => response.ok ? response.json() : null)
+      .then(data => setLoadedPlayer(data))
+      .catch(error => console.error('Error fetching player:', error));
+  }, [location.state, playerId]);
+
+  // Percentiles of the player's attributes across the catalogue and within the position
+  useEffect(() => {
+    if (!player) return;
+    const url = player.player_id
+      ? `http://127.0.0.1:5000/api/players/${player.player_id}/percentiles`
+      : `http://127.0.0.1:5000/api/percentiles?${new URLSearchParams(
+          Object.entries({ position: player.position, rating: player.rating, potential: player.potential,
+                           market_value: player.market_value, wage: player.wage, height: player.height })
+            .filter(([, value]) => value))}`;
+    fetch(url)
+      .then(response => response.ok ? response.json() : null)
+      .then(data => setPercentiles(data?.percentiles || null))
+      .catch(error => console.error('Error fetching percentiles:', error));
+  }, [player]);
+
+  const percentileText = (attribute) => {
+    const percentile = percentiles?.[attribute];
+    if (!percentile || percentile.overall === null) return null;
+    const position = percentile.position === null ? '' : `, ${Math.round(percentile.position)}th among ${player.position || 'Unknown'}s`;
+    return <span className="player-percentile"> ({Math.round(percentile.overall)}th percentile{position})</span>;
+  };
 
   // Parse market value (handling millions and thousands)
   const parseMarketValue = (value) => {
@@ -47,11 +81,11 @@ const PlayerDetails = () => {
           <p><strong>Age:</strong> {playerAge}</p>
           <p><strong>Nationality:</strong> {player.nationality || 'Information not available'}</p>
           <p><strong>Birth Date:</strong> {player.birthDate || 'Information not available'}</p>
-          <p><strong>Height:</strong> {player.height || 'Information not available'}</p>
-          <p><strong>Market Value:</strong> {player.market_value || 'Information not available'}</p>
-          <p><strong>Current Rating:</strong> {player.rating || 'Information not available'}</p>
-          <p><strong>Potential:</strong> {player.potential || 'Information not available'}</p>
-          <p><strong>Wage:</strong> {player.wage || 'Information not available'}</p>
+          <p><strong>Height:</strong> {player.height || 'Information not available'}{percentileText('height')}</p>
+          <p><strong>Market Value:</strong> {player.market_value || 'Information not available'}{percentileText('market_value')}</p>
+          <p><strong>Current Rating:</strong> {player.rating || 'Information not available'}{percentileText('rating')}</p>
+          <p><strong>Potential:</strong> {player.potential || 'Information not available'}{percentileText('potential')}</p>
+          <p><strong>Wage:</strong> {player.wage || 'Information not available'}{percentileText('wage')}</p>
           <p><strong>Description:</strong> {player.description || 'Information not available'}</p>
         </div>
 
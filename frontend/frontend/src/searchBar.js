@@ -5,6 +5,11 @@ import SearchIcon from '@mui/icons-material/Search';
 import StarIcon from '@mui/icons-material/Star';
 import { useNavigate } from 'react-router-dom';
 
+// Players sharing a name are distinct: compare the source URIs, or the names for favorites without one
+const isSamePlayer = (favorite, player) => (
+  favorite.source_uri && player.player ? favorite.source_uri === player.player : favorite.name === player.name
+);
+
 const SearchBar = ({ user, setSelectedPlayer, favorites, setFavorites }) => {
   const [query, setQuery] = useState('');
   const [results, setResults] = useState([]);
@@ -16,7 +21,7 @@ const SearchBar = ({ user, setSelectedPlayer, favorites, setFavorites }) => {
   useEffect(() => {
     // This effect will trigger a re-render if `favorites` updates
     setResults(prevResults => prevResults.map(player => {
-      const isFavorite = favorites.some(fav => fav.name === player.name);
+      const isFavorite = favorites.some(fav => isSamePlayer(fav, player));
       return { ...player, isFavorite };
     }));
   }, [user, favorites]);
@@ -32,6 +37,7 @@ const SearchBar = ({ user, setSelectedPlayer, favorites, setFavorites }) => {
 
         if (data && Array.isArray(data) && data.length > 0) {
           const footballPlayers = data.map(player => ({
+            player: player.player,
             position: player.position.split('/').pop() || 'Unknown Position',
             team: player.team.split('/').pop().replace(/_/g, ' ') || 'Unknown Team',
             name: player.name.replace(/_/g, ' ') || 'Unknown Player',
@@ -39,6 +45,7 @@ const SearchBar = ({ user, setSelectedPlayer, favorites, setFavorites }) => {
             nationality: player.nationality || 'Not Available',
             height: player.height || 'Not Available',
             img: player.img || 'No Image',
+            thumbnail: player.thumbnail,
             birthDate: player.birth_date || 'Unknown Date',
             wage: player.wage || 'Not Available',
             potential: player.potential || 'Not Available',
@@ -65,11 +72,11 @@ const SearchBar = ({ user, setSelectedPlayer, favorites, setFavorites }) => {
       return;
     }
 
-    const isFavorite = favorites.some(fav => fav.name === player.name);
+    const favorite = favorites.find(fav => isSamePlayer(fav, player));
 
-    if (isFavorite) {
+    if (favorite) {
       // Remove from favorites
-      setFavorites(prevFavorites => prevFavorites.filter(fav => fav.name !== player.name));
+      setFavorites(prevFavorites => prevFavorites.filter(fav => !isSamePlayer(fav, player)));
 
       try {
         const response = await fetch(`http://127.0.0.1:5000/api/users/${user.username}/favorite_players`, {
@@ -77,7 +84,8 @@ const SearchBar = ({ user, setSelectedPlayer, favorites, setFavorites }) => {
           headers: {
             'Content-Type': 'application/json',
           },
-          body: JSON.stringify({ name: player.name }), // Use player_id for deletion
+          // By ID if the favorite was loaded from the server, else by source URI
+          body: JSON.stringify(favorite.player_id ? { player_id: favorite.player_id } : { player: player.player, name: player.name }),
         });
         const data = await response.json();
         if (response.ok) {
@@ -91,6 +99,7 @@ const SearchBar = ({ user, setSelectedPlayer, favorites, setFavorites }) => {
     } else {
       // Add to favorites
       const playerData = {
+        player: player.player,
         position: player.position.split('/').pop() || 'Unknown Position',
             team: player.team.split('/').pop().replace(/_/g, ' ') || 'Unknown Team',
             name: player.name.replace(/_/g, ' ') || 'Unknown Player',
@@ -106,7 +115,7 @@ const SearchBar = ({ user, setSelectedPlayer, favorites, setFavorites }) => {
             foot: player.foot || 'Not Specified'
       };
 
-      setFavorites(prevFavorites => [...prevFavorites, playerData]);
+      setFavorites(prevFavorites => [...prevFavorites, { ...playerData, source_uri: player.player }]);
      
       try {
         const response = await fetch(`http://127.0.0.1:5000/api/users/${user.username}/favorite_players`, {
@@ -170,7 +179,17 @@ const SearchBar = ({ user, setSelectedPlayer, favorites, setFavorites }) => {
             </div>
             <div className="player-image">
               {player.img ? (
-                <img src={player.img} width="100" alt={player.name} />
+                <img
+                  src={player.thumbnail ? `http://127.0.0.1:5000${player.thumbnail}` : player.img}
+                  onError={(event) => {
+                    // Fall back to the original image once when the thumbnail cannot be loaded
+                    if (event.currentTarget.dataset.fallback) return;
+                    event.currentTarget.dataset.fallback = 'true';
+                    event.currentTarget.src = player.img;
+                  }}
+                  width="100"
+                  alt={player.name}
+                />
               ) : (
                 <div>No image available</div>
               )}